@@ -0,0 +1,568 @@
+from __future__ import annotations
+
+import numpy as np
+
+from cubes import (
+    Abbowser,
+    Aemeath,
+    Augusta,
+    Brant,
+    Calcharo,
+    Camellya,
+    Cantarella,
+    Carlotta,
+    Cartethyia,
+    Changli,
+    Chisa,
+    Cube,
+    Denia,
+    Hiyuki,
+    Iuno,
+    Jinhsi,
+    Luuk,
+    Lynae,
+    Mornye,
+    Phoebe,
+    Phrolova,
+    Roccia,
+    Shorekeeper,
+    Sigrika,
+    Zani,
+)
+from track import BlockerPad, Pad, SpatialRiftPad, ThrusterPad, Track
+
+PLAIN, THRUSTER, BLOCKER, SPATIAL_RIFT = range(4)
+
+PAD_KINDS: dict[type, int] = {
+    Pad: PLAIN,
+    ThrusterPad: THRUSTER,
+    BlockerPad: BLOCKER,
+    SpatialRiftPad: SPATIAL_RIFT,
+}
+
+# nb: Cubes whose skills are not implemented in cubes.py behave like a plain Cube in
+#     the object engine, so they are supported here as plain cubes too.
+SUPPORTED_CUBES: tuple[type, ...] = (
+    Cube,
+    Abbowser,
+    Aemeath,
+    Augusta,
+    Brant,
+    Calcharo,
+    Camellya,
+    Cantarella,
+    Carlotta,
+    Cartethyia,
+    Changli,
+    Chisa,
+    Denia,
+    Hiyuki,
+    Iuno,
+    Jinhsi,
+    Luuk,
+    Lynae,
+    Mornye,
+    Phoebe,
+    Phrolova,
+    Roccia,
+    Shorekeeper,
+    Sigrika,
+    Zani,
+)
+
+
+def _count(mask: np.ndarray) -> np.ndarray:
+    """Row-wise count of a (races, cubes) mask"""
+    # nb: a matrix product is several times faster than `sum(axis=1)` over the
+    #     short cube axis.
+    return mask.view(np.uint8) @ np.ones(mask.shape[1], dtype=np.int32)
+
+
+def _any(mask: np.ndarray) -> np.ndarray:
+    """Row-wise any of a (races, cubes) mask"""
+    return _count(mask) > 0
+
+
+class BatchRace:
+    """
+    Vectorized counterpart of `Race` that simulates many races in lockstep.
+
+    Race state is kept as (races, cubes) NumPy arrays: `progress`, `height` (index in
+    the pad's stack, 0 is the bottom), `steps`, `base_roll` and per-skill state.
+    A cube's pad is always `progress % track.length`, as in the object engine. Each
+    turn replays `Race.start_turn` hook by hook, with every hook applied to all races
+    whose cube in the current move-order slot has that hook.
+
+    Random draws differ from the object engine, so results match it in distribution
+    rather than race by race. Use `supports` to check a setup before building one.
+    """
+
+    def __init__(self, track: Track, cubes: list[Cube], laps: int = 1):
+        if not self.supports(track, cubes):
+            raise ValueError("Track or lineup is not supported by BatchRace")
+
+        self.track = track
+        self.cubes = cubes
+        self.laps = laps
+
+        self.length = track.length
+        self.max_progress = track.length * laps
+        self.pad_kind = np.array([PAD_KINDS[type(pad)] for pad in track.pads])
+
+        n = len(cubes)
+        self.rankable = np.array([cube.rankable for cube in cubes])
+        self.offset = np.array([cube.offset for cube in cubes])
+        self.num_ranks = int(self.rankable.sum())
+
+        # nb: dice faces as [low, high]; Abbowser's backwards roll is a negative range
+        self.roll_low = np.ones(n, dtype=np.int32)
+        self.roll_high = np.full(n, 3, dtype=np.int32)
+
+        self.columns: dict[type, list[int]] = {}
+        for j, cube in enumerate(cubes):
+            self.columns.setdefault(type(cube), []).append(j)
+
+            if isinstance(cube, Shorekeeper):
+                self.roll_low[j] = 2
+            elif isinstance(cube, Abbowser):
+                self.roll_low[j], self.roll_high[j] = -6, -1
+
+        self.is_abbowser = np.array([isinstance(cube, Abbowser) for cube in cubes])
+        self.is_luuk = np.array([isinstance(cube, Luuk) for cube in cubes])
+
+        hook = self._hooks
+
+        # nb: hooks in the order their classes would be looked up on a cube; each
+        #     entry is (cube column, handler(rows, column)).
+        self._turn_start_hooks = (
+            hook(Abbowser, self._abbowser_turn_start)
+            + hook(Augusta, self._augusta_turn_start)
+            + hook(Chisa, self._chisa_turn_start)
+            + hook(Lynae, self._lynae_turn_start)
+            + hook(Phrolova, self._phrolova_turn_start)
+            + hook(Roccia, self._roccia_turn_start)
+            + hook(Sigrika, self._sigrika_turn_start)
+        )
+        self._before_move_hooks = (
+            hook(Calcharo, self._calcharo_before_move)
+            + hook(Carlotta, self._carlotta_before_move)
+            + hook(Cartethyia, self._cartethyia_before_move)
+            + hook(Denia, self._denia_before_move)
+            + hook(Hiyuki, self._hiyuki_before_move)
+            + hook(Phoebe, self._phoebe_before_move)
+        )
+        self._after_move_hooks = (
+            hook(Aemeath, self._aemeath_after_move)
+            + hook(Cartethyia, self._cartethyia_after_move)
+            + hook(Iuno, self._iuno_after_move)
+        )
+        self._turn_end_hooks = (
+            hook(Abbowser, self._abbowser_turn_end)
+            + hook(Changli, self._changli_turn_end)
+            + hook(Jinhsi, self._jinhsi_turn_end)
+        )
+        self._encounters = bool(self.columns.get(Hiyuki)) and self.is_abbowser.any()
+
+    def _hooks(self, cls: type, handler) -> list[tuple[int, object]]:
+        return [(j, handler) for j in self.columns.get(cls, [])]
+
+    @staticmethod
+    def supports(track: Track, cubes: list[Cube]) -> bool:
+        """
+        Whether every pad and cube of the setup has a vectorized implementation.
+        The start/finish pad must be a plain Pad, so a race is over as soon as a
+        cube reaches the finish line (the object engine still fires that pad's
+        on_land before it reports the winner).
+        """
+        return (
+            type(track.pads[0]) is Pad
+            and all(type(pad) in PAD_KINDS for pad in track.pads)
+            and all(type(cube) in SUPPORTED_CUBES for cube in cubes)
+        )
+
+    # --- Board Queries --- #
+
+    def _pad(self, rows: np.ndarray, col: np.ndarray | int) -> np.ndarray:
+        return self.pad[rows, col]
+
+    def _on_pad(self, rows: np.ndarray, pad: np.ndarray) -> np.ndarray:
+        """(rows, cubes) mask of the cubes standing on `pad` in each race"""
+        return self.pad[rows] == pad[:, None]
+
+    def _set_progress(self, rows: np.ndarray, col: np.ndarray | int | slice, progress: np.ndarray):
+        self.progress[rows, col] = progress
+        self.pad[rows, col] = progress % self.length
+
+    def _stack_size(self, rows: np.ndarray, col: int) -> np.ndarray:
+        return _count(self._on_pad(rows, self._pad(rows, col)))
+
+    def _rankings(self, rows: np.ndarray) -> np.ndarray:
+        """Rankable cube columns per race from first to last, as `Race.compute_rankings`"""
+        key = self.progress[rows] * (len(self.cubes) + 1) + self.height[rows]
+        # nb: progress can go negative (Abbowser carrying cubes back past the start),
+        #     so unrankable cubes need a key below any reachable one
+        key = np.where(self.rankable, key, np.iinfo(key.dtype).min + 1)
+        return np.argsort(-key, axis=1, kind="stable")[:, : self.num_ranks]
+
+    def _rank_of(self, rankings: np.ndarray, col: int) -> np.ndarray:
+        return np.argmax(rankings == col, axis=1)
+
+    # --- Cube Positioning --- #
+
+    def _step(self, rows: np.ndarray, mover: np.ndarray, direction: np.ndarray):
+        """Vectorized `Race.move_cube_one_step`, returning which races now have a winner"""
+        r = np.arange(len(rows))
+        pads, height = self.pad[rows], self.height[rows]
+
+        origin = self.progress[rows, mover]
+        destination = np.clip(origin + direction, 0, self.max_progress)
+        destination_pad = destination % self.length
+        base = height[r, mover]
+
+        moving = (pads == pads[r, mover][:, None]) & (height >= base[:, None])
+        at_destination = pads == destination_pad[:, None]
+
+        if self._encounters:
+            self._hiyuki_encounter(rows, moving, at_destination)
+
+        below = _count(at_destination & ~moving)
+        self.height[rows] = height + moving * (below - base)[:, None]
+        self.pad[rows] = np.where(moving, destination_pad[:, None], pads)
+
+        progress = self.progress[rows] + moving * (destination - origin)[:, None]
+        self.progress[rows] = progress
+
+        # nb: only cubes that just moved can have reached the finish line
+        won = _any(moving & self.rankable & (progress == self.max_progress))
+        self.finished[rows[won]] = True
+        return won
+
+    def _move(self, rows: np.ndarray, mover: np.ndarray, steps: np.ndarray):
+        """Vectorized `Race.move_cube_with_steps` for one mover column per race"""
+        if len(rows) == 0:
+            return
+
+        remaining = np.abs(steps)
+        direction = np.sign(steps)
+        won = np.zeros(len(rows), dtype=bool)
+
+        for k in range(remaining.max(initial=0)):
+            act = (remaining > k) & ~won
+            won[act] = self._step(rows[act], mover[act], direction[act])
+
+            # nb: Abbowser.on_enter_pad
+            bottom = act & ~won & self.is_abbowser[mover]
+            self._move_to_bottom(rows[bottom], mover[bottom])
+
+        rows, mover, remaining = rows[~won], mover[~won], remaining[~won]
+
+        # nb: Luuk.on_enter_pad on the final step
+        kind = self.pad_kind[self._pad(rows, mover)]
+        luuk = self.is_luuk[mover] & (remaining > 0)
+        for extra, pad_kind in ((4, THRUSTER), (-2, BLOCKER)):
+            sel = luuk & (kind == pad_kind)
+            self._move(rows[sel], mover[sel], np.full(sel.sum(), extra))
+
+        # nb: a cube that already won through Luuk's extra move stands on the plain
+        #     finish pad, so skipping it here does not change its board.
+        alive = ~self.finished[rows]
+        rows, mover = rows[alive], mover[alive]
+        kind = self.pad_kind[self._pad(rows, mover)]
+
+        for extra, pad_kind in ((1, THRUSTER), (-1, BLOCKER)):
+            sel = kind == pad_kind
+            self._move(rows[sel], mover[sel], np.full(sel.sum(), extra))
+
+        sel = kind == SPATIAL_RIFT
+        self._shuffle_pad(rows[sel], self._pad(rows[sel], mover[sel]))
+
+    def _move_to_bottom(self, rows: np.ndarray, col: np.ndarray | int):
+        r = np.arange(len(rows))
+        height = self.height[rows]
+        below = self._on_pad(rows, self._pad(rows, col)) & (height < height[r, col][:, None])
+        height = height + below
+        height[r, col] = 0
+        self.height[rows] = height
+
+    def _move_to_top(self, rows: np.ndarray, col: int):
+        height = self.height[rows]
+        on_pad = self._on_pad(rows, self._pad(rows, col))
+        above = on_pad & (height > height[:, col][:, None])
+        height = height - above
+        height[:, col] = _count(on_pad) - 1
+        self.height[rows] = height
+
+    def _remove(self, rows: np.ndarray, col: int):
+        """Take a cube off its stack, dropping the cubes above it by one"""
+        height = self.height[rows]
+        above = self._on_pad(rows, self._pad(rows, col)) & (height > height[:, col][:, None])
+        self.height[rows] = height - above
+
+    def _push(self, rows: np.ndarray, col: int, progress: np.ndarray):
+        """Put an already removed cube on top of the stack at `progress`"""
+        on_pad = self._on_pad(rows, progress % self.length)
+        on_pad[:, col] = False
+        self.height[rows, col] = _count(on_pad)
+        self._set_progress(rows, col, progress)
+
+    def _shuffle_pad(self, rows: np.ndarray, pad: np.ndarray):
+        on_pad = self._on_pad(rows, pad)
+        keys = np.where(on_pad, self.rng.random(on_pad.shape), np.inf)
+        order = np.argsort(np.argsort(keys, axis=1), axis=1)
+        self.height[rows] = np.where(on_pad, order, self.height[rows])
+
+    def _compact(self, rows: np.ndarray):
+        """Renumber stack heights densely per pad, keeping each pad's stack order"""
+        pads = self.pad[rows]
+        order = np.lexsort((self.height[rows], pads), axis=1)
+        sorted_pads = np.take_along_axis(pads, order, axis=1)
+        first = np.argmax(sorted_pads[:, :, None] == sorted_pads[:, None, :], axis=2)
+        height = np.empty_like(order)
+        np.put_along_axis(height, order, np.arange(order.shape[1]) - first, axis=1)
+        self.height[rows] = height
+
+    # --- Race Logic --- #
+
+    def _roll(self, rows: np.ndarray):
+        span = self.roll_high - self.roll_low + 1
+        roll = self.roll_low + (self.rng.random((len(rows), len(self.cubes))) * span).astype(np.int32)
+
+        for j in self.columns.get(Mornye, []):
+            dice = np.array(self.cubes[j].dice)
+            roll[:, j] = dice[self.dice_index[rows, j] % len(dice)]
+            self.dice_index[rows, j] += 1
+
+        self.base_roll[rows] = roll
+        self.steps[rows] = roll
+
+    def _decide_move_orders(self, rows: np.ndarray) -> np.ndarray:
+        self._roll(rows)
+        # nb: uniform noise below 1 breaks ties between equal rolls at random
+        key = self.steps[rows] + self.rng.random((len(rows), len(self.cubes)))
+        return np.argsort(-key, axis=1)
+
+    def _move_last_next_turn(self, rows: np.ndarray, col: int):
+        order = self.order_next[rows]
+        rest = order[order != col].reshape(len(rows), len(self.cubes) - 1)
+        self.order_next[rows] = np.concatenate([rest, np.full((len(rows), 1), col)], axis=1)
+
+    def _dispatch(self, hooks, rows: np.ndarray, col: np.ndarray):
+        for j, handler in hooks:
+            sel = rows[col == j]
+            if len(sel):
+                handler(sel, j)
+
+    def _reset(self, num_races: int):
+        n = len(self.cubes)
+        self.progress = np.tile(self.offset.astype(np.int32), (num_races, 1))
+        self.pad = self.progress % self.length
+        self.steps = np.zeros((num_races, n), dtype=np.int32)
+        self.base_roll = np.zeros((num_races, n), dtype=np.int32)
+        self.turn = np.zeros(num_races, dtype=np.int32)
+        self.finished = np.zeros(num_races, dtype=bool)
+
+        self.skill_triggered = np.zeros((num_races, n), dtype=bool)
+        self.prev_roll = np.full((num_races, n), -1, dtype=np.int32)
+        self.extra_step = np.zeros((num_races, n), dtype=np.int32)
+        self.dice_index = np.zeros((num_races, n), dtype=np.int32)
+
+        # nb: mirrors `random.shuffle(race.cubes)` before each race, which decides the
+        #     initial stack order of cubes sharing a starting pad.
+        self.lineup = np.argsort(self.rng.random((num_races, n)), axis=1)
+        self.lineup_index = np.argsort(self.lineup, axis=1)
+
+        self.height = np.zeros((num_races, n), dtype=np.int32)
+        for j in range(n):
+            pushed_before = self.lineup_index < self.lineup_index[:, j : j + 1]
+            self.height[:, j] = _count(pushed_before & (self.pad == self.pad[:, j : j + 1]))
+
+        rows = np.arange(num_races)
+        self.order_next = self._decide_move_orders(rows)
+        self.order_this = self.order_next.copy()
+
+    def _start_turn(self, rows: np.ndarray):
+        """Vectorized `Race.start_turn` for the races in `rows`"""
+        self.turn[rows] += 1
+        self.order_this[rows] = self.order_next[rows]
+        self.order_next[rows] = self._decide_move_orders(rows)
+
+        self._roll(rows)
+
+        for k in range(len(self.cubes)):
+            self._dispatch(self._turn_start_hooks, rows, self.order_this[rows, k])
+
+        for k in range(len(self.cubes)):
+            rows = rows[~self.finished[rows]]
+            mover = self.order_this[rows, k]
+            self._dispatch(self._before_move_hooks, rows, mover)
+
+            self._move(rows, mover, self.steps[rows, mover])
+
+            rows = rows[~self.finished[rows]]
+            self._dispatch(self._after_move_hooks, rows, self.order_this[rows, k])
+
+        for k in range(len(self.cubes)):
+            self._dispatch(self._turn_end_hooks, rows, self.order_this[rows, k])
+
+    def run(
+        self,
+        num_races: int,
+        rng: np.random.Generator | None = None,
+        start: int = 0,
+    ) -> dict[str, np.ndarray]:
+        """
+        Simulate `num_races` races and return them in the simulation chunk layout:
+        `race_id`, `turns`, and (races, cubes) `rank` / `progress` arrays with rank 0
+        for unrankable cubes.
+        """
+        self.rng = rng or np.random.default_rng()
+        self._reset(num_races)
+
+        while not self.finished.all():
+            self._start_turn(np.flatnonzero(~self.finished))
+
+        rows = np.arange(num_races)
+        rank = np.zeros((num_races, len(self.cubes)), dtype=np.uint8)
+        np.put_along_axis(
+            rank, self._rankings(rows), np.arange(1, self.num_ranks + 1), axis=1
+        )
+
+        return {
+            "race_id": np.arange(start, start + num_races, dtype=np.int64),
+            "turns": self.turn.astype(np.uint32),
+            "rank": rank,
+            "progress": self.progress.astype(np.int32),
+        }
+
+    # --- Skills --- #
+
+    def _abbowser_turn_start(self, rows: np.ndarray, j: int):
+        self.steps[rows[self.turn[rows] < 3], j] = 0
+
+    def _abbowser_turn_end(self, rows: np.ndarray, j: int):
+        relative = self.pad[rows]
+        others = np.delete(relative, j, axis=1).min(axis=1, initial=self.length)
+        alone = self._stack_size(rows, j) == 1
+        rows = rows[alone & (relative[:, j] < others)]
+
+        pad = np.full(len(rows), self.offset[j] % self.length)
+        self.height[rows] += self._on_pad(rows, pad)
+        self.height[rows, j] = 0
+        self._set_progress(rows, j, np.full(len(rows), self.offset[j]))
+
+    def _aemeath_after_move(self, rows: np.ndarray, j: int):
+        rows = rows[~self.skill_triggered[rows, j]]
+        rows = rows[self._pad(rows, j) >= self.length / 2 - 1]
+
+        rankings = self._rankings(rows)
+        i = self._rank_of(rankings, j)
+        rows, rankings, i = rows[i > 0], rankings[i > 0], i[i > 0]
+
+        target = rankings[np.arange(len(rows)), i - 1]
+        self._remove(rows, j)
+        self._push(rows, j, self.progress[rows, target])
+        self.skill_triggered[rows, j] = True
+
+    def _augusta_turn_start(self, rows: np.ndarray, j: int):
+        rows = rows[self.height[rows, j] == self._stack_size(rows, j) - 1]
+        self.steps[rows, j] = 0
+        self._move_last_next_turn(rows, j)
+
+    def _calcharo_before_move(self, rows: np.ndarray, j: int):
+        rows = rows[self._rankings(rows)[:, -1] == j]
+        self.steps[rows, j] += 3
+
+    def _carlotta_before_move(self, rows: np.ndarray, j: int):
+        rows = rows[self.rng.random(len(rows)) < self.cubes[j].p]
+        self.steps[rows, j] *= 2
+
+    def _cartethyia_before_move(self, rows: np.ndarray, j: int):
+        chance = self.rng.random(len(rows)) < self.cubes[j].p
+        self.steps[rows[self.skill_triggered[rows, j] & chance], j] += 2
+
+    def _cartethyia_after_move(self, rows: np.ndarray, j: int):
+        rows = rows[~self.skill_triggered[rows, j]]
+        self.skill_triggered[rows[self._rankings(rows)[:, -1] == j], j] = True
+
+    def _changli_turn_end(self, rows: np.ndarray, j: int):
+        chance = self.rng.random(len(rows)) < self.cubes[j].p
+        self._move_last_next_turn(rows[(self.height[rows, j] != 0) & chance], j)
+
+    def _chisa_turn_start(self, rows: np.ndarray, j: int):
+        lowest = self.base_roll[rows].min(axis=1)
+        self.steps[rows[self.base_roll[rows, j] == lowest], j] += 2
+
+    def _denia_before_move(self, rows: np.ndarray, j: int):
+        steps = self.steps[rows, j]
+        extras = np.where(steps == self.prev_roll[rows, j], 2, 0)
+        self.prev_roll[rows, j] = steps
+        self.steps[rows, j] = steps + extras
+
+    def _hiyuki_before_move(self, rows: np.ndarray, j: int):
+        self.steps[rows, j] += self.extra_step[rows, j]
+
+    def _hiyuki_encounter(self, rows: np.ndarray, moving: np.ndarray, at_destination: np.ndarray):
+        # nb: both sides of every (moving, already there) pair get on_encounter, and
+        #     only Hiyuki reacts, to Abbowser.
+        abbowser = self.is_abbowser
+        for j in self.columns[Hiyuki]:
+            self.extra_step[rows, j] += _count(moving[:, [j]] & at_destination & abbowser)
+            self.extra_step[rows, j] += _count(moving & abbowser & at_destination[:, [j]])
+
+    def _iuno_after_move(self, rows: np.ndarray, j: int):
+        rows = rows[~self.skill_triggered[rows, j]]
+        rows = rows[self._pad(rows, j) >= self.length / 2 - 1]
+
+        rankings = self._rankings(rows)
+        on_pad = self._on_pad(rows, self._pad(rows, j))
+        progress = self.progress[rows, j][:, None]
+
+        # nb: Abbowsers already on Iuno's pad go to the bottom in lineup order, then
+        #     every ranked cube is stacked from last place up to first place.
+        height = self.height[rows].copy()
+        pulled = on_pad & self.is_abbowser
+        height = np.where(pulled, self.lineup_index[rows] - len(self.cubes), height)
+
+        np.put_along_axis(
+            height,
+            rankings,
+            len(self.cubes) + np.arange(self.num_ranks)[::-1],
+            axis=1,
+        )
+        self.height[rows] = height
+        self._set_progress(
+            rows, slice(None), np.where(pulled | self.rankable, progress, self.progress[rows])
+        )
+        self._compact(rows)
+        self.skill_triggered[rows, j] = True
+
+    def _jinhsi_turn_end(self, rows: np.ndarray, j: int):
+        covered = self.height[rows, j] != self._stack_size(rows, j) - 1
+        chance = self.rng.random(len(rows)) < self.cubes[j].p
+        self._move_to_top(rows[covered & chance], j)
+
+    def _lynae_turn_start(self, rows: np.ndarray, j: int):
+        cube = self.cubes[j]
+        double = self.rng.random(len(rows)) < cube.p_double
+        stop = ~double & (self.rng.random(len(rows)) < cube.p_double + cube.p_stop)
+        self.steps[rows[double], j] *= 2
+        self.steps[rows[stop], j] = 0
+
+    def _phoebe_before_move(self, rows: np.ndarray, j: int):
+        self.steps[rows, j] += self.rng.random(len(rows)) < self.cubes[j].p
+
+    def _phrolova_turn_start(self, rows: np.ndarray, j: int):
+        rows = rows[(self.height[rows, j] == 0) & (self._stack_size(rows, j) > 1)]
+        self.steps[rows, j] += 3
+
+    def _roccia_turn_start(self, rows: np.ndarray, j: int):
+        self.steps[rows[self.order_this[rows, -1] == j], j] += 2
+
+    def _sigrika_turn_start(self, rows: np.ndarray, j: int):
+        rankings = self._rankings(rows)
+        i = self._rank_of(rankings, j)
+
+        for ahead in (1, 2):
+            sel = i >= ahead
+            cube = rankings[sel, i[sel] - ahead]
+            self.steps[rows[sel], cube] = np.maximum(1, self.steps[rows[sel], cube] - 1)
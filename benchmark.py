@@ -0,0 +1,318 @@
+from __future__ import annotations
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import cubes as cubes_module
+from batch_race import BatchRace
+from cubes import Abbowser, Cube
+from simulation import ENGINES, simulate_chunks
+from sweep import source_version
+from track import BlockerPad, Pad, SpatialRiftPad, ThrusterPad, Track
+
+# nb: the pads of main.py's track, repeated every 32 pads on longer tracks
+MAIN_PADS: list[tuple[type[Pad], int]] = [
+    (ThrusterPad, 4),
+    (SpatialRiftPad, 6),
+    (ThrusterPad, 10),
+    (SpatialRiftPad, 14),
+    (BlockerPad, 16),
+    (ThrusterPad, 20),
+    (SpatialRiftPad, 23),
+    (BlockerPad, 26),
+    (BlockerPad, 30),
+]
+MAIN_LINEUP = ["Shorekeeper", "Jinhsi", "Calcharo", "Augusta", "Hiyuki", "Aemeath"]
+MAIN_OFFSET = 1
+
+THRESHOLD = 0.1
+
+
+class Scenario:
+    """
+    A benchmarked setup. Cubes are built per run (Abbowser's offset depends on the
+    track length and laps), so a scenario can be simulated any number of times.
+
+    Attributes:
+        offsets: Starting offset of each cube of the lineup, 0 by default. Abbowser
+            starts from the finish line unless given one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        length: int,
+        lineup: list[str],
+        laps: int = 1,
+        offsets: list[int | None] | None = None,
+    ):
+        self.name = name
+        self.length = length
+        self.lineup = lineup
+        self.laps = laps
+        self.offsets = offsets if offsets is not None else [None] * len(lineup)
+
+    def track(self) -> Track:
+        pads = [
+            pad(p + offset)
+            for offset in range(0, self.length, 32)
+            for pad, p in MAIN_PADS
+            if p + offset < self.length
+        ]
+        return Track.create(length=self.length, custom_pads=pads)
+
+    def cubes(self) -> list[Cube]:
+        return [
+            Abbowser(self.length * self.laps if offset is None else offset)
+            if name == "Abbowser"
+            else getattr(cubes_module, name)(offset or 0)
+            for name, offset in zip(self.lineup, self.offsets)
+        ]
+
+
+def implemented_cubes() -> list[str]:
+    """Cube classes that override at least one rule of the base `Cube`"""
+    return [
+        cls.__name__
+        for cls in Cube.__subclasses__()
+        if any(callable(value) for value in vars(cls).values())
+    ]
+
+
+def scenarios() -> list[Scenario]:
+    """The standard benchmark scenarios"""
+    # nb: main.py's lineup, which starts one pad past the start line
+    default = ["Abbowser", *MAIN_LINEUP]
+    offsets = [None] + [MAIN_OFFSET] * len(MAIN_LINEUP)
+
+    # nb: each cube races against plain cubes, so its own rules dominate the cost
+    single = [
+        Scenario(f"cube:{name}", 32, [name] + ["Cube"] * (6 if name == "Abbowser" else 5))
+        for name in implemented_cubes()
+    ]
+
+    return [
+        Scenario("main", 32, default, offsets=offsets),
+        *single,
+        Scenario("long-track:128", 128, default, offsets=offsets),
+        Scenario("long-track:256", 256, default, offsets=offsets),
+        Scenario("laps:3", 32, default, laps=3, offsets=offsets),
+        Scenario("laps:10", 32, default, laps=10, offsets=offsets),
+    ]
+
+
+# --- Running --- #
+
+
+def environment() -> dict:
+    """Where and on what the benchmark ran, saved alongside its results"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "commit": commit or None,
+        "source": source_version(),
+    }
+
+
+def _simulate(scenario: Scenario, engine: str, races: int, seed: int) -> int:
+    """Simulate `races` races of `scenario` on one worker, returning the number of turns"""
+    # nb: the numpy engine only pays off on large chunks
+    chunk_size = races if engine == "numpy" else 1000
+    chunks = simulate_chunks(
+        scenario.track(),
+        scenario.cubes(),
+        races,
+        scenario.laps,
+        workers=1,
+        chunk_size=chunk_size,
+        seed=seed,
+        progress=False,
+        engine=engine,
+    )
+    return sum(int(chunk["turns"].sum()) for chunk in chunks)
+
+
+def run_scenario(
+    scenario: Scenario, engine: str, races: int, repeat: int = 3, seed: int = 0
+) -> dict:
+    """
+    Time `repeat` runs of `races` races and report the best rates, plus the peak
+    memory allocated by Python during one more (traced, so slower) run.
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        turns = _simulate(scenario, engine, races, seed)
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        _simulate(scenario, engine, races, seed)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(seconds)
+    vectorized = BatchRace.supports(scenario.track(), scenario.cubes())
+
+    return {
+        "scenario": scenario.name,
+        "engine": engine,
+        # nb: False when the numpy engine fell back to the object engine
+        "vectorized": engine == "numpy" and vectorized,
+        "track_length": scenario.length,
+        "laps": scenario.laps,
+        "cubes": scenario.lineup,
+        "races": races,
+        "turns": turns,
+        "seconds": seconds,
+        "races_per_sec": races / best,
+        "turns_per_sec": turns / best,
+        "peak_memory_bytes": peak,
+    }
+
+
+def run(
+    selected: list[Scenario],
+    engines: list[str],
+    races: int,
+    repeat: int = 3,
+    seed: int = 0,
+    progress: bool = True,
+) -> dict:
+    """Benchmark every selected scenario on every engine"""
+    results = []
+    for scenario in selected:
+        for engine in engines:
+            result = run_scenario(scenario, engine, races, repeat, seed)
+            results.append(result)
+            if progress:
+                rate = result["races_per_sec"]
+                print(f"{scenario.name:<24} {engine:<6} {rate:>10.0f} races/s", file=sys.stderr)
+
+    return {
+        "environment": environment(),
+        "settings": {"races": races, "repeat": repeat, "seed": seed},
+        "results": results,
+    }
+
+
+# --- Reporting --- #
+
+
+def table(report: dict) -> pd.DataFrame:
+    columns = ["scenario", "engine", "races_per_sec", "turns_per_sec", "peak_memory_bytes"]
+    return pd.DataFrame(report["results"], columns=columns).set_index(["scenario", "engine"])
+
+
+def compare(baseline: dict, current: dict, threshold: float = THRESHOLD) -> pd.DataFrame:
+    """
+    Compare two reports on the scenarios they share. A scenario regressed when its
+    races/sec dropped, or its peak memory grew, by more than `threshold` (relative).
+    """
+    joined = table(baseline).join(table(current), how="inner", lsuffix="_baseline")
+
+    comparison = pd.DataFrame(
+        {
+            "races_per_sec": joined["races_per_sec"],
+            "speed": joined["races_per_sec"] / joined["races_per_sec_baseline"],
+            "memory": joined["peak_memory_bytes"] / joined["peak_memory_bytes_baseline"],
+        }
+    )
+    comparison["regression"] = (comparison["speed"] < 1 - threshold) | (
+        comparison["memory"] > 1 + threshold
+    )
+    return comparison
+
+
+def _load(path: str) -> dict:
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def _save(path: str, report: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fp:
+        json.dump(report, fp, indent=2)
+    os.replace(tmp, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure simulator throughput (races/sec, turns/sec, peak memory)"
+    )
+    parser.add_argument("--races", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=ENGINES, nargs="+", default=list(ENGINES))
+    parser.add_argument(
+        "--scenario",
+        nargs="+",
+        default=["*"],
+        help="Glob patterns of the scenarios to run, e.g. 'cube:*'",
+    )
+    parser.add_argument("--list", action="store_true", help="List the scenarios and exit")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument(
+        "--results",
+        default=None,
+        help="Compare an existing report instead of running the benchmark",
+    )
+    parser.add_argument("--compare", default=None, help="Baseline report to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    selected = [
+        scenario
+        for scenario in scenarios()
+        if any(fnmatch.fnmatch(scenario.name, pattern) for pattern in args.scenario)
+    ]
+
+    if args.list:
+        for scenario in selected:
+            print(scenario.name)
+        sys.exit()
+
+    if args.results is None:
+        report = run(selected, args.engine, args.races, args.repeat, args.seed)
+        _save(args.output, report)
+    else:
+        report = _load(args.results)
+
+    print(table(report))
+
+    if args.compare is not None:
+        comparison = compare(_load(args.compare), report, args.threshold)
+        print(comparison)
+
+        if comparison["regression"].any():
+            regressed = comparison.index[comparison["regression"]].tolist()
+            print(f"Regressions beyond {args.threshold:.0%}: {regressed}")
+            sys.exit(1)
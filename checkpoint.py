@@ -0,0 +1,155 @@
+from __future__ import annotations
+from typing import Iterable
+import json
+import os
+import random
+import time
+
+import cubes as cubes_module
+import track as track_module
+from cubes import Cube
+from race import RaceState
+from track import Pad, Track
+
+# nb: Every race is seeded from the job's seed and its index (see simulate_chunks),
+#     so a job's seed and its number of completed races are its whole RNG state.
+
+
+def _overrides(obj: object, exclude: Iterable[str] = ()) -> dict:
+    """Instance attributes that shadow a class attribute, e.g. a cube's `p`"""
+    return {
+        name: value
+        for name, value in sorted(vars(obj).items())
+        if hasattr(type(obj), name) and name not in exclude
+    }
+
+
+def describe(track: Track, cubes: list[Cube], laps: int = 1) -> dict:
+    """JSON description of a setup, covering everything that affects results"""
+    return {
+        "track": {
+            "length": track.length,
+            "pads": [
+                [pad.id, type(pad).__name__, _overrides(pad, ("id", "cubes"))]
+                for pad in track.pads
+                if type(pad) is not Pad
+            ],
+        },
+        "cubes": [
+            [type(cube).__name__, cube.offset, _overrides(cube, ("offset",))]
+            for cube in cubes
+        ],
+        "laps": laps,
+    }
+
+
+def _class(module, name: str, base: type) -> type:
+    cls = getattr(module, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, base)):
+        raise ValueError(f"Unknown {base.__name__.lower()} {name!r}")
+    return cls
+
+
+def _override(obj: object, overrides: dict):
+    for name, value in overrides.items():
+        if not hasattr(type(obj), name):
+            raise ValueError(f"{type(obj).__name__} has no parameter {name!r}")
+        setattr(obj, name, value)
+
+
+def build(config: dict) -> tuple[Track, list[Cube], int]:
+    """The `(track, cubes, laps)` setup of a `describe` description"""
+    pads = []
+    for index, name, overrides in config["track"]["pads"]:
+        pad = _class(track_module, name, Pad)(index)
+        _override(pad, overrides)
+        pads.append(pad)
+
+    cubes = []
+    for name, offset, overrides in config["cubes"]:
+        cube = _class(cubes_module, name, Cube)(offset)
+        _override(cube, overrides)
+        cubes.append(cube)
+
+    return Track.create(config["track"]["length"], pads), cubes, config.get("laps", 1)
+
+
+def job_spec(
+    track: Track,
+    cubes: list[Cube],
+    laps: int,
+    seed: int,
+    engine: str = "object",
+    chunk_size: int = 1000,
+    state: RaceState | None = None,
+) -> dict:
+    """
+    Everything a resumed job must share with the interrupted one to continue it
+    exactly. The number of races is left out, so a finished job can be extended.
+    """
+    job = {"config": describe(track, cubes, laps), "seed": seed, "engine": engine}
+
+    # nb: only the numpy engine's draws depend on how races are chunked
+    if engine == "numpy":
+        job["chunk_size"] = chunk_size
+    if state is not None:
+        job["state"] = state.key()
+
+    # nb: round-trip through JSON so it compares equal to a loaded job
+    return json.loads(json.dumps(job))
+
+
+def resolve_seed(seed: int | None, saved_job: dict | None) -> int:
+    """The seed to run a job with: the given one, the saved job's, or a fresh one"""
+    if seed is not None:
+        return seed
+    if saved_job is not None:
+        return saved_job["seed"]
+    return random.randrange(2**32)
+
+
+class Checkpoint:
+    """
+    Progress of a long simulation job in a small JSON file, written atomically at
+    most every `interval` seconds so checkpointing does not slow the job down.
+
+    Attributes:
+        path: The checkpoint file.
+        job: The job's `job_spec`, which a resumed run must match.
+        interval: Minimum seconds between two saves (unless forced).
+    """
+
+    def __init__(self, path: str, job: dict, interval: float = 60.0):
+        self.path = path
+        self.job = job
+        self.interval = interval
+        self._saved_at = time.monotonic()
+
+    @staticmethod
+    def read(path: str) -> dict | None:
+        """The saved checkpoint at `path` (`job` and `progress`), if any"""
+        if not os.path.exists(path):
+            return None
+        with open(path) as fp:
+            return json.load(fp)
+
+    def load(self) -> dict | None:
+        """Saved progress of this job, or None to start from scratch"""
+        saved = self.read(self.path)
+        if saved is None:
+            return None
+        if saved["job"] != self.job:
+            raise ValueError(f"Checkpoint {self.path} is for a different job")
+        return saved["progress"]
+
+    def save(self, progress: dict, force: bool = False):
+        """Save `progress` if `interval` has passed since the last save (or `force`)"""
+        now = time.monotonic()
+        if not force and now - self._saved_at < self.interval:
+            return
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump({"job": self.job, "progress": progress}, fp)
+        os.replace(tmp, self.path)
+        self._saved_at = now
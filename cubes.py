@@ -1,7 +1,5 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
-import itertools
-import random
 
 from track import BlockerPad, Pad, ThrusterPad
 
@@ -15,9 +13,12 @@ class Cube:
         offset: Starting position of the cube on the track. Default is 0.
         steps: Number of steps the cube will move in the current turn.
         progress: Total number of steps the cube has moved from the track's starting line.
+        state_attrs: Names of the per-race skill attributes set up in `reset`, which
+            `Race.snapshot()` and `Race.restore()` copy. Values must be immutable.
     """
 
     rankable: bool = True
+    state_attrs: tuple[str, ...] = ()
 
     def __init__(self, offset: int = 0):
         self.offset: int = offset
@@ -33,9 +34,9 @@ class Cube:
         self.steps = 0
         self.progress = self.offset
 
-    def roll(self):
+    def roll(self, race: Race):
         """Base roll value of cube before any skill is triggered"""
-        self.base_roll = random.randint(1, 3)
+        self.base_roll = race.rng.randint(1, 3)
         self.steps = self.base_roll
 
     def on_turn_start(self, race: Race):
@@ -74,8 +75,8 @@ class Abbowser(Cube):
 
     rankable: bool = False
 
-    def roll(self):
-        self.base_roll = -random.randint(1, 6)
+    def roll(self, race: Race):
+        self.base_roll = -race.rng.randint(1, 6)
         self.steps = self.base_roll
 
     def on_turn_start(self, race: Race):
@@ -83,9 +84,7 @@ class Abbowser(Cube):
             self.steps = 0
 
     def on_enter_pad(self, race: Race, final_step: bool = False):
-        p, i = race.locate_cube(self)
-        race.track.pads[p].cubes.pop(i)
-        race.track.pads[p].cubes.insert(0, self)
+        race.move_within_stack(self, 0)
 
     def on_turn_end(self, race: Race):
         p, i = race.locate_cube(self)
@@ -110,6 +109,8 @@ class Aemeath(Cube):
     Cube (if that Cube is not Abbowser). This can be triggered only once per match.
     """
 
+    state_attrs = ("skill_triggered",)
+
     def reset(self):
         super().reset()
         self.skill_triggered: bool = False
@@ -123,7 +124,7 @@ class Aemeath(Cube):
 
         if p >= race.track.length / 2 - 1:
             rankings = race.compute_rankings()
-            i = rankings.index(self)
+            i = race.rank_of(self)
 
             for o in range(i - 1, -1, -1):
                 if not isinstance(rankings[o], Abbowser):
@@ -188,7 +189,7 @@ class Carlotta(Cube):
     p: float = 0.28
 
     def on_before_move(self, race: Race):
-        if random.random() < self.p:
+        if race.rng.random() < self.p:
             self.steps *= 2
 
 
@@ -200,12 +201,14 @@ class Cartethyia(Cube):
 
     p: float = 0.6
 
+    state_attrs = ("skill_triggered",)
+
     def reset(self):
         super().reset()
         self.skill_triggered: bool = False
 
     def on_before_move(self, race: Race):
-        if self.skill_triggered and random.random() < self.p:
+        if self.skill_triggered and race.rng.random() < self.p:
             self.steps += 2
 
     def on_after_move(self, race: Race):
@@ -227,7 +230,7 @@ class Changli(Cube):
     def on_turn_end(self, race: Race):
         p, i = race.locate_cube(self)
 
-        if i != 0 and random.random() < self.p:
+        if i != 0 and race.rng.random() < self.p:
             race.cubes_order_next_turn.remove(self)
             race.cubes_order_next_turn.append(self)
 
@@ -250,6 +253,8 @@ class Denia(Cube):
     If the number rolled matches the previous roll, this Cube advances 2 extra pads.
     """
 
+    state_attrs = ("prev_roll",)
+
     def reset(self):
         super().reset()
         self.prev_roll: int = -1
@@ -265,6 +270,8 @@ class Hiyuki(Cube):
     Encountering Abbowser Cube causes this Cube to advance by 1 extra pad each turn afterward.
     """
 
+    state_attrs = ("extra_step",)
+
     def reset(self):
         super().reset()
         self.extra_step = 0
@@ -287,6 +294,8 @@ class Iuno(Cube):
     这些团子的堆叠顺序将与传前的排名顺序一致
     """
 
+    state_attrs = ("skill_triggered",)
+
     def reset(self):
         super().reset()
         self.skill_triggered: bool = False
@@ -299,7 +308,7 @@ class Iuno(Cube):
 
         if p >= race.track.length / 2 - 1:
             rankings = race.compute_rankings()
-            race.track.pads[p].cubes = []
+            race.clear_pad(p)
 
             # nb: if abbowser is in the same pad, keep it at the very bottom
             for cube in race.cubes:
@@ -333,10 +342,8 @@ class Jinhsi(Cube):
         p, i = race.locate_cube(self)
 
         if race.track.pads[p].cubes[-1] != self:
-            if random.random() < self.p:
-                race._ranking_cache = None
-                race.track.pads[p].cubes.pop(i)
-                race.track.pads[p].cubes.append(self)
+            if race.rng.random() < self.p:
+                race.move_within_stack(self, -1)
 
 
 class Luuk(Cube):
@@ -367,9 +374,9 @@ class Lynae(Cube):
     p_stop: float = 0.2
 
     def on_turn_start(self, race: Race):
-        if random.random() < self.p_double:
+        if race.rng.random() < self.p_double:
             self.steps *= 2
-        elif random.random() < self.p_double + self.p_stop:
+        elif race.rng.random() < self.p_double + self.p_stop:
             self.steps = 0
 
 
@@ -378,14 +385,21 @@ class Mornye(Cube):
     The dice is set to roll 3, 2, and 1 in succession.
     """
 
+    dice: tuple[int, ...] = (1, 2, 3)
+
+    state_attrs = ("dice_index",)
+
     def reset(self):
         super().reset()
-        self.dice_generator = itertools.cycle([1, 2, 3])
+        # nb: a plain index instead of itertools.cycle keeps the cube picklable,
+        #     so it can be shipped to simulation worker processes.
+        self.dice_index: int = 0
 
-    def roll(self):
-        # nb: we assume dice roll for deciding move order consumes the generator
+    def roll(self, race: Race):
+        # nb: we assume dice roll for deciding move order consumes the dice sequence
         #     3 (roll) -> 1 (move order) -> 2 (roll) -> 3 (move order) -> 1 (roll)
-        self.base_roll = next(self.dice_generator)
+        self.base_roll = self.dice[self.dice_index]
+        self.dice_index = (self.dice_index + 1) % len(self.dice)
         self.steps = self.base_roll
 
 
@@ -397,7 +411,7 @@ class Phoebe(Cube):
     p: float = 0.5
 
     def on_before_move(self, race: Race):
-        self.steps += int(random.random() < self.p)
+        self.steps += int(race.rng.random() < self.p)
 
 
 class Phrolova(Cube):
@@ -427,8 +441,8 @@ class Shorekeeper(Cube):
     The dice will only roll 2 or 3.
     """
 
-    def roll(self):
-        self.base_roll = random.randint(2, 3)
+    def roll(self, race: Race):
+        self.base_roll = race.rng.randint(2, 3)
         self.steps = self.base_roll
 
 
@@ -443,7 +457,7 @@ class Sigrika(Cube):
     def on_turn_start(self, race: Race):
         # nb: "right ahead" is ambiguous, we assume it is by progress not by relative position.
         rankings = race.compute_rankings()
-        i = rankings.index(self)
+        i = race.rank_of(self)
 
         for c in rankings[max(0, i - 2) : i]:
             c.steps = max(1, c.steps - 1)
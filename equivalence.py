@@ -0,0 +1,371 @@
+from __future__ import annotations
+from collections import Counter
+from statistics import NormalDist
+from typing import Callable, Iterator
+import argparse
+import fnmatch
+import math
+import sys
+
+import numpy as np
+import pandas as pd
+
+from benchmark import Scenario, scenarios
+from rng import CubeStreamsRNG
+from simulation import simulate_chunks
+from stats import RankAggregator
+
+# nb: (scenario, races, seed, workers) -> result chunks in the layout of
+#     `simulation.simulate_chunks`
+Engine = Callable[[Scenario, int, int, int], Iterator[dict[str, np.ndarray]]]
+
+ALPHA = 0.001
+
+# nb: adjacent ranks (or turn counts) are pooled until each cell holds this many
+#     races, since the chi-square approximation breaks down on sparse cells
+MIN_CELL = 10
+
+# nb: identical cubes from one starting line share every rank equally, which is known
+#     exactly rather than estimated from the reference, and which no other lineup
+#     shows as plainly: a draw that favours one position of the lineup stands out
+SYMMETRIC = Scenario("symmetric", 6, ["Cube"] * 4)
+
+
+def reference(scenario: Scenario, races: int, seed: int, workers: int | None = None):
+    """
+    The reference engine: the object `Race` moving cubes one step at a time
+    (`Race.fast_forward` off), with the default `RaceRNG`
+    """
+    return simulate_chunks(
+        scenario.track(),
+        scenario.cubes(),
+        races,
+        scenario.laps,
+        workers=workers,
+        chunk_size=1000,
+        seed=seed,
+        progress=False,
+        fast_forward=False,
+    )
+
+
+def _engine(**options) -> Engine:
+    def engine(scenario: Scenario, races: int, seed: int, workers: int | None = None):
+        return simulate_chunks(
+            scenario.track(),
+            scenario.cubes(),
+            races,
+            scenario.laps,
+            workers=workers,
+            seed=seed,
+            progress=False,
+            **options,
+        )
+
+    return engine
+
+
+# nb: engines and shortcuts that must reproduce the reference's distributions
+ALTERNATIVES: dict[str, Engine] = {
+    "object": _engine(),
+    "numpy": _engine(engine="numpy", chunk_size=10000),
+    "cube-streams": _engine(rng=CubeStreamsRNG),
+}
+
+
+def _pool(a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Merge adjacent cells of two histograms until each holds `MIN_CELL` races"""
+    cells_a, cells_b = [], []
+    total_a = total_b = 0
+
+    for x, y in zip(a.tolist(), b.tolist()):
+        total_a, total_b = total_a + x, total_b + y
+        if total_a + total_b >= MIN_CELL:
+            cells_a.append(total_a)
+            cells_b.append(total_b)
+            total_a = total_b = 0
+
+    if cells_a:
+        cells_a[-1] += total_a
+        cells_b[-1] += total_b
+    return np.asarray(cells_a, dtype=np.float64), np.asarray(cells_b, dtype=np.float64)
+
+
+def chi_square(a: np.ndarray, b: np.ndarray) -> tuple[float, int]:
+    """
+    Chi-square statistic (and degrees of freedom) of the test that two histograms
+    over the same ordered categories are samples of one distribution
+    """
+    a, b = _pool(np.asarray(a), np.asarray(b))
+    if len(a) < 2:
+        return 0.0, 0
+
+    n_a, n_b = a.sum(), b.sum()
+    cells = a + b
+    expected_a = cells * n_a / (n_a + n_b)
+    expected_b = cells * n_b / (n_a + n_b)
+
+    statistic = ((a - expected_a) ** 2 / expected_a + (b - expected_b) ** 2 / expected_b).sum()
+    return float(statistic), len(a) - 1
+
+
+def uniformity(ranks: RankAggregator) -> tuple[float, int]:
+    """
+    Chi-square statistic (and degrees of freedom) of the test that the ranked cubes
+    of identical races (see `SYMMETRIC`) take every rank equally often
+    """
+    ranked = [j for j in range(len(ranks.cubes)) if ranks.rankable[j]]
+    counts = ranks.counts[ranked][:, : len(ranked)].astype(np.float64)
+    if len(ranked) < 2 or ranks.count == 0:
+        return 0.0, 0
+
+    expected = counts.sum(axis=0) / len(ranked)
+    statistic = ((counts - expected) ** 2 / expected).sum()
+    return float(statistic), (len(ranked) - 1) ** 2
+
+
+def symmetric(scenario: Scenario) -> bool:
+    """Whether every cube of a scenario is the same, from the same starting line"""
+    return len(set(zip(scenario.lineup, scenario.offsets))) == 1
+
+
+# nb: the chi-square distribution by the Wilson-Hilferty approximation (the cube root
+#     of chi2 / dof is nearly normal), which is plenty for thresholds and needs no scipy
+
+
+def p_value(statistic: float, dof: int) -> float:
+    """Probability of a chi-square statistic at least this large on `dof` degrees of freedom"""
+    if dof == 0:
+        return 1.0
+    s = 2 / (9 * dof)
+    z = ((statistic / dof) ** (1 / 3) - (1 - s)) / math.sqrt(s)
+    return 1 - NormalDist().cdf(z)
+
+
+def threshold(alpha: float, dof: int) -> float:
+    """Chi-square statistic on `dof` degrees of freedom exceeded with probability `alpha`"""
+    if dof == 0:
+        return math.inf
+    s = 2 / (9 * dof)
+    z = NormalDist().inv_cdf(1 - alpha)
+    return dof * (1 - s + z * math.sqrt(s)) ** 3
+
+
+class Distributions:
+    """
+    What an engine's races of a scenario are compared on.
+
+    Attributes:
+        ranks: `RankAggregator` of the races (its `counts` are rank histograms).
+        turns: Number of races that took each number of turns.
+    """
+
+    def __init__(self, ranks: RankAggregator, turns: Counter):
+        self.ranks = ranks
+        self.turns = turns
+
+    @classmethod
+    def of(cls, scenario: Scenario, chunks: Iterator[dict[str, np.ndarray]]) -> Distributions:
+        distributions = cls(RankAggregator.from_cubes(scenario.cubes()), Counter())
+        for chunk in chunks:
+            distributions.ranks.update_ranks(chunk["rank"])
+            distributions.turns.update(chunk["turns"].tolist())
+        return distributions
+
+    def histograms(self) -> dict[str, np.ndarray]:
+        """Rank histogram per ranked cube (labelled by class, numbered if repeated), and turns"""
+        names = Counter(self.ranks.cubes)
+        seen: Counter = Counter()
+        histograms = {}
+
+        for j, name in enumerate(self.ranks.cubes):
+            seen[name] += 1
+            if self.ranks.rankable[j]:
+                label = f"{name} {seen[name]}" if names[name] > 1 else name
+                histograms[label] = self.ranks.counts[j]
+
+        histograms["turns"] = self._turns(max(self.turns, default=0))
+        return histograms
+
+    def _turns(self, longest: int) -> np.ndarray:
+        return np.asarray([self.turns[t] for t in range(1, longest + 1)], dtype=np.int64)
+
+
+class Comparison:
+    """
+    Chi-square tests of an alternative engine's rank distributions (one per ranked
+    cube) and turn-count distribution against the reference engine's.
+
+    On a scenario of identical cubes, the alternative's ranks are also tested
+    against equal shares (`uniformity`), which is far more sensitive than comparing
+    two samples. The tests of a comparison share `alpha` (Bonferroni), so an engine
+    that matches the reference fails a comparison with probability at most `alpha`.
+
+    Attributes:
+        scenario: Name of the compared scenario.
+        engine: Name of the alternative engine.
+        reference, alternative: The engines' `Distributions`.
+        alpha: Significance level of the whole comparison.
+        symmetric: Whether the scenario's cubes are identical (see `symmetric`).
+    """
+
+    def __init__(
+        self,
+        scenario: str,
+        engine: str,
+        reference: Distributions,
+        alternative: Distributions,
+        alpha: float = ALPHA,
+        symmetric: bool = False,
+    ):
+        self.scenario = scenario
+        self.engine = engine
+        self.reference = reference
+        self.alternative = alternative
+        self.alpha = alpha
+        self.symmetric = symmetric
+
+    def table(self) -> pd.DataFrame:
+        """Statistic, degrees of freedom, threshold and p-value of every test"""
+        reference = self.reference.histograms()
+        alternative = self.alternative.histograms()
+        alpha = self.alpha / (len(reference) + self.symmetric)
+
+        rows = {}
+        for name, a in reference.items():
+            b = alternative[name]
+            # nb: turn histograms can differ in length
+            longest = max(len(a), len(b))
+            a, b = np.pad(a, (0, longest - len(a))), np.pad(b, (0, longest - len(b)))
+
+            statistic, dof = chi_square(a, b)
+            rows[name] = {
+                "Chi-square": statistic,
+                "DoF": dof,
+                "Threshold": threshold(alpha, dof),
+                "p-value": p_value(statistic, dof),
+            }
+
+        if self.symmetric:
+            statistic, dof = uniformity(self.alternative.ranks)
+            rows["uniform"] = {
+                "Chi-square": statistic,
+                "DoF": dof,
+                "Threshold": threshold(alpha, dof),
+                "p-value": p_value(statistic, dof),
+            }
+
+        table = pd.DataFrame.from_dict(rows, orient="index")
+        table["Differs"] = table["Chi-square"] > table["Threshold"]
+        return table
+
+    @property
+    def equivalent(self) -> bool:
+        return not self.table()["Differs"].any()
+
+
+def compare(
+    scenario: Scenario,
+    engine: str | Engine,
+    races: int = 10000,
+    seed: int = 0,
+    alpha: float = ALPHA,
+    workers: int | None = None,
+    baseline: Distributions | None = None,
+) -> Comparison:
+    """
+    Run `races` races of `scenario` on the reference engine and on `engine` (a name
+    in `ALTERNATIVES`, or an `Engine`), and test whether their distributions differ.
+    The two engines are seeded differently, so their samples are independent.
+    `baseline` reuses reference distributions from an earlier comparison.
+
+    Comparing two samples only notices large differences; run the `SYMMETRIC`
+    scenario with a few hundred thousand races to notice a cube's P(rank=1) moving
+    by half a point.
+    """
+    name = engine if isinstance(engine, str) else getattr(engine, "__name__", "custom")
+    if isinstance(engine, str):
+        engine = ALTERNATIVES[engine]
+
+    if baseline is None:
+        baseline = Distributions.of(scenario, reference(scenario, races, seed, workers))
+    alternative = Distributions.of(scenario, engine(scenario, races, seed + 1, workers))
+
+    return Comparison(scenario.name, name, baseline, alternative, alpha, symmetric(scenario))
+
+
+def run(
+    selected: list[Scenario],
+    engines: list[str],
+    races: int,
+    seed: int = 0,
+    alpha: float = ALPHA,
+    workers: int | None = None,
+    progress: bool = True,
+) -> list[Comparison]:
+    """Compare every selected engine against the reference on every selected scenario"""
+    comparisons = []
+    for scenario in selected:
+        baseline = Distributions.of(scenario, reference(scenario, races, seed, workers))
+
+        for engine in engines:
+            comparison = compare(scenario, engine, races, seed, alpha, workers, baseline)
+            comparisons.append(comparison)
+            if progress:
+                verdict = "ok" if comparison.equivalent else "DIFFERS"
+                print(f"{scenario.name:<24} {engine:<12} {verdict}", file=sys.stderr)
+
+    return comparisons
+
+
+def summary(comparisons: list[Comparison]) -> pd.DataFrame:
+    """One row per comparison: its smallest p-value and the quantities that differ"""
+    rows = []
+    for comparison in comparisons:
+        table = comparison.table()
+        rows.append(
+            {
+                "scenario": comparison.scenario,
+                "engine": comparison.engine,
+                "min p-value": table["p-value"].min(),
+                "differs": ", ".join(table.index[table["Differs"]]),
+            }
+        )
+    return pd.DataFrame(rows).set_index(["scenario", "engine"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check that fast engines match the reference Race's distributions"
+    )
+    parser.add_argument("--races", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--engine", choices=list(ALTERNATIVES), nargs="+", default=list(ALTERNATIVES)
+    )
+    parser.add_argument(
+        "--scenario",
+        nargs="+",
+        default=["*"],
+        help="Glob patterns of the benchmark scenarios (and 'symmetric') to compare on, "
+        "e.g. 'cube:*'",
+    )
+    args = parser.parse_args()
+
+    selected = [
+        scenario
+        for scenario in [SYMMETRIC, *scenarios()]
+        if any(fnmatch.fnmatch(scenario.name, pattern) for pattern in args.scenario)
+    ]
+    comparisons = run(
+        selected, args.engine, args.races, args.seed, args.alpha, args.workers
+    )
+    print(summary(comparisons))
+
+    failed = [c for c in comparisons if not c.equivalent]
+    for comparison in failed:
+        print(f"\n{comparison.scenario} on {comparison.engine}:")
+        print(comparison.table())
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,408 @@
+from __future__ import annotations
+from collections import defaultdict
+from typing import Callable, Iterable, Iterator
+import copy
+import time
+
+import numpy as np
+import pandas as pd
+
+from cubes import Cube
+from race import Race, RaceState
+from simulation import simulate_chunks
+from track import Track
+
+
+# nb: states take about 1-5 ms each to expand (more for lineups with many skill
+#     chances), so the defaults give up on an exact answer within a minute or so
+MAX_STATES = 20_000
+TIME_LIMIT = 30.0
+
+
+class StateLimitExceeded(Exception):
+    """Raised when an exact evaluation needs more board states (or time) than allowed"""
+
+
+# --- Replaying Random Draws --- #
+
+
+def _next_choice(weights: tuple[float, ...], k: int) -> int | None:
+    """First choice after `k` that can actually happen"""
+    for j in range(k + 1, len(weights)):
+        if weights[j] > 0:
+            return j
+    return None
+
+
+class _Draw:
+    """
+    Stand-in for a `RaceRNG.random()` value. The rules only ever compare it against a
+    probability, so the comparison itself becomes a two-way branch.
+    """
+
+    __slots__ = ("replay",)
+
+    def __init__(self, replay: _Replay):
+        self.replay = replay
+
+    def __lt__(self, p: float) -> bool:
+        p = min(max(p, 0.0), 1.0)
+        return self.replay.choose((p, 1 - p)) == 0
+
+    def __ge__(self, p: float) -> bool:
+        return not self < p
+
+
+class _Replay:
+    """
+    Stand-in for a `RaceRNG`. Each run follows a path of choice indices (extending it with the first possible choice) and records
+    the weights of every draw, so `branches` can walk every path in turn.
+    """
+
+    def __init__(self):
+        self.path: list[int] = []
+        self.weights: list[tuple[float, ...]] = []
+        self.probability = 1.0
+
+    def begin(self, path: list[int]):
+        self.path = path
+        self.weights = []
+        self.probability = 1.0
+
+    def choose(self, weights: tuple[float, ...]) -> int:
+        n = len(self.weights)
+        if n == len(self.path):
+            self.path.append(_next_choice(weights, -1))
+        k = self.path[n]
+
+        self.weights.append(weights)
+        self.probability *= weights[k]
+        return k
+
+    def randint(self, a: int, b: int) -> int:
+        n = b - a + 1
+        return a + self.choose((1 / n,) * n)
+
+    def random(self) -> _Draw:
+        return _Draw(self)
+
+    def shuffle(self, x: list):
+        # nb: same swaps as RaceRNG.shuffle, so every permutation is one path
+        for i in reversed(range(1, len(x))):
+            j = self.choose((1 / (i + 1),) * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+    def branches(self, step: Callable[[], object]) -> Iterator[tuple[float, object]]:
+        """Run `step` once per combination of draws, yielding (probability, result)"""
+        path: list[int] = []
+
+        while True:
+            self.begin(path)
+            result = step()
+            yield self.probability, result
+
+            while path:
+                k = _next_choice(self.weights[len(path) - 1], path[-1])
+                if k is not None:
+                    path[-1] = k
+                    break
+                path.pop()
+            else:
+                return
+
+
+# --- Rank Distributions --- #
+
+
+class RankDistribution:
+    """
+    Distribution over the final rankings of a lineup.
+
+    Attributes:
+        cubes: Cube class names in lineup order.
+        rankable: Whether each cube is ranked (e.g. Abbowser is not).
+        rankings: Probability of each ranking, as a tuple of lineup indices best first.
+        exact: False when the distribution was estimated from simulated races.
+        count: Number of simulated races behind an estimate (0 when exact).
+        states: Number of board states evaluated (0 when estimated).
+    """
+
+    def __init__(
+        self,
+        cubes: list[str],
+        rankable: list[bool],
+        rankings: dict[tuple[int, ...], float],
+        exact: bool = True,
+        count: int = 0,
+        states: int = 0,
+    ):
+        self.cubes = cubes
+        self.rankable = rankable
+        self.rankings = rankings
+        self.exact = exact
+        self.count = count
+        self.states = states
+        self.num_ranks = sum(rankable)
+
+    @classmethod
+    def from_chunks(
+        cls, cubes: list[Cube], chunks: Iterable[dict[str, np.ndarray]]
+    ) -> RankDistribution:
+        """Estimate the distribution from simulation chunks (see `simulate_chunks`)"""
+        ranked = np.flatnonzero([cube.rankable for cube in cubes])
+        counts: dict[tuple[int, ...], int] = defaultdict(int)
+        count = 0
+
+        for chunk in chunks:
+            orders = ranked[np.argsort(chunk["rank"][:, ranked], axis=1)]
+            rows, n = np.unique(orders, axis=0, return_counts=True)
+            for row, k in zip(rows.tolist(), n.tolist()):
+                counts[tuple(row)] += k
+            count += len(orders)
+
+        return cls(
+            [cube.__class__.__name__ for cube in cubes],
+            [cube.rankable for cube in cubes],
+            {ranking: k / count for ranking, k in counts.items()},
+            exact=False,
+            count=count,
+        )
+
+    def probabilities(self) -> np.ndarray:
+        """`P[j, k]` is the probability that cube j finishes at rank k + 1"""
+        p = np.zeros((len(self.cubes), self.num_ranks))
+        for ranking, q in self.rankings.items():
+            p[list(ranking), range(len(ranking))] += q
+        return p
+
+    def mean(self) -> np.ndarray:
+        return self.probabilities() @ np.arange(1, self.num_ranks + 1)
+
+    def rank_probabilities(self) -> pd.DataFrame:
+        """P(rank=k) for every rank k per ranked cube, as `RankAggregator.rank_probabilities`"""
+        p = self.probabilities()
+
+        analysis = {
+            self.cubes[j]: {f"P(rank={k + 1})": p[j, k] for k in range(self.num_ranks)}
+            for j, rankable in enumerate(self.rankable)
+            if rankable
+        }
+        return pd.DataFrame(analysis).T.sort_values(by="P(rank=1)", ascending=False)
+
+
+# --- Exact Evaluation --- #
+
+
+# nb: the rules only tell turns apart until Abbowser starts moving in turn 3, so
+#     later turns share states (which is also why the chain can loop, e.g. a cube
+#     knocked back by a Blocker pad every turn).
+_TURN_HORIZON = 3
+
+
+def _canonical(state: RaceState, playing: bool = False) -> RaceState:
+    """
+    Drop the parts of a state that cannot change how the race continues, so states
+    that only differ there share a table entry. Rolls are always redrawn before use,
+    and between turns (`playing=False`) so is this turn's move order.
+    """
+    blank = (0,) * len(state.progress)
+    return RaceState(
+        order=state.order,
+        stacks=state.stacks,
+        progress=state.progress,
+        steps=blank,
+        base_roll=blank,
+        skills=state.skills,
+        turn=min(state.turn, _TURN_HORIZON),
+        order_this=state.order_this if playing else (),
+        order_next=state.order_next,
+    )
+
+
+class ExactEvaluator:
+    """
+    Exact final ranking probabilities for small lineups and short tracks.
+
+    The race is treated as an absorbing Markov chain over canonical `RaceState`s,
+    taken both between turns and once the move orders are decided (see
+    `Race.begin_turn`), with final rankings as the absorbing states. Each state is
+    expanded once over all outcomes of its dice rolls, skill chances and shuffles
+    and memoized in a transposition table, then the chain is solved to within
+    `tolerance` (it can loop, so it is solved by iteration rather than recursion).
+
+    Raises `StateLimitExceeded` once more than `max_states` states are needed, or
+    once expanding them has taken more than `time_limit` seconds (None for no limit).
+    """
+
+    def __init__(
+        self,
+        track: Track,
+        cubes: list[Cube],
+        laps: int = 1,
+        max_states: int = MAX_STATES,
+        tolerance: float = 1e-14,
+        time_limit: float | None = TIME_LIMIT,
+    ):
+        track, cubes = copy.deepcopy((track, cubes))
+        self.race = Race(track, cubes.copy(), laps)
+        self.max_states = max_states
+        self.tolerance = tolerance
+        self.time_limit = time_limit
+        self._deadline: float | None = None
+
+        self._replay = _Replay()
+        self.race.rng = self._replay
+        self._index = {cube: j for j, cube in enumerate(self.race.lineup)}
+
+        # nb: the transposition table numbers every state and ranking seen so far;
+        #     transitions are kept as (from, to, probability) triples.
+        self._states: dict[tuple[bool, RaceState], int] = {}
+        self._rankings: dict[tuple[int, ...], int] = {}
+        self._moves: list[tuple[int, int, float]] = []
+        self._finishes: list[tuple[int, int, float]] = []
+
+    def evaluate(self, state: RaceState | None = None) -> RankDistribution:
+        """
+        Distribution of final rankings from the start of a race, or from `state`
+        (a `Race.snapshot()` between turns over the same lineup, e.g. after
+        `Race.setup`).
+        """
+        if self.time_limit is not None:
+            self._deadline = time.monotonic() + self.time_limit
+
+        if state is None:
+            starts = self._outcomes(self._start)
+        else:
+            starts = {((False, _canonical(state)), None): 1.0}
+
+        self._explore([key for key, _ in starts])
+
+        absorbed = self._solve()
+        rankings = list(self._rankings)
+        distribution: dict[tuple[int, ...], float] = defaultdict(float)
+
+        for (key, _), p in starts.items():
+            for r, q in enumerate(absorbed[self._states[key]].tolist()):
+                if q > 0:
+                    distribution[rankings[r]] += p * q
+
+        lineup = self.race.lineup
+        return RankDistribution(
+            [cube.__class__.__name__ for cube in lineup],
+            [cube.rankable for cube in lineup],
+            dict(distribution),
+            states=len(self._states),
+        )
+
+    def _outcomes(self, step: Callable[[], tuple]) -> dict[tuple, float]:
+        """Total probability of each distinct result of `step` over all its draws"""
+        outcomes: dict[tuple, float] = defaultdict(float)
+        for p, outcome in self._replay.branches(step):
+            outcomes[outcome] += p
+        return outcomes
+
+    def _start(self) -> tuple:
+        # nb: mirrors a simulated race: shuffle the lineup, then reset
+        race = self.race
+        race.cubes[:] = race.lineup
+        race.rng.shuffle(race.cubes)
+        race.reset()
+        return (False, _canonical(race.snapshot())), None
+
+    def _step(self, playing: bool, state: RaceState) -> tuple:
+        """
+        Run one phase of a turn from `state`, returning `(next key, None)`, or
+        `(None, final ranking)` if the race ends.
+        """
+        race = self.race
+        race.restore(state)
+
+        if not playing:
+            race.begin_turn()
+            return (True, _canonical(race.snapshot(), playing=True)), None
+
+        if race.play_turn():
+            return None, tuple(self._index[cube] for cube in race.compute_rankings())
+        return (False, _canonical(race.snapshot())), None
+
+    def _number(self, key: tuple[bool, RaceState]) -> int:
+        if len(self._states) >= self.max_states:
+            raise StateLimitExceeded(f"More than {self.max_states} board states")
+        self._states[key] = len(self._states)
+        return self._states[key]
+
+    def _explore(self, keys: list[tuple[bool, RaceState]]):
+        """Expand every state reachable from `keys` that is not in the table yet"""
+        pending = [key for key in dict.fromkeys(keys) if key not in self._states]
+        for key in pending:
+            self._number(key)
+
+        while pending:
+            if self._deadline is not None and time.monotonic() > self._deadline:
+                raise StateLimitExceeded(
+                    f"Gave up after {self.time_limit}s and {len(self._states)} board states"
+                )
+
+            key = pending.pop()
+            i = self._states[key]
+
+            for (next_key, ranking), p in self._outcomes(lambda: self._step(*key)).items():
+                if next_key is None:
+                    r = self._rankings.setdefault(ranking, len(self._rankings))
+                    self._finishes.append((i, r, p))
+                    continue
+
+                if (j := self._states.get(next_key)) is None:
+                    j = self._number(next_key)
+                    pending.append(next_key)
+                self._moves.append((i, j, p))
+
+    def _solve(self) -> np.ndarray:
+        """`absorbed[i, r]`: probability that state i ends the race with ranking r"""
+        finishes = np.zeros((len(self._states), len(self._rankings)))
+        for i, r, p in self._finishes:
+            finishes[i, r] += p
+
+        if not self._moves:
+            return finishes
+        rows, cols, p = (np.array(column) for column in zip(*self._moves))
+
+        # nb: the k-th iterate is the probability of finishing within k phases, which
+        #     only grows, so it has converged once an iteration adds (almost) nothing
+        absorbed = finishes
+        while True:
+            step = finishes.copy()
+            np.add.at(step, rows, p[:, None] * absorbed[cols])
+            converged = np.abs(step - absorbed).max() <= self.tolerance
+            absorbed = step
+            if converged:
+                return absorbed
+
+
+def evaluate(
+    track: Track,
+    cubes: list[Cube],
+    laps: int = 1,
+    state: RaceState | None = None,
+    max_states: int = MAX_STATES,
+    fallback_races: int = 100_000,
+    time_limit: float | None = TIME_LIMIT,
+    **kwargs,
+) -> RankDistribution:
+    """
+    Exact final ranking distribution of a lineup (see `ExactEvaluator`), falling back
+    to simulating `fallback_races` races when the state space is too large or takes
+    longer than `time_limit` seconds to expand. The fallback takes the same options
+    as `simulate_chunks`; pass `fallback_races=0` to raise `StateLimitExceeded`
+    instead.
+    """
+    try:
+        evaluator = ExactEvaluator(track, cubes, laps, max_states, time_limit=time_limit)
+        return evaluator.evaluate(state)
+    except StateLimitExceeded:
+        if not fallback_races:
+            raise
+
+    kwargs.setdefault("progress", False)
+    chunks = simulate_chunks(track, cubes, fallback_races, laps, state=state, **kwargs)
+    return RankDistribution.from_chunks(cubes, chunks)
@@ -1,12 +1,61 @@
-import pickle
-from tqdm import tqdm
+import argparse
+import os
 
-from race import Race
+from shards import run_shard
+from simulation import simulate_to_store, simulate_until
 from track import Track, ThrusterPad, BlockerPad, SpatialRiftPad
 from cubes import *
 
 if __name__ == "__main__":
-    num_simulation = 100000
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--races", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--engine", choices=["object", "numpy"], default="object")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=None,
+        help="Stop once every P(rank=1) and mean rank CI half-width is within this "
+        "tolerance, using --races as the budget. Prints a summary instead of "
+        "writing the history store.",
+    )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        help="Also record a trace of every race to this directory (see traces.py)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run (same options and seed) instead of starting over",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=60.0,
+        help="With --tolerance, seconds between two saves of checkpoint.json",
+    )
+    parser.add_argument(
+        "--shard",
+        default=None,
+        metavar="I/N",
+        help="Only simulate shard I of N of the races (needs --seed) and save their "
+        "partial result to --output, for shards.py to merge",
+    )
+    parser.add_argument("--output", default=None, help="With --shard, the partial result file")
+    args = parser.parse_args()
+
+    if args.shard is not None and args.seed is None:
+        parser.error("--shard needs a --seed shared by every shard")
+    # nb: only the history store is traced, which --tolerance and --shard do not write
+    if args.trace is not None and args.tolerance is not None:
+        parser.error("--trace cannot be combined with --tolerance")
+    if args.trace is not None and args.shard is not None:
+        parser.error("--trace cannot be combined with --shard")
+
+    num_simulation = args.races
     laps: int = 1
 
     track = Track.create(
@@ -32,19 +81,48 @@ if __name__ == "__main__":
         Hiyuki(1),
         Aemeath(1),
     ]
-    race = Race(track, cubes, laps)
 
     # ---
 
-    rank_history = {cube.__class__.__name__: [] for cube in cubes}
+    options = {
+        "workers": args.workers,
+        "seed": args.seed,
+        "engine": args.engine,
+        "chunk_size": args.chunk_size,
+    }
 
-    for i in tqdm(range(num_simulation)):
-        random.shuffle(race.cubes)
-        race.reset()
-        race.start()
+    if args.shard is not None:
+        shard, num_shards = map(int, args.shard.split("/"))
+        output = args.output or f"shard-{shard}-of-{num_shards}.json"
 
-        for i, cube in enumerate(race.compute_rankings()):
-            rank_history[cube.__class__.__name__].append(i + 1)
+        partial = run_shard(track, cubes, num_simulation, shard, num_shards, laps=laps, **options)
+        partial.save(output)
+        print(f"Saved races [{partial.start}, {partial.stop}) to {output}")
+    elif args.tolerance is None:
+        simulate_to_store(
+            "history",
+            track,
+            cubes,
+            num_simulation,
+            laps,
+            trace_path=args.trace,
+            resume=args.resume,
+            **options,
+        )
+    else:
+        if not args.resume and os.path.exists("checkpoint.json"):
+            os.remove("checkpoint.json")
 
-    with open(f"history.pkl", "wb") as fp:
-        pickle.dump(rank_history, fp)
+        aggregator = simulate_until(
+            track,
+            cubes,
+            args.tolerance,
+            laps,
+            max_races=num_simulation,
+            checkpoint="checkpoint.json",
+            checkpoint_interval=args.checkpoint_interval,
+            **options,
+        )
+        print(f"Used {aggregator.count} of {num_simulation} races")
+        print(aggregator.confidence_intervals())
+        print(aggregator.summary())
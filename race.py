@@ -1,21 +1,170 @@
-import random
+from typing import Callable
+import bisect
 
 from cubes import Cube
+from rng import AttributedRNG, RaceRNG
+from stats import RaceStats
 from track import Pad, Track
 
+CUBE_HOOKS = (
+    "on_turn_start",
+    "on_before_move",
+    "on_after_move",
+    "on_turn_end",
+    "on_enter_pad",
+    "on_encounter",
+)
+PAD_HOOKS = ("on_turn_start", "on_land", "on_turn_end")
+
+
+def overrides_hook(obj: Cube | Pad, base: type, hook: str) -> bool:
+    """Whether `obj` replaces the no-op `base` hook, in its class or on the instance"""
+    return getattr(type(obj), hook) is not getattr(base, hook) or hook in vars(obj)
+
+
+def _invoke(obj: Cube | Pad, hook: str, *args):
+    return getattr(obj, hook)(*args)
+
+
+class RaceState:
+    """
+    Compact, immutable copy of everything that changes during a race, with cubes
+    referred to by their index in `Race.lineup`. Take one with `Race.snapshot()`
+    and put it back with `Race.restore()`.
+
+    Attributes:
+        order: Lineup indices in `Race.cubes` order (the order is shuffled per race).
+        stacks: `(pad index, lineup indices bottom to top)` for every occupied pad.
+        progress, steps, base_roll: Per-cube values in lineup order.
+        skills: Per-cube tuples of the attributes named by `Cube.state_attrs`.
+        turn: The current turn number.
+        order_this, order_next: Lineup indices in this and next turn's move order.
+    """
+
+    __slots__ = (
+        "order",
+        "stacks",
+        "progress",
+        "steps",
+        "base_roll",
+        "skills",
+        "turn",
+        "order_this",
+        "order_next",
+    )
+
+    def __init__(
+        self,
+        order: tuple[int, ...],
+        stacks: tuple[tuple[int, tuple[int, ...]], ...],
+        progress: tuple[int, ...],
+        steps: tuple[int, ...],
+        base_roll: tuple[int, ...],
+        skills: tuple[tuple, ...],
+        turn: int,
+        order_this: tuple[int, ...],
+        order_next: tuple[int, ...],
+    ):
+        self.order = order
+        self.stacks = stacks
+        self.progress = progress
+        self.steps = steps
+        self.base_roll = base_roll
+        self.skills = skills
+        self.turn = turn
+        self.order_this = order_this
+        self.order_next = order_next
+
+    def key(self) -> tuple:
+        return tuple(getattr(self, attr) for attr in self.__slots__)
+
+    @classmethod
+    def from_key(cls, key: tuple | list) -> "RaceState":
+        """Inverse of `key()`, also taking its JSON round trip (lists for tuples)"""
+        order, stacks, progress, steps, base_roll, skills, turn, order_this, order_next = key
+        return cls(
+            tuple(order),
+            tuple((p, tuple(stack)) for p, stack in stacks),
+            tuple(progress),
+            tuple(steps),
+            tuple(base_roll),
+            tuple(tuple(values) for values in skills),
+            turn,
+            tuple(order_this),
+            tuple(order_next),
+        )
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, RaceState) and self.key() == other.key()
+
+    def __hash__(self) -> int:
+        return hash(self.key())
+
+    def __repr__(self):
+        fields = ", ".join(f"{attr}={getattr(self, attr)!r}" for attr in self.__slots__)
+        return f"RaceState({fields})"
+
 
 class Race:
-    def __init__(self, track: Track, cubes: list[Cube], laps: int = 1):
+    # nb: jump cubes straight to where they end up when no hook could see the
+    #     individual steps; turn off to compare against the step-wise path
+    fast_forward: bool = True
+
+    def __init__(
+        self,
+        track: Track,
+        cubes: list[Cube],
+        laps: int = 1,
+        debug: bool = False,
+        rng: RaceRNG | None = None,
+        stats: RaceStats | None = None,
+    ):
         self.track = track
         self.cubes = cubes
         self.laps = laps
+        self.debug = debug
+
+        # nb: every random draw of the race, its cubes and its pads comes from here
+        self.rng = rng if rng is not None else RaceRNG()
+
+        # nb: an AttributedRNG is told which cube draws, so the hooks then go through
+        #     the dispatched path (as with stats) to set it around each call
+        self._attributed = isinstance(self.rng, AttributedRNG)
+
+        # nb: optional instrumentation, off (None) by default since every
+        #     instrumented point checks it
+        self.stats = stats
+
+        # nb: the lineup fixes each cube's index in a RaceState, while `cubes` is
+        #     reshuffled between races.
+        self.lineup: tuple[Cube, ...] = tuple(cubes)
+        self._index: dict[Cube, int] = {cube: j for j, cube in enumerate(self.lineup)}
 
         self.turn: int
         self.cubes_order_next_turn: list[Cube]
         self.cubes_order_this_turn: list[Cube]
         self.max_progress: int
 
-        self._ranking_cache: list[Cube] | None = None
+        # nb: authoritative cube -> (pad index, stack index) lookup, kept in sync with
+        #     the pads' cube lists by every method that changes a stack.
+        self._locations: dict[Cube, tuple[int, int]] = {}
+
+        # nb: rankable cubes on the track, best first, with their negated (progress,
+        #     stack index) keys in a parallel list for `rank_of` to bisect. Moves only
+        #     flag the ranking as stale and the next query re-sorts it: a race makes
+        #     about one query per turn against dozens of single-pad steps, so keeping
+        #     the order up to date on every move costs more than it saves.
+        self._ranking: list[Cube] = []
+        self._rank_keys: list[tuple[int, int]] = []
+        self._ranked_at: dict[Cube, tuple[int, int]] = {}
+        self._stale: bool = False
+
+        # nb: per-hook subscribers, so turns only dispatch to the skills and pads that
+        #     do something rather than to every cube and every pad of the track
+        self._cube_hooks: dict[str, set[Cube]] = {}
+        self._pad_hooks: dict[str, list[Pad] | set[Pad]] = {}
+        self._hooks_for: tuple | None = None
+        self.rng.attach(self)
         self.reset()
 
     def __repr__(self):
@@ -23,6 +172,9 @@ class Race:
 
     def reset(self):
         self.track.reset()
+        self._locations.clear()
+        self._clear_rankings()
+        self.subscribe()
 
         for cube in self.cubes:
             cube.reset()
@@ -35,85 +187,417 @@ class Race:
         self.cubes_order_this_turn = self.cubes_order_next_turn.copy()
         self.max_progress = self.track.length * self.laps
 
+    # --- Hooks --- #
+
+    def subscribe(self):
+        """
+        Build the dispatch tables of the cubes and pads that override each hook.
+        `reset` and `setup` call this, and only rebuild the tables if the cubes or
+        pads have changed; call it after patching a hook on an instance mid-race.
+        Replaced pads also recompile the track's landing chains (`Track.compile`).
+        """
+        pads = tuple(self.track.pads)
+        key = (frozenset(self.cubes), pads)
+        if key == self._hooks_for:
+            return
+
+        # nb: fast-forwarding follows `Track.landings`, which must describe these pads
+        if self._hooks_for is None or self._hooks_for[1] != pads:
+            self.track.compile()
+
+        self._cube_hooks = {
+            hook: {cube for cube in self.cubes if overrides_hook(cube, Cube, hook)}
+            for hook in CUBE_HOOKS
+        }
+        self._pad_hooks = {
+            hook: [pad for pad in self.track.pads if overrides_hook(pad, Pad, hook)]
+            for hook in PAD_HOOKS
+        }
+        # nb: turn hooks run in track order, but landings only ask whether the pad
+        #     subscribes, which a set answers without scanning every special pad
+        self._pad_hooks["on_land"] = set(self._pad_hooks["on_land"])
+        self._hooks_for = key
+
+    # --- Race State --- #
+
+    def setup(
+        self,
+        stacks: dict[int, list[Cube]],
+        turn: int = 0,
+        move_order: list[Cube] | None = None,
+        skills: dict[Cube, dict[str, object]] | None = None,
+    ):
+        """
+        Place the cubes from an explicit board instead of their offsets, e.g. to
+        predict a race that is already under way.
+
+        Args:
+            stacks: Cubes bottom to top keyed by progress. Every cube of the race must
+                be placed exactly once.
+            turn: Number of turns already played; the race continues with turn + 1.
+            move_order: Move order of the next turn, as already adjusted by skills such
+                as Augusta's or Changli's. Rolled afresh at the start of the next turn
+                (and so separately in every fork) if omitted.
+            skills: Skill state per cube, e.g. `{aemeath: {"skill_triggered": True}}`.
+                Keys must be in the cube's `state_attrs`; the rest start from `reset`.
+        """
+        everyone = sorted(map(id, self.cubes))
+        placed = [cube for stack in stacks.values() for cube in stack]
+        if sorted(map(id, placed)) != everyone:
+            raise ValueError("Every cube of the race must be placed exactly once")
+        if move_order is not None and sorted(map(id, move_order)) != everyone:
+            raise ValueError("The move order must list every cube of the race once")
+
+        self.track.reset()
+        self._locations.clear()
+        self._clear_rankings()
+        self.subscribe()
+
+        for cube in self.cubes:
+            cube.reset()
+
+        for cube, state in (skills or {}).items():
+            for attr, value in state.items():
+                if attr not in cube.state_attrs:
+                    raise ValueError(f"{cube.__class__.__name__} has no skill state {attr!r}")
+                setattr(cube, attr, value)
+
+        for progress, stack in stacks.items():
+            for cube in stack:
+                self.push_cube(cube, progress)
+
+        self.turn = turn
+        self.cubes_order_next_turn = list(move_order) if move_order is not None else []
+        self.cubes_order_this_turn = self.cubes_order_next_turn.copy()
+        self.max_progress = self.track.length * self.laps
+
+    def snapshot(self) -> RaceState:
+        """Copy the current race state (see `RaceState`)"""
+        index = self._index
+        lineup = self.lineup
+        pads = self.track.pads
+
+        return RaceState(
+            order=tuple([index[c] for c in self.cubes]),
+            stacks=tuple(
+                [(p, tuple([index[c] for c in pads[p].cubes])) for p in self._occupied()]
+            ),
+            progress=tuple([c.progress for c in lineup]),
+            steps=tuple([c.steps for c in lineup]),
+            base_roll=tuple([c.base_roll for c in lineup]),
+            skills=tuple([tuple([getattr(c, a) for a in c.state_attrs]) for c in lineup]),
+            turn=self.turn,
+            order_this=tuple([index[c] for c in self.cubes_order_this_turn]),
+            order_next=tuple([index[c] for c in self.cubes_order_next_turn]),
+        )
+
+    def restore(self, state: RaceState):
+        """Put the race back into a state taken by `snapshot()`, in place"""
+        lineup = self.lineup
+        self._clear_stacks()
+
+        for cube, progress, steps, base_roll, skills in zip(
+            lineup, state.progress, state.steps, state.base_roll, state.skills
+        ):
+            cube.progress = progress
+            cube.steps = steps
+            cube.base_roll = base_roll
+            for attr, value in zip(cube.state_attrs, skills):
+                setattr(cube, attr, value)
+
+        for p, stack in state.stacks:
+            cubes = self.track.pads[p].cubes
+            for i, j in enumerate(stack):
+                cubes.append(lineup[j])
+                self._locations[lineup[j]] = (p, i)
+        self._stale = True
+
+        self.cubes[:] = [lineup[j] for j in state.order]
+        self.cubes_order_this_turn = [lineup[j] for j in state.order_this]
+        self.cubes_order_next_turn = [lineup[j] for j in state.order_next]
+        self.turn = state.turn
+
+    def _clear_stacks(self):
+        # nb: only the occupied pads need clearing, which is what keeps restore cheap
+        for p in self._occupied():
+            self.track.pads[p].clear()
+        self._locations.clear()
+        self._clear_rankings()
+
+    def _occupied(self) -> list[int]:
+        """Indices of the pads holding cubes, in track order"""
+        return sorted({p for p, _ in self._locations.values()})
+
     # --- Cube Positioning --- #
 
     def move_cube_one_step(self, cube: Cube, forward: bool = True):
-        self._ranking_cache = None
         p, i = self.locate_cube(cube)
+        pads = self.track.pads
 
         steps = 1 if forward else -1
         destination = max(0, min(cube.progress + steps, self.max_progress))
-        destination_p = destination % self.track.length
+        destination_p = destination % len(pads)
         steps = destination - cube.progress
 
-        cubes_to_move = self.track.pads[p].cubes[i:]
-        cubes_remaining = self.track.pads[p].cubes[:i]
-        cubes_at_dest = self.track.pads[destination_p].cubes.copy()
+        encounters = self._cube_hooks["on_encounter"]
+
+        source = pads[p]
+        cubes_to_move = source.cubes[i:]
+        cubes_at_dest = pads[destination_p].cubes.copy() if encounters else ()
 
         for c in cubes_to_move:
             c.progress += steps
 
-        self.track.pads[p].cubes = cubes_remaining
-        self.track.pads[destination_p].cubes += cubes_to_move
+        source.cubes = source.cubes[:i]
+        first_moved = len(pads[destination_p].cubes)
+        pads[destination_p].cubes += cubes_to_move
+        self.reindex_pad(destination_p, first_moved)
+
+        if self.stats is not None or self._attributed:
+            self._encounters_dispatched(cubes_to_move, cubes_at_dest)
+            cubes_at_dest = ()
 
         for c_dest in cubes_at_dest:
             for c_move in cubes_to_move:
-                c_move.on_encounter(self, c_dest)
-                c_dest.on_encounter(self, c_move)
+                if c_move in encounters:
+                    c_move.on_encounter(self, c_dest)
+                if c_dest in encounters:
+                    c_dest.on_encounter(self, c_move)
 
         return self.find_winner()
 
+    def _encounters_dispatched(self, cubes_to_move: list[Cube], cubes_at_dest: list[Cube]):
+        encounters = self._cube_hooks["on_encounter"]
+        stats = self.stats
+        call = self._call
+
+        for c_dest in cubes_at_dest:
+            for c_move in cubes_to_move:
+                if c_move in encounters:
+                    if stats is not None:
+                        stats.encounters += 1
+                    call(c_move, "on_encounter", self, c_dest)
+                if c_dest in encounters:
+                    if stats is not None:
+                        stats.encounters += 1
+                    call(c_dest, "on_encounter", self, c_move)
+
     def move_cube_with_steps(self, cube: Cube, steps: int):
         # print(f"{cube.__class__.__name__} moves {steps}.")
 
+        stats = self.stats
+        enters_pad = cube in self._cube_hooks["on_enter_pad"]
+        dispatched = stats is not None or self._attributed
+
+        if stats is not None:
+            stats.move(cube, steps)
+
+        if self.fast_forward and not enters_pad:
+            moves = (1,) * steps if steps > 0 else (-1,) * -steps
+            destination = self._walk(cube, moves)
+
+            if destination is not None:
+                if stats is not None and steps:
+                    stats.fast_forwards += 1
+                if steps:
+                    self._jump(cube, destination)
+                    if winner := self.find_winner():
+                        return winner
+                return self._land(cube)
+
         while steps > 0:
             if winner := self.move_cube_one_step(cube, forward=True):
                 return winner
-            cube.on_enter_pad(self, final_step=steps == 1)
+            if enters_pad and not dispatched:
+                cube.on_enter_pad(self, final_step=steps == 1)
+            elif enters_pad:
+                self._call(cube, "on_enter_pad", self, steps == 1)
             steps -= 1
 
         while steps < 0:
             if winner := self.move_cube_one_step(cube, forward=False):
                 return winner
-            cube.on_enter_pad(self, final_step=steps == -1)
+            if enters_pad and not dispatched:
+                cube.on_enter_pad(self, final_step=steps == -1)
+            elif enters_pad:
+                self._call(cube, "on_enter_pad", self, steps == -1)
             steps += 1
 
+        return self._land(cube)
+
+    def _land(self, cube: Cube):
+        """Trigger the landing pad, following Thruster/Blocker chains via `Track.landings`"""
+        stats = self.stats
         p, i = self.locate_cube(cube)
-        self.track.pads[p].on_land(cube, self)
+        moves = self.track.landings[p]
+
+        # nb: a cube with an encounter skill on the track could meet a cube on any pad
+        #     of the chain, so the pads are stepped through rather than walked first
+        if (
+            moves
+            and self.fast_forward
+            and not self._cube_hooks["on_encounter"]
+            and cube not in self._cube_hooks["on_enter_pad"]
+        ):
+            destination = self._walk(cube, moves)
+
+            # nb: a chain cut short at the finish line is left to the pads themselves
+            if destination is not None and destination == cube.progress + sum(moves):
+                if stats is not None:
+                    stats.fast_forwards += 1
+                    for move in moves:
+                        stats.land(self.track.pads[p], cube)
+                        p = (p + move) % self.track.length
+
+                self._jump(cube, destination)
+                if winner := self.find_winner():
+                    return winner
+                p = destination % self.track.length
+
+        pad = self.track.pads[p]
+        if pad in self._pad_hooks["on_land"]:
+            if stats is not None:
+                stats.land(pad, cube)
+            if stats is None and not self._attributed:
+                pad.on_land(cube, self)
+            else:
+                self._call(pad, "on_land", cube, self)
 
         return self.find_winner()
 
+    def _walk(self, cube: Cube, moves: tuple[int, ...]) -> int | None:
+        """
+        Progress `cube` reaches after one-pad `moves`, or None if the step-wise path
+        could differ: a cube on the way would see an encounter, a step is clamped at
+        the start line, or a carried cube could finish first.
+        """
+        encounters = bool(self._cube_hooks["on_encounter"])
+        pads = self.track.pads
+        length = len(pads)
+        max_progress = self.max_progress
+        position = highest = cube.progress
+
+        for move in moves:
+            step = max(0, min(position + move, max_progress))
+
+            # nb: a cube stuck at either end moves onto its own pad every step, and
+            #     one clamped from a negative progress drags its stack along
+            if step != position + move and (step != position or step == 0 or encounters):
+                return None
+            if encounters and pads[step % length].cubes:
+                return None
+            if position > highest:
+                highest = position
+            position = step
+
+        # nb: cubes carried along with a different progress (e.g. a lap ahead) could
+        #     finish part-way, which ends the race before `cube` gets there
+        p, i = self.locate_cube(cube)
+        for c in pads[p].cubes[i + 1 :]:
+            if c.rankable and c.progress - cube.progress + highest >= max_progress:
+                return None
+
+        return position
+
+    def _jump(self, cube: Cube, destination: int):
+        """Move `cube` and the cubes above it straight to progress `destination`"""
+        p, i = self.locate_cube(cube)
+        pads = self.track.pads
+
+        cubes = pads[p].cubes
+        cubes_to_move = cubes[i:]
+        del cubes[i:]
+
+        steps = destination - cube.progress
+        for c in cubes_to_move:
+            c.progress += steps
+
+        destination_p = destination % len(pads)
+        first_moved = len(pads[destination_p].cubes)
+        pads[destination_p].cubes += cubes_to_move
+        self.reindex_pad(destination_p, first_moved)
+
     def move_cube(self, cube: Cube):
         return self.move_cube_with_steps(cube, cube.steps)
 
     def push_cube(self, cube: Cube, position: int):
-        self._ranking_cache = None
-        self.track.pads[position % self.track.length].cubes.append(cube)
+        p = position % self.track.length
+        self.track.pads[p].cubes.append(cube)
+        self._locations[cube] = (p, len(self.track.pads[p].cubes) - 1)
+        self._stale = True
         cube.progress = position
 
     def remove_cube(self, cube: Cube, position: int):
-        self._ranking_cache = None
-        self.track.pads[position % self.track.length].cubes.remove(cube)
+        p, i = self._locations.pop(cube)
+        self.track.pads[p].cubes.pop(i)
+        self.reindex_pad(p, i)
         cube.progress = 0
 
     def insert_cube(self, cube: Cube, position: int, index: int):
-        self._ranking_cache = None
-        self.track.pads[position % self.track.length].cubes.insert(index, cube)
+        p = position % self.track.length
+        self.track.pads[p].cubes.insert(index, cube)
+        self.reindex_pad(p, max(index, 0))
         cube.progress = position
 
+    def move_within_stack(self, cube: Cube, index: int):
+        """Move a cube to another stack index on its current pad (0 is the bottom, -1 the top)"""
+        p, i = self.locate_cube(cube)
+        cubes = self.track.pads[p].cubes
+        cubes.pop(i)
+
+        if index < 0:
+            index += len(cubes) + 1
+        cubes.insert(index, cube)
+        self.reindex_pad(p, min(i, index))
+
+    def clear_pad(self, p: int):
+        """Take every cube off pad `p`, leaving their progress untouched"""
+        for cube in self.track.pads[p].cubes:
+            del self._locations[cube]
+        self._stale = True
+        self.track.pads[p].clear()
+
+    def reindex_pad(self, p: int, start: int = 0):
+        """
+        Refresh the location index for pad `p` from stack index `start` upwards.
+        Call this after rewriting `track.pads[p].cubes` directly (e.g. reordering it).
+        """
+        cubes = self.track.pads[p].cubes
+        locations = self._locations
+        for i in range(start, len(cubes)):
+            locations[cubes[i]] = (p, i)
+        self._stale = True
+
     # --- Race Logic --- #
 
     def decide_move_orders(self):
         # nb: The move order selection is not clearly defined in the game rules.
         #     However, based on Sigrika's in-game skill descriptions, it appears that
         #     dice roll values are used to select the move order for each turn.
-        # nb: We add a random tiebraker to avoid biased orders towards cubes earlier in the list.
-        for cube in self.cubes:
-            cube.roll()
-
-        return sorted(
-            self.cubes, key=lambda c: (c.steps, random.random()), reverse=True
-        )
+        # nb: We shuffle tied cubes to avoid biased orders towards cubes earlier in the list.
+        #     Shuffling only the ties (rather than sorting on a random key) keeps the
+        #     draws discrete, which the exact evaluator relies on.
+        if self._attributed:
+            for cube in self.cubes:
+                self._call(cube, "roll", self, timed=False)
+        else:
+            for cube in self.cubes:
+                cube.roll(self)
+
+        orders = sorted(self.cubes, key=lambda c: c.steps, reverse=True)
+
+        i = 0
+        while i < len(orders):
+            j = i + 1
+            while j < len(orders) and orders[j].steps == orders[i].steps:
+                j += 1
+            if j - i > 1:
+                tied = orders[i:j]
+                self.rng.shuffle(tied)
+                orders[i:j] = tied
+            i = j
+
+        return orders
 
     def find_winner(self) -> Cube | None:
         """
@@ -129,61 +613,225 @@ class Race:
         """
         Get the cube's current position on the track as a tuple of (pad index, stack index)
         """
-        p = cube.relative_position(self.track.length)
-        return (p, self.track.pads[p].cubes.index(cube))
+        if self.debug:
+            self.check_locations()
+        return self._locations[cube]
+
+    def check_locations(self):
+        """Assert that the location index matches the pads' cube lists"""
+        on_track = {}
+        for p, pad in enumerate(self.track.pads):
+            for i, cube in enumerate(pad.cubes):
+                assert cube.relative_position(self.track.length) == p, (cube, p)
+                on_track[cube] = (p, i)
+        assert on_track == self._locations, (on_track, self._locations)
 
     def compute_rankings(self) -> list[Cube]:
         """
         Get the current ranks of all cubes in the race based on their progress.
         If multiple cubes have the same progress, the cube on the top of the stack ranks higher.
+
+        The list is updated in place as cubes move; copy it to keep a ranking.
         """
-        if self._ranking_cache is None:
-            self._ranking_cache = sorted(
-                [c for c in self.cubes if c.rankable],
-                key=lambda c: (c.progress, self.locate_cube(c)[1]),
-                reverse=True,
-            )
-        return self._ranking_cache
+        if self.stats is not None:
+            if self._stale:
+                self.stats.ranking_misses += 1
+            else:
+                self.stats.ranking_hits += 1
+
+        if self._stale:
+            self._rerank()
+        if self.debug:
+            self.check_rankings()
+        return self._ranking
+
+    def rank_of(self, cube: Cube) -> int:
+        """Index of a ranked cube in `compute_rankings()`, found by bisection"""
+        self.compute_rankings()
+        return bisect.bisect_left(self._rank_keys, self._ranked_at[cube])
+
+    def _rerank(self):
+        """Sort the cubes on the track after they moved"""
+        locations = self._locations
+        entries = sorted([((-c.progress, -locations[c][1]), c) for c in locations if c.rankable])
+
+        self._ranking[:] = [cube for _, cube in entries]
+        self._rank_keys[:] = [key for key, _ in entries]
+        self._ranked_at = dict(zip(self._ranking, self._rank_keys))
+        self._stale = False
+
+    def _clear_rankings(self):
+        self._ranking.clear()
+        self._rank_keys.clear()
+        self._ranked_at.clear()
+        self._stale = False
+
+    def check_rankings(self):
+        """Assert that the maintained ranking matches a full sort of the cubes on the track"""
+        expected = sorted(
+            [c for c in self._locations if c.rankable],
+            key=lambda c: (c.progress, self._locations[c][1]),
+            reverse=True,
+        )
+        assert self._ranking == expected, (self._ranking, expected)
 
     def start_turn(self):
         """
         Start a turn. A turn consists of the following phases:
-        1. Generate cubes' base roll values
-        2. Trigger on_turn_start for all pads and cubes
-        3. Move cubes in order, triggering on_before_move and on_after_move for each cube
-        4. Trigger on_turn_end for all pads and cubes
+        1. Decide the move order of the next turn (`begin_turn`)
+        2. Generate cubes' base roll values
+        3. Trigger on_turn_start for all pads and cubes
+        4. Move cubes in order, triggering on_before_move and on_after_move for each cube
+        5. Trigger on_turn_end for all pads and cubes
         """
 
+        self.begin_turn()
+        winner = self.play_turn()
+
+        if self.stats is not None:
+            self.stats.end_turn(self)
+        return winner
+
+    def begin_turn(self):
+        """Advance the turn counter and decide the move orders of this and the next turn"""
+
         self.turn += 1
+
+        # nb: a race set up without a move order rolls it now, as `reset` would have
+        if not self.cubes_order_next_turn:
+            self.cubes_order_next_turn = self.decide_move_orders()
+
         self.cubes_order_this_turn = self.cubes_order_next_turn
         self.cubes_order_next_turn = self.decide_move_orders()
 
+    def play_turn(self):
+        """Roll and move every cube of a turn started by `begin_turn`"""
+
+        if self.stats is not None or self._attributed:
+            return self._play_turn_dispatched()
+
+        hooks = self._cube_hooks
+
         for cube in self.cubes_order_this_turn:
-            cube.roll()
+            cube.roll(self)
 
-        for pad in self.track.pads:
+        for pad in self._pad_hooks["on_turn_start"]:
             pad.on_turn_start(self)
 
         for cube in self.cubes_order_this_turn:
-            cube.on_turn_start(self)
+            if cube in hooks["on_turn_start"]:
+                cube.on_turn_start(self)
 
         for cube in self.cubes_order_this_turn:
-            cube.on_before_move(self)
+            if cube in hooks["on_before_move"]:
+                cube.on_before_move(self)
             if winner := self.move_cube(cube):
                 return winner
-            cube.on_after_move(self)
+            if cube in hooks["on_after_move"]:
+                cube.on_after_move(self)
 
         for cube in self.cubes_order_this_turn:
-            cube.on_turn_end(self)
+            if cube in hooks["on_turn_end"]:
+                cube.on_turn_end(self)
 
-        for pad in self.track.pads:
+        for pad in self._pad_hooks["on_turn_end"]:
             pad.on_turn_end(self)
 
+    def _play_turn_dispatched(self):
+        """`play_turn`, calling every hook through `_call`"""
+
+        hooks = self._cube_hooks
+        call = self._call
+
+        for cube in self.cubes_order_this_turn:
+            call(cube, "roll", self, timed=False)
+
+        for pad in self._pad_hooks["on_turn_start"]:
+            call(pad, "on_turn_start", self)
+
+        for cube in self.cubes_order_this_turn:
+            if cube in hooks["on_turn_start"]:
+                call(cube, "on_turn_start", self)
+
+        for cube in self.cubes_order_this_turn:
+            if cube in hooks["on_before_move"]:
+                call(cube, "on_before_move", self)
+            if winner := self.move_cube(cube):
+                return winner
+            if cube in hooks["on_after_move"]:
+                call(cube, "on_after_move", self)
+
+        for cube in self.cubes_order_this_turn:
+            if cube in hooks["on_turn_end"]:
+                call(cube, "on_turn_end", self)
+
+        for pad in self._pad_hooks["on_turn_end"]:
+            call(pad, "on_turn_end", self)
+
+    def _call(self, obj: Cube | Pad, hook: str, *args, timed: bool = True):
+        """
+        Call `obj`'s `hook`, timed by `stats` (if attached and `timed`), and with an
+        `AttributedRNG`'s `drawing` set to the cube's lineup index (None for pads)
+        """
+        call = self.stats.call if timed and self.stats is not None else _invoke
+        if not self._attributed:
+            return call(obj, hook, *args)
+
+        rng = self.rng
+        drawing, rng.drawing = rng.drawing, self._index.get(obj)
+        try:
+            return call(obj, hook, *args)
+        finally:
+            rng.drawing = drawing
+
     def start(self):
         """Start the race"""
 
         self.reset()
+        return self.run()
+
+    def run_seeded(
+        self,
+        seed: int,
+        i: int,
+        state: RaceState | None = None,
+        on_turn: Callable[["Race"], None] | None = None,
+    ):
+        """
+        Run race `i` of a job seeded with `seed`, from the lineup's offsets or from
+        `state`. Seeding every race from its index (and restoring the lineup order)
+        makes it independent of which worker or chunk runs it, so it can be replayed.
+        `on_turn` is passed on to `run`.
+        """
+        self.rng.seed(seed, i)
+
+        if state is None:
+            self.cubes[:] = self.lineup
+            self.rng.shuffle(self.cubes)
+            self.reset()
+        else:
+            self.restore(state)
+        return self.run(on_turn)
+
+    def run(self, on_turn: Callable[["Race"], None] | None = None):
+        """
+        Play turns from the current state (e.g. after `setup` or `restore`) until a
+        cube wins, calling `on_turn(race)` once every turn is over, the last included
+        """
 
-        while not (winner := self.start_turn()):
-            pass
+        if self.stats is not None:
+            self.stats.start(self)
+
+        if on_turn is None:
+            while not (winner := self.start_turn()):
+                pass
+        else:
+            while True:
+                winner = self.start_turn()
+                on_turn(self)
+                if winner:
+                    break
+
+        if self.stats is not None:
+            self.stats.finish(self)
         return winner
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import json
+import os
+
+import numpy as np
+
+# nb: Each column is a flat little-endian binary file, so a store can be appended to
+#     chunk by chunk while simulating and read back lazily through np.memmap.
+RACE_ID_DTYPE = np.dtype("<i8")
+RANK_DTYPE = np.dtype("u1")
+TURNS_DTYPE = np.dtype("<u4")
+PROGRESS_DTYPE = np.dtype("<i4")
+
+META_FILE = "meta.json"
+
+
+def _column_path(path: str, column: str) -> str:
+    return os.path.join(path, f"{column}.bin")
+
+
+class ResultWriter:
+    """
+    Write simulation results to a columnar store directory, one chunk at a time.
+
+    The store holds one fixed-width column per field: `race_id`, `turns`, and a
+    `rank.{j}` / `progress.{j}` column for the j-th cube of the lineup. Ranks of
+    unrankable cubes (e.g. Abbowser) are stored as 0.
+
+    `job` (e.g. a `checkpoint.job_spec`) is kept in the meta. With `resume=True`, an
+    existing store for the same cubes and job is appended to instead of replaced,
+    after dropping anything written past its last complete chunk.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cubes: list[str],
+        rankable: list[bool],
+        job: dict | None = None,
+        resume: bool = False,
+    ):
+        self.path = path
+        self.cubes = cubes
+        self.rankable = rankable
+        self.job = job
+        self.num_races = 0
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE)
+
+        if resume and os.path.exists(meta_path):
+            with open(meta_path) as fp:
+                meta = json.load(fp)
+            if meta["cubes"] != cubes or meta.get("job") != job:
+                raise ValueError(f"Result store {path} is for a different job")
+            self.num_races = meta["num_races"]
+
+        self._files = {}
+        for column in self.columns:
+            dtype = self._dtype(column)
+            fp = open(_column_path(path, column), "ab" if resume else "wb")
+            fp.truncate(self.num_races * dtype.itemsize)
+            self._files[column] = fp
+        self._write_meta()
+
+    def __enter__(self) -> ResultWriter:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def columns(self) -> list[str]:
+        return (
+            ["race_id", "turns"]
+            + [f"rank.{j}" for j in range(len(self.cubes))]
+            + [f"progress.{j}" for j in range(len(self.cubes))]
+        )
+
+    @staticmethod
+    def _dtype(column: str) -> np.dtype:
+        name = column.split(".")[0]
+        return {
+            "race_id": RACE_ID_DTYPE,
+            "turns": TURNS_DTYPE,
+            "rank": RANK_DTYPE,
+            "progress": PROGRESS_DTYPE,
+        }[name]
+
+    def write(self, chunk: dict[str, np.ndarray]):
+        """
+        Append a chunk of races. `chunk` holds 1-D `race_id` and `turns` arrays and
+        2-D `rank` and `progress` arrays of shape (races, cubes).
+        """
+        self._files["race_id"].write(chunk["race_id"].astype(RACE_ID_DTYPE).tobytes())
+        self._files["turns"].write(chunk["turns"].astype(TURNS_DTYPE).tobytes())
+
+        for j in range(len(self.cubes)):
+            rank = chunk["rank"][:, j].astype(RANK_DTYPE)
+            progress = chunk["progress"][:, j].astype(PROGRESS_DTYPE)
+            self._files[f"rank.{j}"].write(rank.tobytes())
+            self._files[f"progress.{j}"].write(progress.tobytes())
+
+        for fp in self._files.values():
+            fp.flush()
+
+        # nb: meta is rewritten after the columns are flushed, so a store that is
+        #     read mid-run (or after a crash) only ever exposes complete races.
+        self.num_races += len(chunk["race_id"])
+        self._write_meta()
+
+    def close(self):
+        for fp in self._files.values():
+            fp.close()
+
+    def _write_meta(self):
+        meta = {
+            "num_races": self.num_races,
+            "cubes": self.cubes,
+            "rankable": self.rankable,
+            "job": self.job,
+            "dtypes": {
+                "race_id": RACE_ID_DTYPE.str,
+                "turns": TURNS_DTYPE.str,
+                "rank": RANK_DTYPE.str,
+                "progress": PROGRESS_DTYPE.str,
+            },
+        }
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w") as fp:
+            json.dump(meta, fp, indent=2)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+
+class ResultStore:
+    """
+    Read-only view of a store written by `ResultWriter`. Columns are memory-mapped,
+    so slicing a column only reads the pages it touches.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(os.path.join(path, META_FILE)) as fp:
+            meta = json.load(fp)
+
+        self.num_races: int = meta["num_races"]
+        self.cubes: list[str] = meta["cubes"]
+        self.rankable: list[bool] = meta["rankable"]
+        self.job: dict | None = meta.get("job")
+        self._dtypes: dict[str, str] = meta["dtypes"]
+
+    def __len__(self) -> int:
+        return self.num_races
+
+    def _memmap(self, column: str, dtype: str) -> np.ndarray:
+        if self.num_races == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(
+            _column_path(self.path, column),
+            dtype=dtype,
+            mode="r",
+            shape=(self.num_races,),
+        )
+
+    def _cube_index(self, cube: str | int) -> int:
+        return cube if isinstance(cube, int) else self.cubes.index(cube)
+
+    @property
+    def race_id(self) -> np.ndarray:
+        return self._memmap("race_id", self._dtypes["race_id"])
+
+    @property
+    def turns(self) -> np.ndarray:
+        return self._memmap("turns", self._dtypes["turns"])
+
+    def rank(self, cube: str | int) -> np.ndarray:
+        """Rank column of a cube, by lineup index or class name"""
+        return self._memmap(f"rank.{self._cube_index(cube)}", self._dtypes["rank"])
+
+    def progress(self, cube: str | int) -> np.ndarray:
+        """Final progress column of a cube, by lineup index or class name"""
+        j = self._cube_index(cube)
+        return self._memmap(f"progress.{j}", self._dtypes["progress"])
+
+    def rank_history(self) -> dict[str, np.ndarray]:
+        """
+        Ranks per cube in the same shape as the old pickled `rank_history`, with
+        memory-mapped columns instead of lists. Unrankable cubes map to an empty array.
+        """
+        return {
+            name: self.rank(j) if rankable else np.empty(0, dtype=self._dtypes["rank"])
+            for j, (name, rankable) in enumerate(zip(self.cubes, self.rankable))
+        }
@@ -0,0 +1,130 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Callable
+import operator
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from race import Race
+
+BUFFER_SIZE = 256
+STREAM_SIZE = 64
+
+
+class RaceRNG:
+    """
+    Random draws for a `Race`, shared by its cubes and pads.
+
+    Uniform floats are generated in bulk from a NumPy generator and handed out one
+    at a time, so each draw is a list lookup rather than a call into `random`. Dice
+    rolls and shuffles are derived from the same floats.
+
+    Seed it with `seed(*key)`, e.g. `seed(seed, race_index)`, to make a race's draws
+    depend only on that key (not on which worker or chunk runs the race).
+    """
+
+    def __init__(self, *key: int, buffer_size: int = BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.seed(*key)
+
+    def seed(self, *key: int):
+        """Restart the stream from `key` (fresh OS entropy if empty)"""
+        self._generator = np.random.default_rng(list(key) or None)
+        self._refills = 0
+        self._refill()
+
+    def _refill(self):
+        self._refills += 1
+        self._buffer = iter(self._generator.random(self.buffer_size).tolist())
+        self._next = self._buffer.__next__
+
+    @property
+    def drawn(self) -> int:
+        """Uniform floats drawn from the stream since the last `seed`"""
+        # nb: worked out from the buffers handed out, so counting costs the draws nothing
+        return self._refills * self.buffer_size - operator.length_hint(self._buffer)
+
+    def attach(self, race: Race):
+        """Called by the `Race` that draws from this RNG"""
+
+    def random(self) -> float:
+        """Uniform float in [0, 1)"""
+        try:
+            return self._next()
+        except StopIteration:
+            self._refill()
+            return self._next()
+
+    def randint(self, a: int, b: int) -> int:
+        """Uniform integer in [a, b], both inclusive"""
+        return a + int(self.random() * (b - a + 1))
+
+    def shuffle(self, x: list):
+        """Shuffle a list in place (Fisher-Yates)"""
+        for i in reversed(range(1, len(x))):
+            j = int(self.random() * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+
+# --- Attributed Draws --- #
+
+
+class AttributedRNG(RaceRNG):
+    """
+    A `RaceRNG` that knows which cube of its race is drawing. The `Race` drawing from
+    it dispatches every roll and skill hook through `Race._call`, so while one of
+    them runs, `drawing` is the cube's lineup index (None for the race's and pads'
+    own draws). The cubes themselves are left untouched.
+    """
+
+    drawing: int | None = None
+
+
+class CubeStreamsRNG(AttributedRNG):
+    """
+    A `RaceRNG` where each cube of the lineup draws from its own stream, so a cube's
+    k-th draw only depends on the key, however differently the race goes. Races
+    seeded alike then share their random numbers even when a rule or a skill
+    parameter changes how they unfold (common random numbers). The streams come
+    from child seeds of the key (see `SeedSequence.spawn`), independent of the
+    race's own draws (shuffles and ties) that come from the key itself.
+    """
+
+    _num_cubes: int = 0
+
+    def seed(self, *key: int):
+        if not key:
+            key = (np.random.SeedSequence().entropy,)
+
+        self._key = key
+        self._streams: list[Callable[[], float]] = []
+        self._extra: dict[int, np.random.Generator] = {}
+        super().seed(*key)
+
+    def random(self) -> float:
+        j = self.drawing
+        if j is None:
+            return super().random()
+
+        try:
+            return self._streams[j]()
+        except IndexError:
+            self._streams = self._stream(self._spawn(0), self._num_cubes)
+            return self._streams[j]()
+        except StopIteration:
+            extra = self._extra.setdefault(j, self._spawn(j + 1))
+            self._streams[j] = self._stream(extra, 1)[0]
+            return self._streams[j]()
+
+    def _spawn(self, n: int) -> np.random.Generator:
+        """Generator of the key's `n`-th child seed, as `SeedSequence(key).spawn` makes"""
+        # nb: a plain `default_rng([*key, n])` would collide with the race's own
+        #     stream, as seed sequences pad their entropy with zeros
+        return np.random.default_rng(np.random.SeedSequence(list(self._key), spawn_key=(n,)))
+
+    def attach(self, race: Race):
+        super().attach(race)
+        self._num_cubes = len(race.lineup)
+
+    def _stream(self, generator: np.random.Generator, rows: int) -> list[Callable[[], float]]:
+        return [iter(row).__next__ for row in generator.random((rows, STREAM_SIZE)).tolist()]
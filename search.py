@@ -0,0 +1,292 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+from typing import Callable, Iterable
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+import cubes as cubes_module
+from checkpoint import describe
+from cubes import Abbowser, Cube
+from simulation import simulate_setup_chunk
+from sweep import Config
+from track import Track
+
+# nb: per-race outcome of a lineup from its (races, cubes) rank array, 1 for a success
+#     and 0 otherwise, so its mean is a probability to maximize
+Objective = Callable[[np.ndarray, list[Cube]], np.ndarray]
+
+
+def win(*names: str) -> Objective:
+    """Objective: whether one of the named cubes wins the race"""
+
+    def objective(rank: np.ndarray, cubes: list[Cube]) -> np.ndarray:
+        columns = [j for j, cube in enumerate(cubes) if cube.__class__.__name__ in names]
+        return (rank[:, columns] == 1).any(axis=1).astype(np.float64)
+
+    return objective
+
+
+def lineups(
+    track: Track,
+    size: int,
+    classes: Iterable[str],
+    include: Iterable[str] = (),
+    laps: int = 1,
+    offset: int = 0,
+) -> list[Config]:
+    """
+    Every lineup of `size` ranked cubes made of the `include` cubes (e.g. the cube to
+    back, and Abbowser, who is not ranked) and a combination of the other `classes`,
+    starting at `offset` (Abbowser from the finish line)
+    """
+    include = list(include)
+    ranked = [name for name in include if getattr(cubes_module, name).rankable]
+    others = sorted(set(classes) - set(include))
+
+    def cube(name: str) -> Cube:
+        cls = getattr(cubes_module, name)
+        return cls(track.length * laps) if cls is Abbowser else cls(offset)
+
+    return [
+        (track, [cube(name) for name in include + list(combination)], laps)
+        for combination in itertools.combinations(others, size - len(ranked))
+    ]
+
+
+class Candidate:
+    """
+    A lineup under evaluation, with the running sum of its per-race objective.
+
+    Attributes:
+        config: The `(track, cubes, laps)` setup.
+        key: JSON `checkpoint.describe` description of the setup.
+        races: Races simulated so far (races 0..races - 1 of the search's seed).
+        total: Sum of the objective over those races, i.e. its successes.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.description = describe(*config)
+        self.key = json.dumps(self.description, sort_keys=True)
+        self.races = 0
+        self.total = 0.0
+
+    @property
+    def name(self) -> str:
+        return ", ".join(cube.__class__.__name__ for cube in self.config[1])
+
+    def update(self, values: np.ndarray):
+        self.races += len(values)
+        self.total += float(values.sum())
+
+    def mean(self) -> float:
+        return self.total / max(self.races, 1)
+
+    def interval(self, confidence: float = 0.95) -> tuple[float, float]:
+        """Wilson score confidence interval on the mean (a probability)"""
+        # nb: Wilson rather than Wald, as in `RankAggregator.confidence_intervals`, so
+        #     a lineup without a success yet is not dropped on an interval of ±0
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        n = max(self.races, 1)
+        p = self.mean()
+
+        center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+        width = z / (1 + z**2 / n) * math.sqrt(p * (1 - p) / n + z**2 / (4 * n**2))
+        return center - width, center + width
+
+
+class SearchResult:
+    """
+    Outcome of `search`.
+
+    Attributes:
+        candidates: Every candidate, the finalists first, each group best first.
+        finalists: Number of candidates still in contention at the end.
+        races: Races simulated over the whole search.
+        confidence: Confidence level of the reported bounds.
+    """
+
+    def __init__(
+        self, candidates: list[Candidate], finalists: int, races: int, confidence: float
+    ):
+        self.candidates = candidates
+        self.finalists = finalists
+        self.races = races
+        self.confidence = confidence
+
+    def best(self, n: int | None = None) -> list[Candidate]:
+        return self.candidates[: self.finalists if n is None else n]
+
+    def table(self, n: int | None = None) -> pd.DataFrame:
+        """Objective (e.g. P(win)) with its confidence bounds and races per lineup"""
+        rows = {}
+        for candidate in self.best(n):
+            lower, upper = candidate.interval(self.confidence)
+            rows[candidate.name] = {
+                "Objective": candidate.mean(),
+                "Lower": lower,
+                "Upper": upper,
+                "Races": candidate.races,
+            }
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def search(
+    candidates: list[Config],
+    objective: Objective,
+    budget: int,
+    keep: int = 5,
+    eta: int = 2,
+    min_races: int = 100,
+    confidence: float = 0.95,
+    seed: int | None = None,
+    workers: int | None = None,
+    chunk_size: int = 1000,
+    progress: bool = True,
+) -> SearchResult:
+    """
+    Find the lineups with the highest mean `objective` within `budget` races, by
+    successive halving: every candidate first runs `min_races` races (at least),
+    then each round keeps the best `1 / eta` of the candidates (never fewer than
+    `keep`), also dropping any that are clearly worse, i.e. whose upper confidence
+    bound is below the lower bound of the `keep`-th best (Wilson intervals, see
+    `Candidate.interval`). Each round gets an equal share of the remaining budget,
+    and the last one goes to the `keep` finalists.
+
+    A lineup has no strength of its own to maximize (its cubes' chances of winning
+    always add up to 1), so the "strongest lineup" is the one that maximizes the
+    chance of an outcome of your choice, e.g. `win("Calcharo")` for the lineup that
+    gives the cube you back its best chance.
+
+    Every candidate runs races 0, 1, ... of the same seed, so a candidate's races
+    carry over between rounds and are never simulated twice.
+    """
+    seed = random.randrange(2**32) if seed is None else seed
+    workers = workers or os.cpu_count() or 1
+    alive = [Candidate(config) for config in candidates]
+    out: list[Candidate] = []
+
+    if min_races * len(alive) > budget:
+        raise ValueError(f"A budget of {budget} races is below {min_races} per candidate")
+
+    rounds = 1 + max(math.ceil(math.log(len(alive) / keep, eta)), 0)
+    spent = 0
+
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        with tqdm(total=budget, disable=not progress) as bar:
+            for r in range(rounds):
+                share = (budget - spent) // (rounds - r) // len(alive)
+                races = max(share, min_races if r == 0 else 1)
+
+                ranks = _simulate(executor, workers, alive, races, seed, chunk_size)
+                for candidate, rank in zip(alive, ranks):
+                    candidate.update(objective(rank, candidate.config[1]))
+
+                spent += races * len(alive)
+                bar.update(races * len(alive))
+
+                alive.sort(key=Candidate.mean, reverse=True)
+                if r < rounds - 1:
+                    survivors = _survivors(alive, keep, eta, confidence)
+                    out += alive[len(survivors):]
+                    alive = survivors
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    out.sort(key=Candidate.mean, reverse=True)
+    return SearchResult(alive + out, len(alive), spent, confidence)
+
+
+def _survivors(
+    alive: list[Candidate], keep: int, eta: int, confidence: float
+) -> list[Candidate]:
+    """The candidates (best first) to keep after a round"""
+    survivors = alive[: max(keep, math.ceil(len(alive) / eta))]
+    if len(survivors) <= keep:
+        return survivors
+
+    threshold = survivors[keep - 1].interval(confidence)[0]
+    return survivors[:keep] + [
+        candidate
+        for candidate in survivors[keep:]
+        if candidate.interval(confidence)[1] >= threshold
+    ]
+
+
+def _simulate(
+    executor: ProcessPoolExecutor | None,
+    workers: int,
+    candidates: list[Candidate],
+    races: int,
+    seed: int,
+    chunk_size: int,
+) -> list[np.ndarray]:
+    """Ranks of each candidate's next `races` races, in candidate order"""
+    tasks = [
+        (i, (c.key, c.description, seed, start, min(chunk_size, c.races + races - start)))
+        for i, c in enumerate(candidates)
+        for start in range(c.races, c.races + races, chunk_size)
+    ]
+    args = list(zip(*[task for _, task in tasks]))
+
+    if executor is None:
+        chunks = map(simulate_setup_chunk, *args)
+    else:
+        # nb: many candidates only need a few races, so tasks go out in batches
+        batch = max(1, len(tasks) // (8 * workers))
+        chunks = executor.map(simulate_setup_chunk, *args, chunksize=batch)
+
+    ranks: list[list[np.ndarray]] = [[] for _ in candidates]
+    for (i, _), chunk in zip(tasks, chunks):
+        ranks[i].append(chunk["rank"])
+    return [np.concatenate(rank) for rank in ranks]
+
+
+if __name__ == "__main__":
+    from benchmark import MAIN_OFFSET, Scenario, implemented_cubes
+
+    parser = argparse.ArgumentParser(
+        description="Search for the lineup that gives a cube its best chance to win"
+    )
+    parser.add_argument("target", help="Cube class to back, e.g. Calcharo")
+    parser.add_argument("--size", type=int, default=6, help="Ranked cubes per lineup")
+    parser.add_argument("--budget", type=int, default=2_000_000)
+    parser.add_argument("--keep", type=int, default=5)
+    parser.add_argument("--eta", type=int, default=2)
+    parser.add_argument("--min-races", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--no-abbowser", action="store_true")
+    args = parser.parse_args()
+
+    # nb: main.py's track and starting line, with Abbowser from the finish line
+    track = Scenario("main", 32, []).track()
+    include = [args.target] + ([] if args.no_abbowser else ["Abbowser"])
+    classes = [name for name in implemented_cubes() if name != "Abbowser"]
+
+    configs = lineups(track, args.size, classes, include, offset=MAIN_OFFSET)
+    print(f"{len(configs)} candidate lineups")
+
+    result = search(
+        configs,
+        win(args.target),
+        args.budget,
+        keep=args.keep,
+        eta=args.eta,
+        min_races=args.min_races,
+        seed=args.seed,
+        workers=args.workers,
+    )
+    print(f"Simulated {result.races} races")
+    print(result.table())
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from cubes import Cube
+from simulation import Variant, simulate_variants
+from stats import RankAggregator
+from track import Track
+
+# nb: skill chances read off translated descriptions, which may well be off
+UNCERTAIN_PARAMETERS = (
+    "Carlotta.p",
+    "Cartethyia.p",
+    "Changli.p",
+    "Jinhsi.p",
+    "Lynae.p_double",
+    "Lynae.p_stop",
+    "Phoebe.p",
+)
+DELTAS = (-0.1, -0.05, 0.05, 0.1)
+
+
+def _variant(cubes: list[Cube], parameter: str, value: float) -> Variant:
+    """The variant setting `parameter` ("Class.attribute") of every such cube to `value`"""
+    name, _, attr = parameter.partition(".")
+    variant = {
+        (j, attr): value
+        for j, cube in enumerate(cubes)
+        if cube.__class__.__name__ == name and hasattr(type(cube), attr)
+    }
+    if not variant:
+        raise ValueError(f"No cube of the lineup has the parameter {parameter!r}")
+    return variant
+
+
+def default_grid(cubes: list[Cube], deltas: tuple[float, ...] = DELTAS) -> dict[str, list[float]]:
+    """Each uncertain skill parameter of the lineup at its value plus each of `deltas`"""
+    grid = {}
+    for parameter in UNCERTAIN_PARAMETERS:
+        name, _, attr = parameter.partition(".")
+        for cube in cubes:
+            if cube.__class__.__name__ == name:
+                value = getattr(cube, attr)
+                grid[parameter] = sorted(
+                    {round(min(max(value + delta, 0.0), 1.0), 6) for delta in deltas} - {value}
+                )
+                break
+    return grid
+
+
+class Sensitivity:
+    """
+    Rank statistics of a lineup at each point of a parameter grid, and their paired
+    differences from the lineup's own parameters (the baseline).
+
+    Attributes:
+        points: `(parameter, value)` of every grid point.
+        baseline: `RankAggregator` of the races with the lineup's own parameters.
+        aggregators: `RankAggregator` per grid point.
+        win_diff_sum, win_diff_sq_sum: Per (point, cube), sums over races of the
+            difference between the point's and the baseline's rank-1 indicators,
+            and of its square.
+        rank_diff_sum, rank_diff_sq_sum: The same for the ranks themselves.
+    """
+
+    def __init__(self, cubes: list[Cube], points: list[tuple[str, float]]):
+        self.points = points
+        self.baseline = RankAggregator.from_cubes(cubes)
+        self.aggregators = [RankAggregator.from_cubes(cubes) for _ in points]
+        self.count = 0
+
+        shape = (len(points), len(cubes))
+        self.win_diff_sum = np.zeros(shape, dtype=np.int64)
+        self.win_diff_sq_sum = np.zeros(shape, dtype=np.int64)
+        self.rank_diff_sum = np.zeros(shape, dtype=np.int64)
+        self.rank_diff_sq_sum = np.zeros(shape, dtype=np.int64)
+
+    def update(self, rank: np.ndarray):
+        """
+        Record a batch of races from a (races, 1 + points, cubes) rank array, the
+        baseline first (the layout of `simulate_variants` chunks)
+        """
+        rank = np.asarray(rank, dtype=np.int64)
+
+        self.baseline.update_ranks(rank[:, 0])
+        for aggregator, point_rank in zip(self.aggregators, rank[:, 1:].swapaxes(0, 1)):
+            aggregator.update_ranks(point_rank)
+
+        # nb: integer sums, so the differences are exact whatever the chunking
+        wins = (rank == 1).astype(np.int64)
+        win_diff = wins[:, 1:] - wins[:, :1]
+        rank_diff = rank[:, 1:] - rank[:, :1]
+
+        self.win_diff_sum += win_diff.sum(axis=0)
+        self.win_diff_sq_sum += (win_diff**2).sum(axis=0)
+        self.rank_diff_sum += rank_diff.sum(axis=0)
+        self.rank_diff_sq_sum += (rank_diff**2).sum(axis=0)
+        self.count += rank.shape[0]
+
+    def _mean_and_error(self, total: np.ndarray, sq_total: np.ndarray) -> tuple:
+        n = max(self.count, 1)
+        mean = total / n
+        variance = np.maximum(sq_total / n - mean**2, 0)
+        return mean, np.sqrt(variance / max(n - 1, 1))
+
+    def table(self, confidence: float = 0.95) -> pd.DataFrame:
+        """
+        P(rank=1) and mean rank of every ranked cube at every grid point, with their
+        differences from the baseline and the confidence interval half-widths of the
+        differences (normal approximation over the paired races)
+        """
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        win_diff, win_error = self._mean_and_error(self.win_diff_sum, self.win_diff_sq_sum)
+        rank_diff, rank_error = self._mean_and_error(self.rank_diff_sum, self.rank_diff_sq_sum)
+
+        rows = {}
+        for i, ((parameter, value), aggregator) in enumerate(zip(self.points, self.aggregators)):
+            p, mean = aggregator.probabilities()[:, 0], aggregator.mean()
+
+            for j, name in enumerate(aggregator.cubes):
+                if aggregator.rankable[j]:
+                    rows[parameter, value, name] = {
+                        "P(rank=1)": p[j],
+                        "Δ P(rank=1)": win_diff[i, j],
+                        "Δ P(rank=1) ±": z * win_error[i, j],
+                        "Mean Rank": mean[j],
+                        "Δ Mean Rank": rank_diff[i, j],
+                        "Δ Mean Rank ±": z * rank_error[i, j],
+                    }
+
+        table = pd.DataFrame.from_dict(rows, orient="index")
+        table.index.names = ["parameter", "value", "cube"]
+        return table
+
+
+def sensitivity(
+    track: Track,
+    cubes: list[Cube],
+    num_simulation: int,
+    grid: dict[str, list[float]] | None = None,
+    laps: int = 1,
+    **kwargs,
+) -> Sensitivity:
+    """
+    Simulate `num_simulation` races at every point of a one-at-a-time parameter grid
+    (`{"Class.attribute": [value, ...]}`, by default `default_grid`), plus the
+    lineup's own parameters as the baseline.
+
+    All points run as one job over the same races with common random numbers (see
+    `simulation.simulate_variants`), so a parameter's effect on each cube is
+    measured with far less noise than by comparing separate simulations. Takes the
+    same options as `simulate_variants`.
+    """
+    grid = default_grid(cubes) if grid is None else grid
+
+    points = [(parameter, value) for parameter, values in grid.items() for value in values]
+    variants = [{}] + [_variant(cubes, parameter, value) for parameter, value in points]
+
+    result = Sensitivity(cubes, points)
+    for chunk in simulate_variants(track, cubes, variants, num_simulation, laps, **kwargs):
+        result.update(chunk["rank"])
+    return result
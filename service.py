@@ -0,0 +1,427 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import asyncio
+import collections
+import hashlib
+import itertools
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+import simulation
+from checkpoint import build, describe
+from cubes import Cube
+from race import Race, RaceState
+from stats import RankAggregator
+from track import Track
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+CHUNK_SIZE = 200
+CACHE_SIZE = 256
+BUDGET = 2.0
+MAX_BUDGET = 60.0
+MAX_RACES = 1_000_000
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+# --- Queries --- #
+
+
+class Query:
+    """
+    A parsed `/predict` request.
+
+    Attributes:
+        key: Hash of everything that determines the answer (setup, board, races and
+            seed), under which answers are cached.
+        config: The setup as `checkpoint.describe` describes it.
+        cubes: The lineup built from `config`.
+        state: The board to continue from, or None to simulate whole races.
+        races, seed: Races to simulate, seeded as in `simulation.simulate_chunks`.
+        budget: Seconds to answer within, with fewer races if need be.
+    """
+
+    def __init__(self, payload: dict):
+        track, self.cubes, laps = build(payload)
+        self.config = describe(track, self.cubes, laps)
+
+        board = payload.get("state")
+        self.state = None if board is None else _board_state(track, self.cubes, laps, board)
+
+        self.races = int(payload.get("races", 10000))
+        self.seed = int(payload.get("seed", 0))
+        self.budget = float(payload.get("budget", BUDGET))
+
+        if not 0 < self.races <= MAX_RACES:
+            raise ValueError(f"races must be within 1..{MAX_RACES}")
+        if not 0 < self.budget <= MAX_BUDGET:
+            raise ValueError(f"budget must be within (0, {MAX_BUDGET}] seconds")
+
+        identity = {"config": self.config, "state": board, "races": self.races, "seed": self.seed}
+        self.key = hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+
+def _board_state(track: Track, cubes: list[Cube], laps: int, board: dict) -> RaceState:
+    """The `RaceState` of a board given as `Race.setup` arguments by lineup index"""
+    race = Race(track, cubes, laps)
+    move_order = board.get("move_order")
+    race.setup(
+        {int(p): [cubes[j] for j in stack] for p, stack in board["stacks"].items()},
+        turn=board.get("turn", 0),
+        move_order=None if move_order is None else [cubes[j] for j in move_order],
+        skills={cubes[int(j)]: state for j, state in board.get("skills", {}).items()},
+    )
+    return race.snapshot()
+
+
+def board(race: Race) -> dict:
+    """The current board of a race as `/predict` takes it (see `Race.setup`)"""
+    index = {cube: j for j, cube in enumerate(race.lineup)}
+    stacks: dict[str, list[int]] = {}
+    for pad in race.track.pads:
+        for cube in pad.cubes:
+            stacks.setdefault(str(cube.progress), []).append(index[cube])
+
+    return {
+        "stacks": stacks,
+        "turn": race.turn,
+        "move_order": [index[cube] for cube in race.cubes_order_next_turn] or None,
+        "skills": {
+            str(j): {attr: getattr(cube, attr) for attr in cube.state_attrs}
+            for j, cube in enumerate(race.lineup)
+            if cube.state_attrs
+        },
+    }
+
+
+# --- Workers --- #
+
+def _warm() -> int:
+    return os.getpid()
+
+
+def _predict_chunk(
+    key: str, config: dict, state: RaceState | None, seed: int, start: int, count: int
+) -> np.ndarray:
+    """Ranks of races [start, start + count) of a query, as in `simulate_chunks` chunks"""
+    # nb: back-to-back chunks of a query (or repeated queries about one race) reuse
+    #     the worker's Race
+    return simulation.simulate_setup_chunk(key, config, seed, start, count, state)["rank"]
+
+
+# --- Service --- #
+
+
+class PredictionService:
+    """
+    Answers win-probability queries on a pool of worker processes started (and
+    warmed up) once, caching the `cache_size` most recently used complete answers.
+
+    A query runs as chunks of `chunk_size` races, at most one per worker at a time.
+    Once its budget runs out, no more chunks are submitted, those still running are
+    dropped and the answer covers the races done so far (`complete` is false, and
+    the answer is not cached). An answer always covers at least one chunk, waiting
+    past the budget for it if need be. Identical queries in flight at the same time
+    share one simulation.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        chunk_size: int = CHUNK_SIZE,
+        cache_size: int = CACHE_SIZE,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+
+        self._executor: ProcessPoolExecutor | None = None
+        self._cache: collections.OrderedDict[str, dict] = collections.OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def start(self):
+        """Start the worker processes and wait until each of them is up"""
+        loop = asyncio.get_running_loop()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        await asyncio.gather(
+            *(loop.run_in_executor(self._executor, _warm) for _ in range(self.workers))
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def __aenter__(self) -> PredictionService:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    async def predict(self, payload: dict) -> dict:
+        """Answer a `/predict` request (see `Query`)"""
+        started = time.monotonic()
+        query = Query(payload)
+
+        if (answer := self._cache.get(query.key)) is not None:
+            self._cache.move_to_end(query.key)
+            cached = True
+        else:
+            if (future := self._inflight.get(query.key)) is None:
+                future = asyncio.ensure_future(self._simulate(query))
+                self._inflight[query.key] = future
+                future.add_done_callback(lambda _: self._inflight.pop(query.key, None))
+
+            answer = await asyncio.shield(future)
+            cached = False
+
+        return {**answer, "cached": cached, "elapsed": time.monotonic() - started}
+
+    async def _simulate(self, query: Query) -> dict:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + query.budget
+        starts = iter(range(0, query.races, self.chunk_size))
+        aggregator = RankAggregator.from_cubes(query.cubes)
+
+        def submit(start: int) -> asyncio.Future:
+            count = min(self.chunk_size, query.races - start)
+            return loop.run_in_executor(
+                self._executor,
+                _predict_chunk,
+                query.key,
+                query.config,
+                query.state,
+                query.seed,
+                start,
+                count,
+            )
+
+        # nb: chunks are submitted as others finish, one per worker at a time, so a
+        #     query out of budget leaves no queued chunks behind to keep the pool busy
+        pending = {submit(start) for start in itertools.islice(starts, self.workers)}
+        try:
+            while pending:
+                # nb: an answer covers at least one chunk, even past the budget
+                timeout = max(deadline - loop.time(), 0) if aggregator.count else None
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for chunk in done:
+                    aggregator.update_ranks(chunk.result())
+
+                if loop.time() >= deadline:
+                    break
+                pending |= {submit(start) for start in itertools.islice(starts, len(done))}
+        finally:
+            for chunk in pending:
+                chunk.cancel()
+
+        answer = _answer(aggregator, query.races)
+        if answer["complete"]:
+            self._cache[query.key] = answer
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return answer
+
+    def health(self) -> dict:
+        return {"workers": self.workers, "cached": len(self._cache), "inflight": len(self._inflight)}
+
+    # --- HTTP --- #
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one HTTP request on a connection, then close it"""
+        try:
+            method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            status, response = await self._route(method, path.split("?")[0], body)
+        except (ValueError, asyncio.IncompleteReadError):
+            status, response = 400, {"error": "Malformed HTTP request"}
+
+        content = json.dumps(response).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(content)}\r\n"
+            "Connection: close\r\n\r\n".encode() + content
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        if (method, path) == ("GET", "/health"):
+            return 200, self.health()
+        if (method, path) != ("POST", "/predict"):
+            return 404, {"error": f"No route {method} {path}"}
+
+        try:
+            payload = json.loads(body)
+            if not isinstance(payload, dict):
+                raise ValueError("Expected a JSON object")
+            return 200, await self.predict(payload)
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            return 400, {"error": f"{type(e).__name__}: {e}"}
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        """Serve HTTP requests until cancelled"""
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving {self.workers} workers on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def _answer(aggregator: RankAggregator, races: int) -> dict:
+    intervals = aggregator.confidence_intervals()
+    p = aggregator.probabilities()
+
+    return {
+        "races": aggregator.count,
+        "complete": aggregator.count == races,
+        "rank_probabilities": {
+            name: p[j].tolist()
+            for j, name in enumerate(aggregator.cubes)
+            if aggregator.rankable[j]
+        },
+        "intervals": {
+            name: {column: float(value) for column, value in row.items()}
+            for name, row in intervals.iterrows()
+        },
+        "result": aggregator.to_dict(),
+    }
+
+
+# --- Client --- #
+
+
+def request_payload(
+    track: Track,
+    cubes: list[Cube],
+    laps: int = 1,
+    race: Race | None = None,
+    races: int = 10000,
+    seed: int = 0,
+    budget: float = BUDGET,
+) -> dict:
+    """A `/predict` request for a setup, continuing from `race`'s board if given"""
+    payload = {**describe(track, cubes, laps), "races": races, "seed": seed, "budget": budget}
+    if race is not None:
+        payload["state"] = board(race)
+    return payload
+
+
+def predict(payload: dict, url: str = DEFAULT_URL, timeout: float = 120.0) -> dict:
+    """
+    Send a `/predict` request and return the answer. `RankAggregator.from_dict` of
+    its `result` gives the usual summaries.
+    """
+    request = urllib.request.Request(
+        url + "/predict",
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        raise ValueError(json.load(e).get("error", str(e))) from None
+
+
+def load_test(
+    payload: dict,
+    num_requests: int = 100,
+    concurrency: int = 8,
+    distinct: int = 10,
+    url: str = DEFAULT_URL,
+) -> dict:
+    """
+    Send `num_requests` queries from `concurrency` threads, cycling through
+    `distinct` seeds of `payload` so some are cache hits, and report the latencies.
+    """
+
+    def send(i: int) -> tuple[float, dict | None]:
+        started = time.perf_counter()
+        try:
+            answer = predict({**payload, "seed": i % distinct}, url)
+        except (OSError, ValueError):
+            answer = None
+        return time.perf_counter() - started, answer
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(num_requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([latency for latency, _ in results])
+    answers = [answer for _, answer in results if answer is not None]
+    return {
+        "requests": num_requests,
+        "errors": num_requests - len(answers),
+        "requests_per_sec": num_requests / elapsed,
+        **{f"latency_p{q}": float(np.percentile(latencies, q)) for q in (50, 90, 99)},
+        "latency_max": float(latencies.max()),
+        "cached": sum(answer["cached"] for answer in answers),
+        "incomplete": sum(not answer["complete"] for answer in answers),
+    }
+
+
+if __name__ == "__main__":
+    from benchmark import scenarios
+
+    parser = argparse.ArgumentParser(description="Local win-probability prediction service")
+    parser.add_argument("command", choices=["serve", "predict", "load-test"])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+    parser.add_argument("--races", type=int, default=10000)
+    parser.add_argument("--budget", type=float, default=BUDGET)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--distinct", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        service = PredictionService(args.workers, args.chunk_size, args.cache_size)
+
+        async def main():
+            async with service:
+                await service.serve(args.host, args.port)
+
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
+    else:
+        # nb: the stand-in client asks about benchmark.py's copy of main.py's setup
+        scenario = scenarios()[0]
+        payload = request_payload(
+            scenario.track(), scenario.cubes(), races=args.races, budget=args.budget
+        )
+        url = f"http://{args.host}:{args.port}"
+
+        if args.command == "predict":
+            answer = predict(payload, url)
+            print(f"{answer['races']} races in {answer['elapsed']:.3f}s, cached: {answer['cached']}")
+            print(RankAggregator.from_dict(answer["result"]).summary())
+        else:
+            report = load_test(payload, args.requests, args.concurrency, args.distinct, url)
+            print(json.dumps(report, indent=2))
@@ -0,0 +1,273 @@
+from __future__ import annotations
+from collections import Counter
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from checkpoint import build, job_spec
+from cubes import Cube
+from simulation import aggregate, simulate_chunks
+from stats import RankAggregator
+from track import Track
+
+# nb: every race is seeded from the job's seed and its index, so a shard is just a
+#     range of race indices; shards that split the races of one seed add up to the
+#     same races as the whole job, whichever machine runs them.
+
+
+def shard_range(num_simulation: int, shard: int, num_shards: int, chunk_size: int = 1000):
+    """
+    Races `[start, stop)` of shard `shard` of `num_shards`. Boundaries fall on chunk
+    boundaries, so the numpy engine (which draws per chunk) chunks every shard as
+    the whole job would.
+    """
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"Shard {shard} is not within 0..{num_shards - 1}")
+
+    num_chunks = -(-num_simulation // chunk_size)
+    start, stop = (num_chunks * k // num_shards * chunk_size for k in (shard, shard + 1))
+    return min(start, num_simulation), min(stop, num_simulation)
+
+
+class Partial:
+    """
+    Aggregated results of races `[start, stop)` of a job, saved as a small JSON file
+    that can be merged with the other shards of the job (see `merge`).
+
+    Attributes:
+        job: The `checkpoint.job_spec` every shard of the job must share.
+        num_simulation: Races of the whole job.
+        start, stop: The races of this partial result.
+        aggregator: `RankAggregator` of those races.
+        turns: Number of races that took each number of turns.
+    """
+
+    def __init__(
+        self,
+        job: dict,
+        num_simulation: int,
+        start: int,
+        stop: int,
+        aggregator: RankAggregator,
+        turns: Counter | None = None,
+    ):
+        self.job = job
+        self.num_simulation = num_simulation
+        self.start = start
+        self.stop = stop
+        self.aggregator = aggregator
+        self.turns = turns if turns is not None else Counter()
+
+    def to_dict(self) -> dict:
+        return {
+            "job": self.job,
+            "num_simulation": self.num_simulation,
+            "start": self.start,
+            "stop": self.stop,
+            "result": self.aggregator.to_dict(),
+            "turns": {str(turns): n for turns, n in sorted(self.turns.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Partial:
+        return cls(
+            data["job"],
+            data["num_simulation"],
+            data["start"],
+            data["stop"],
+            RankAggregator.from_dict(data["result"]),
+            Counter({int(turns): n for turns, n in data["turns"].items()}),
+        )
+
+    def save(self, path: str):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump(self.to_dict(), fp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Partial:
+        with open(path) as fp:
+            return cls.from_dict(json.load(fp))
+
+    @property
+    def complete(self) -> bool:
+        return (self.start, self.stop) == (0, self.num_simulation)
+
+
+def run_shard(
+    track: Track,
+    cubes: list[Cube],
+    num_simulation: int,
+    shard: int,
+    num_shards: int,
+    seed: int,
+    laps: int = 1,
+    **kwargs,
+) -> Partial:
+    """
+    Simulate shard `shard` of `num_shards` of a job of `num_simulation` races (see
+    `shard_range`). Every shard of a job needs the same setup, seed and options,
+    which the partial result records. Takes the same options as `simulate_chunks`.
+    """
+    chunk_size = kwargs.get("chunk_size", 1000)
+    start, stop = shard_range(num_simulation, shard, num_shards, chunk_size)
+
+    job = job_spec(
+        track,
+        cubes,
+        laps,
+        seed,
+        kwargs.get("engine", "object"),
+        chunk_size,
+        kwargs.get("state"),
+    )
+    partial = Partial(job, num_simulation, start, stop, RankAggregator.from_cubes(cubes))
+
+    for chunk in simulate_chunks(track, cubes, stop, laps, seed=seed, start=start, **kwargs):
+        partial.aggregator.update_ranks(chunk["rank"])
+        partial.turns.update(chunk["turns"].tolist())
+
+    return partial
+
+
+def merge(partials: list[Partial]) -> Partial:
+    """
+    Combine partial results of one job. The counts are integers, so the merge is
+    exactly the result of running their races in one go, in any order. Raises a
+    ValueError if the partials are of different jobs, or overlap or leave a gap
+    (so a subset of shards can be merged as long as its races are contiguous).
+    """
+    if not partials:
+        raise ValueError("Nothing to merge")
+
+    first = partials[0]
+    for partial in partials[1:]:
+        if (partial.job, partial.num_simulation) != (first.job, first.num_simulation):
+            raise ValueError("Cannot merge partial results of different jobs")
+
+    partials = sorted(partials, key=lambda partial: partial.start)
+    for a, b in zip(partials, partials[1:]):
+        if b.start != a.stop:
+            problem = "overlap" if b.start < a.stop else "leave a gap"
+            raise ValueError(f"Races [{a.start}, {a.stop}) and [{b.start}, {b.stop}) {problem}")
+
+    # nb: the merge starts from a copy of the earliest partial, after sorting
+    first = partials[0]
+    merged = Partial(
+        first.job,
+        first.num_simulation,
+        first.start,
+        partials[-1].stop,
+        RankAggregator.from_dict(first.aggregator.to_dict()),
+        Counter(first.turns),
+    )
+    for partial in partials[1:]:
+        merged.aggregator.merge(partial.aggregator)
+        merged.turns.update(partial.turns)
+    return merged
+
+
+def verify(partial: Partial, **kwargs) -> bool:
+    """
+    Whether a merged result equals its job's races `[0, stop)` run in one go in this
+    process, e.g. to check shards run elsewhere. Takes `simulate_chunks` options
+    that do not change results, such as `workers`.
+    """
+    track, cubes, laps = build(partial.job["config"])
+    if "state" in partial.job:
+        raise ValueError("Cannot verify a job continuing from a board state")
+
+    expected = aggregate(
+        track,
+        cubes,
+        partial.stop,
+        laps,
+        seed=partial.job["seed"],
+        engine=partial.job["engine"],
+        chunk_size=partial.job.get("chunk_size", 1000),
+        **kwargs,
+    )
+    return partial.start == 0 and expected.to_dict() == partial.aggregator.to_dict()
+
+
+def run_local(
+    num_shards: int, num_simulation: int, seed: int, directory: str = "shards", **options
+) -> list[str]:
+    """
+    Run `main.py`'s job as `num_shards` shards in separate processes, as batch nodes
+    would, and return the paths of their partial results. `options` are further
+    `main.py` flags, e.g. `{"engine": "numpy"}`.
+    """
+    os.makedirs(directory, exist_ok=True)
+    main = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+    processes, paths = [], []
+    for shard in range(num_shards):
+        path = os.path.join(directory, f"shard-{shard}-of-{num_shards}.json")
+        command = [
+            sys.executable,
+            main,
+            "--races", str(num_simulation),
+            "--seed", str(seed),
+            "--shard", f"{shard}/{num_shards}",
+            "--output", path,
+            "--workers", "1",
+        ]
+        for option, value in options.items():
+            command += [f"--{option.replace('_', '-')}", str(value)]
+
+        processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL))
+        paths.append(path)
+
+    for shard, process in enumerate(processes):
+        if process.wait() != 0:
+            raise RuntimeError(f"Shard {shard} exited with status {process.returncode}")
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Merge partial results of a sharded job (see main.py --shard)"
+    )
+    parser.add_argument("partials", nargs="*", help="Partial result files of one job")
+    parser.add_argument("--output", default=None, help="Also save the merged result here")
+    parser.add_argument(
+        "--local",
+        type=int,
+        default=None,
+        metavar="SHARDS",
+        help="First run main.py's job as this many shards in separate processes",
+    )
+    parser.add_argument("--races", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--directory", default="shards")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Check the merged result against the whole job run in this process",
+    )
+    args = parser.parse_args()
+
+    paths = args.partials
+    if args.local is not None:
+        paths = run_local(args.local, args.races, args.seed, args.directory)
+    if not paths:
+        parser.error("No partial results to merge")
+
+    merged = merge([Partial.load(path) for path in paths])
+    if args.output is not None:
+        merged.save(args.output)
+
+    if not merged.complete:
+        print(f"Warning: only races [{merged.start}, {merged.stop}) of {merged.num_simulation}")
+
+    print(f"Merged {len(paths)} partial results, {merged.aggregator.count} races")
+    print(merged.aggregator.summary())
+
+    if args.verify:
+        equal = verify(merged)
+        print("Equal to a single-machine run" if equal else "DIFFERS from a single-machine run")
+        sys.exit(0 if equal else 1)
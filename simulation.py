@@ -0,0 +1,563 @@
+from __future__ import annotations
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Iterator
+import collections
+import contextlib
+import copy
+import itertools
+import os
+import random
+
+import numpy as np
+from tqdm import tqdm
+
+from batch_race import BatchRace
+from checkpoint import Checkpoint, build, job_spec, resolve_seed
+from cubes import Cube
+from race import Race, RaceState
+from results import ResultStore, ResultWriter
+from rng import CubeStreamsRNG, RaceRNG
+from stats import RaceStats, RankAggregator
+from track import Track
+from traces import TraceWriter
+
+# nb: Each worker process keeps its own Race (and therefore its own Track and cube
+#     instances), created once by the pool initializer and reused for every chunk.
+_worker_race: Race | None = None
+_worker_batch: BatchRace | None = None
+_worker_cubes: list[Cube] = []
+_worker_state: RaceState | None = None
+_worker_trace: bool = False
+
+ENGINES = ("object", "numpy")
+
+
+def _init_worker(
+    track: Track,
+    cubes: list[Cube],
+    laps: int,
+    engine: str = "object",
+    state: RaceState | None = None,
+    trace: bool = False,
+    rng: Callable[[], RaceRNG] | None = None,
+    fast_forward: bool = True,
+):
+    global _worker_race, _worker_batch, _worker_cubes, _worker_state, _worker_trace
+    _worker_race = Race(track, cubes.copy(), laps, rng=rng() if rng is not None else None)
+    _worker_race.fast_forward = fast_forward
+    _worker_cubes = cubes
+    _worker_state = state
+    _worker_trace = trace
+
+    # nb: lineups the vectorized engine cannot handle, races continued from a given
+    #     state, traced races, custom draws and step-wise moves fall back to the
+    #     object engine
+    use_batch = (
+        engine == "numpy"
+        and state is None
+        and not trace
+        and rng is None
+        and fast_forward
+        and BatchRace.supports(track, cubes)
+    )
+    _worker_batch = BatchRace(track, cubes, laps) if use_batch else None
+
+
+# nb: the setup this worker's Race was last built for by `simulate_setup_chunk`
+_worker_setup: str | None = None
+
+
+def simulate_setup_chunk(
+    key: str,
+    config: dict,
+    seed: int,
+    start: int,
+    count: int,
+    state: RaceState | None = None,
+) -> dict[str, np.ndarray]:
+    """
+    Simulate races [start, start + count) of a setup given as a `checkpoint.describe`
+    config, in this process, as one chunk of `simulate_chunks`. Meant as the task of
+    a long-lived pool that serves many setups: the process's Race is only rebuilt
+    when `key` (identifying the config and state) differs from the last chunk's.
+    """
+    global _worker_setup
+    if key != _worker_setup:
+        track, cubes, laps = build(config)
+        _init_worker(track, cubes, laps, state=state)
+        _worker_setup = key
+    return _simulate_chunk(seed, start, count)
+
+
+def _run_race(seed: int, i: int, on_turn: Callable[[Race], None] | None = None):
+    """Run race `i` of a job on this worker's Race"""
+    # nb: `Race.run_seeded` seeds every race from its index (and restores the lineup
+    #     order), which keeps the results independent of the worker count and chunk
+    #     size, and lets `traces.TraceReader` replay any race on its own.
+    _worker_race.run_seeded(seed, i, _worker_state, on_turn)
+
+
+def _simulate_chunk(seed: int, start: int, count: int) -> dict[str, np.ndarray]:
+    """
+    Simulate races [start, start + count) on this worker's Race. Cube columns follow
+    the lineup order; unrankable cubes get rank 0. Traced races also return the
+    number of random numbers each race drew as `draws`, and one row per turn played
+    (races in order, each from its `first_turn` row) with the turn's move `order`
+    (lineup indices) and every cube's `roll`.
+    """
+    if _worker_batch is not None:
+        return _worker_batch.run(count, np.random.default_rng([seed, start]), start)
+
+    race = _worker_race
+    columns = {cube: j for j, cube in enumerate(_worker_cubes)}
+
+    chunk = {
+        "race_id": np.arange(start, start + count, dtype=np.int64),
+        "turns": np.zeros(count, dtype=np.uint32),
+        "rank": np.zeros((count, len(columns)), dtype=np.uint8),
+        "progress": np.zeros((count, len(columns)), dtype=np.int32),
+    }
+    on_turn = None
+    if _worker_trace:
+        chunk["draws"] = np.zeros(count, dtype=np.uint32)
+        chunk["first_turn"] = np.zeros(count, dtype=np.uint64)
+        orders: list[list[int]] = []
+        rolls: list[list[int]] = []
+
+        def on_turn(race: Race):
+            orders.append([columns[cube] for cube in race.cubes_order_this_turn])
+            rolls.append([cube.base_roll for cube in _worker_cubes])
+
+    for r in range(count):
+        if _worker_trace:
+            chunk["first_turn"][r] = len(orders)
+        _run_race(seed, start + r, on_turn)
+        chunk["turns"][r] = race.turn
+
+        for i, cube in enumerate(race.compute_rankings()):
+            chunk["rank"][r, columns[cube]] = i + 1
+
+        for cube, j in columns.items():
+            chunk["progress"][r, j] = cube.progress
+
+        if _worker_trace:
+            chunk["draws"][r] = race.rng.drawn
+
+    if _worker_trace:
+        shape = (len(orders), len(columns))
+        chunk["order"] = np.array(orders, dtype=np.uint8).reshape(shape)
+        chunk["roll"] = np.array(rolls, dtype=np.int8).reshape(shape)
+
+    return chunk
+
+
+def simulate_chunks(
+    track: Track,
+    cubes: list[Cube],
+    num_simulation: int,
+    laps: int = 1,
+    workers: int | None = None,
+    chunk_size: int = 1000,
+    seed: int | None = None,
+    progress: bool = True,
+    engine: str = "object",
+    state: RaceState | None = None,
+    trace: bool = False,
+    start: int = 0,
+    rng: Callable[[], RaceRNG] | None = None,
+    fast_forward: bool = True,
+) -> Iterator[dict[str, np.ndarray]]:
+    """
+    Simulate `num_simulation` races over a process pool, yielding result chunks in
+    race order as they complete (see `_simulate_chunk` for the chunk layout).
+
+    Every race is seeded from `seed` and its index, so a given seed produces the
+    same results whether it runs on 1 worker or 32, in chunks of any size (the
+    numpy engine draws per chunk, so its results do depend on `chunk_size`).
+
+    `engine="numpy"` simulates each chunk in lockstep with `BatchRace` (use a larger
+    `chunk_size`, e.g. 10000, to benefit), falling back to the object `Race` for
+    setups it does not support.
+
+    `state` continues every race from a `Race.snapshot()` of a race over the same
+    lineup (e.g. after `Race.setup`) instead of starting from the cubes' offsets.
+
+    `trace=True` runs every race on the object engine and adds the number of draws
+    each made, and every turn's move order and rolls, to the chunks, for
+    `traces.TraceWriter` (races are replayed with a plain `RaceRNG`, so `rng` cannot
+    be given as well).
+
+    `start` skips the races before it, e.g. to resume an interrupted run. Resuming
+    at a chunk boundary keeps the numpy engine's chunks (and results) unchanged.
+
+    `rng` makes each worker's `RaceRNG` on the object engine, e.g.
+    `rng.CubeStreamsRNG` (a picklable callable such as a class or a
+    `functools.partial`).
+
+    `fast_forward=False` moves cubes one step at a time (see `Race.fast_forward`),
+    on the object engine, e.g. as the reference the shortcuts are tested against.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    if trace and rng is not None:
+        raise ValueError("Traced races are replayed with a plain RaceRNG, so rng must be None")
+
+    workers = workers or os.cpu_count() or 1
+    seed = random.randrange(2**32) if seed is None else seed
+
+    starts = range(start, num_simulation, chunk_size)
+    counts = [min(chunk_size, num_simulation - s) for s in starts]
+
+    with tqdm(total=num_simulation, initial=start, disable=not progress) as bar:
+        initargs = (track, cubes, laps, engine, state, trace, rng, fast_forward)
+        yield from _run_chunks(
+            _init_worker, initargs, _simulate_chunk, seed, starts, counts, workers, bar
+        )
+
+
+def _run_chunks(
+    initializer: Callable,
+    initargs: tuple,
+    task: Callable[[int, int, int], dict],
+    seed: int,
+    starts: range,
+    counts: list[int],
+    workers: int,
+    bar: tqdm,
+) -> Iterator[dict[str, np.ndarray]]:
+    """
+    Run `task(seed, start, count)` for every chunk on `workers` processes set up by
+    `initializer(*initargs)` (or in this process, on copies, for 1 worker), yielding
+    the results in chunk order.
+    """
+    if workers == 1:
+        initializer(*copy.deepcopy(initargs))
+        for s, c in zip(starts, counts):
+            yield task(seed, s, c)
+            bar.update(c)
+        return
+
+    # nb: Chunks are submitted lazily with a bounded number in flight, so memory
+    #     stays flat for huge runs and a consumer that stops early (e.g. adaptive
+    #     stopping) does not wait for the rest of the queue.
+    jobs = iter(zip(starts, counts))
+    pending: collections.deque[Future] = collections.deque()
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs
+    ) as executor:
+        try:
+            for s, c in itertools.islice(jobs, 2 * workers):
+                pending.append(executor.submit(task, seed, s, c))
+
+            while pending:
+                chunk = pending.popleft().result()
+                for s, c in itertools.islice(jobs, 1):
+                    pending.append(executor.submit(task, seed, s, c))
+
+                yield chunk
+                bar.update(len(chunk["race_id"]))
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def simulate(
+    track: Track,
+    cubes: list[Cube],
+    num_simulation: int,
+    laps: int = 1,
+    **kwargs,
+) -> dict[str, list[int]]:
+    """
+    Simulate races and collect the rank of every cube in every race as
+    `{cube class name: [rank, ...]}`. Takes the same options as `simulate_chunks`.
+    """
+    rank_history = {cube.__class__.__name__: [] for cube in cubes}
+
+    for chunk in simulate_chunks(track, cubes, num_simulation, laps, **kwargs):
+        for j, cube in enumerate(cubes):
+            if cube.rankable:
+                rank_history[cube.__class__.__name__] += chunk["rank"][:, j].tolist()
+
+    return rank_history
+
+
+def simulate_to_store(
+    path: str,
+    track: Track,
+    cubes: list[Cube],
+    num_simulation: int,
+    laps: int = 1,
+    trace_path: str | None = None,
+    resume: bool = False,
+    **kwargs,
+) -> str:
+    """
+    Simulate races and stream every chunk to a columnar result store at `path`
+    (see `results.ResultStore`), and their traces to `trace_path` if given (see
+    `traces.TraceReader`). Takes the same options as `simulate_chunks`.
+
+    The store records its job and is complete up to its last chunk at any time, so
+    it doubles as a checkpoint: `resume=True` continues an interrupted store (with
+    its seed, unless another is given) and ends up identical to an uninterrupted
+    run, or extends a finished one to `num_simulation` races.
+    """
+    names = [cube.__class__.__name__ for cube in cubes]
+    rankable = [cube.rankable for cube in cubes]
+    trace = trace_path is not None
+
+    saved = _stored_job(path) if resume else None
+    kwargs["seed"] = resolve_seed(kwargs.get("seed"), saved)
+    job = _job(track, cubes, laps, kwargs)
+
+    with contextlib.ExitStack() as stack:
+        writer = stack.enter_context(ResultWriter(path, names, rankable, job, resume))
+        if trace:
+            tracer = stack.enter_context(TraceWriter(trace_path, job, resume=resume))
+            tracer.truncate(writer.num_races)
+
+        chunks = simulate_chunks(
+            track, cubes, num_simulation, laps, trace=trace, start=writer.num_races, **kwargs
+        )
+        for chunk in chunks:
+            # nb: the trace goes first, so it is never behind the store
+            if trace:
+                tracer.write(chunk)
+            writer.write(chunk)
+
+    return path
+
+
+def _stored_job(path: str) -> dict | None:
+    try:
+        return ResultStore(path).job
+    except FileNotFoundError:
+        return None
+
+
+def _job(track: Track, cubes: list[Cube], laps: int, kwargs: dict) -> dict:
+    """`checkpoint.job_spec` of a run with `simulate_chunks` options `kwargs`"""
+    return job_spec(
+        track,
+        cubes,
+        laps,
+        kwargs["seed"],
+        kwargs.get("engine", "object"),
+        kwargs.get("chunk_size", 1000),
+        kwargs.get("state"),
+    )
+
+
+def _resume(
+    path: str, interval: float, track: Track, cubes: list[Cube], laps: int, kwargs: dict
+) -> tuple[Checkpoint, RankAggregator]:
+    """Checkpoint of an aggregating run, and its aggregator resumed from `path`"""
+    saved = Checkpoint.read(path)
+    kwargs["seed"] = resolve_seed(kwargs.get("seed"), saved and saved["job"])
+
+    checkpoint = Checkpoint(path, _job(track, cubes, laps, kwargs), interval)
+    progress = checkpoint.load()
+
+    if progress is None:
+        return checkpoint, RankAggregator.from_cubes(cubes)
+    return checkpoint, RankAggregator.from_dict(progress["aggregator"])
+
+
+def aggregate(
+    track: Track,
+    cubes: list[Cube],
+    num_simulation: int,
+    laps: int = 1,
+    checkpoint: str | None = None,
+    checkpoint_interval: float = 60.0,
+    **kwargs,
+) -> RankAggregator:
+    """
+    Simulate races into a `RankAggregator` without keeping individual ranks, so
+    memory stays constant in the number of races. Takes the same options as
+    `simulate_chunks`.
+
+    With a `checkpoint` file, the aggregator is saved there at most every
+    `checkpoint_interval` seconds and at the end, and a run finds and resumes it
+    (with its seed, unless another is given), giving the same result as an
+    uninterrupted run.
+    """
+    saver = None
+    aggregator = RankAggregator.from_cubes(cubes)
+    if checkpoint is not None:
+        saver, aggregator = _resume(checkpoint, checkpoint_interval, track, cubes, laps, kwargs)
+
+    chunks = simulate_chunks(track, cubes, num_simulation, laps, start=aggregator.count, **kwargs)
+    for chunk in chunks:
+        aggregator.update_ranks(chunk["rank"])
+        if saver is not None:
+            saver.save({"aggregator": aggregator.to_dict()})
+
+    if saver is not None:
+        saver.save({"aggregator": aggregator.to_dict()}, force=True)
+    return aggregator
+
+
+def simulate_until(
+    track: Track,
+    cubes: list[Cube],
+    tolerance: float,
+    laps: int = 1,
+    confidence: float = 0.95,
+    min_races: int = 1000,
+    max_races: int = 1_000_000,
+    checkpoint: str | None = None,
+    checkpoint_interval: float = 60.0,
+    **kwargs,
+) -> RankAggregator:
+    """
+    Simulate in chunks until every cube's P(rank=1) and mean rank confidence interval
+    half-widths are within `tolerance`, or `max_races` have run. The returned
+    aggregator's `count` is the number of races actually used.
+
+    Stopping is only checked at chunk boundaries, so a given seed stops at the same
+    race count for any number of workers. Takes the same options as `simulate_chunks`,
+    and checkpoints like `aggregate`.
+    """
+    saver = None
+    aggregator = RankAggregator.from_cubes(cubes)
+    if checkpoint is not None:
+        saver, aggregator = _resume(checkpoint, checkpoint_interval, track, cubes, laps, kwargs)
+
+    def done() -> bool:
+        return aggregator.count >= min_races and aggregator.converged(tolerance, confidence)
+
+    # nb: a resumed run may already be done, or it would overshoot by a chunk
+    if not (aggregator.count and done()):
+        chunks = simulate_chunks(track, cubes, max_races, laps, start=aggregator.count, **kwargs)
+        for chunk in chunks:
+            aggregator.update_ranks(chunk["rank"])
+            if done():
+                break
+            if saver is not None:
+                saver.save({"aggregator": aggregator.to_dict()})
+
+    if saver is not None:
+        saver.save({"aggregator": aggregator.to_dict()}, force=True)
+    return aggregator
+
+
+# --- Parameter Variants --- #
+
+Variant = dict[tuple[int, str], float]
+
+_worker_variants: list[Variant] = []
+_worker_defaults: Variant = {}
+
+
+def _init_variants_worker(
+    track: Track,
+    cubes: list[Cube],
+    laps: int,
+    variants: list[Variant],
+    state: RaceState | None = None,
+):
+    global _worker_variants, _worker_defaults
+    _init_worker(track, cubes, laps, state=state, rng=CubeStreamsRNG)
+    _worker_variants = variants
+    _worker_defaults = {
+        (j, attr): getattr(cubes[j], attr) for variant in variants for j, attr in variant
+    }
+
+
+def _simulate_variants_chunk(seed: int, start: int, count: int) -> dict[str, np.ndarray]:
+    """
+    Simulate races [start, start + count) once per variant, as `_simulate_chunk`,
+    with `rank` of shape (races, variants, cubes)
+    """
+    columns = {cube: j for j, cube in enumerate(_worker_cubes)}
+    chunk = {
+        "race_id": np.arange(start, start + count, dtype=np.int64),
+        "rank": np.zeros((count, len(_worker_variants), len(columns)), dtype=np.uint8),
+    }
+
+    for v, variant in enumerate(_worker_variants):
+        for (j, attr), default in _worker_defaults.items():
+            setattr(_worker_cubes[j], attr, variant.get((j, attr), default))
+
+        for r in range(count):
+            _run_race(seed, start + r)
+            for i, cube in enumerate(_worker_race.compute_rankings()):
+                chunk["rank"][r, v, columns[cube]] = i + 1
+
+    return chunk
+
+
+def simulate_variants(
+    track: Track,
+    cubes: list[Cube],
+    variants: list[Variant],
+    num_simulation: int,
+    laps: int = 1,
+    workers: int | None = None,
+    chunk_size: int = 1000,
+    seed: int | None = None,
+    progress: bool = True,
+    state: RaceState | None = None,
+) -> Iterator[dict[str, np.ndarray]]:
+    """
+    Simulate `num_simulation` races once per variant of the lineup, in one job, and
+    yield chunks as `simulate_chunks` with a `rank` of shape (races, variants, cubes).
+    A variant maps `(lineup index, attribute)` to a value, e.g. `{(2, "p"): 0.5}`, and
+    leaves every other attribute at the cube's own value.
+
+    Race i of every variant draws the same random numbers, with a stream per cube
+    (see `rng.CubeStreamsRNG`), so the variants' results differ by the effect of the
+    parameters far more than by chance (common random numbers).
+    """
+    workers = workers or os.cpu_count() or 1
+    seed = random.randrange(2**32) if seed is None else seed
+
+    starts = range(0, num_simulation, chunk_size)
+    counts = [min(chunk_size, num_simulation - s) for s in starts]
+
+    with tqdm(total=num_simulation, disable=not progress) as bar:
+        initializer, task = _init_variants_worker, _simulate_variants_chunk
+        initargs = (track, cubes, laps, variants, state)
+        yield from _run_chunks(initializer, initargs, task, seed, starts, counts, workers, bar)
+
+
+def fork(race: Race, num_simulation: int, **kwargs) -> RankAggregator:
+    """
+    Simulate `num_simulation` continuations of a race from its current state (e.g.
+    a board built with `Race.setup`) and aggregate their final rankings, giving rank
+    distributions conditional on that state. Takes the same options as
+    `simulate_chunks`; the progress bar is off by default.
+    """
+    kwargs.setdefault("progress", False)
+    return aggregate(
+        race.track,
+        list(race.lineup),
+        num_simulation,
+        race.laps,
+        state=race.snapshot(),
+        **kwargs,
+    )
+
+
+def profile(
+    track: Track,
+    cubes: list[Cube],
+    num_simulation: int,
+    laps: int = 1,
+    seed: int | None = None,
+    state: RaceState | None = None,
+) -> RaceStats:
+    """
+    Simulate races in this process on the object engine with instrumentation on,
+    returning the `RaceStats` summed over all of them. Races are seeded as in
+    `simulate_chunks`, so a seed replays the same races.
+    """
+    seed = random.randrange(2**32) if seed is None else seed
+
+    _init_worker(*copy.deepcopy((track, cubes)), laps, "object", state)
+    stats = _worker_race.stats = RaceStats()
+
+    _simulate_chunk(seed, 0, num_simulation)
+    return stats
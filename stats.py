@@ -0,0 +1,322 @@
+from __future__ import annotations
+from collections import Counter
+from statistics import NormalDist
+from typing import TYPE_CHECKING
+import time
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from cubes import Cube
+    from race import Race
+    from track import Pad
+
+
+class RankAggregator:
+    """
+    Online rank statistics for a lineup, kept as a per-cube rank histogram plus
+    running rank sums, so memory stays O(cubes^2) however many races are fed in.
+
+    Attributes:
+        cubes: Cube class names in lineup order.
+        rankable: Whether each cube is ranked (e.g. Abbowser is not).
+        counts: `counts[j, k]` is the number of races cube j finished at rank k + 1.
+        rank_sum: Sum of ranks per cube.
+        rank_sq_sum: Sum of squared ranks per cube.
+    """
+
+    def __init__(self, cubes: list[str], rankable: list[bool] | None = None):
+        self.cubes = cubes
+        self.rankable = rankable if rankable is not None else [True] * len(cubes)
+        self.num_ranks = sum(self.rankable)
+        self.count: int = 0
+
+        # nb: integer sums keep the moments exact, so merging batches in any order
+        #     gives bit-identical results.
+        self.counts = np.zeros((len(cubes), self.num_ranks), dtype=np.int64)
+        self.rank_sum = np.zeros(len(cubes), dtype=np.int64)
+        self.rank_sq_sum = np.zeros(len(cubes), dtype=np.int64)
+
+    @classmethod
+    def from_cubes(cls, cubes: list[Cube]) -> RankAggregator:
+        return cls(
+            [cube.__class__.__name__ for cube in cubes],
+            [cube.rankable for cube in cubes],
+        )
+
+    def update(self, rankings: list[Cube], lineup: list[Cube]):
+        """
+        Record one race from `Race.compute_rankings()` over `lineup` (`Race.lineup`).
+        Cubes are matched to their lineup index, as in `update_ranks`, so a lineup
+        with two cubes of one class keeps them apart.
+        """
+        columns = {cube: j for j, cube in enumerate(lineup)}
+        for i, cube in enumerate(rankings):
+            j = columns[cube]
+            self.counts[j, i] += 1
+            self.rank_sum[j] += i + 1
+            self.rank_sq_sum[j] += (i + 1) ** 2
+        self.count += 1
+
+    def update_ranks(self, rank: np.ndarray):
+        """
+        Record a batch of races from a (races, cubes) rank array in lineup order,
+        with rank 0 for unrankable cubes (the layout of simulation chunks).
+        """
+        rank = np.asarray(rank, dtype=np.int64)
+
+        for j, rankable in enumerate(self.rankable):
+            if rankable:
+                self.counts[j] += np.bincount(rank[:, j] - 1, minlength=self.num_ranks)
+                self.rank_sum[j] += rank[:, j].sum()
+                self.rank_sq_sum[j] += (rank[:, j] ** 2).sum()
+        self.count += rank.shape[0]
+
+    def to_dict(self) -> dict:
+        """JSON-serializable copy of the aggregator (see `from_dict`)"""
+        return {
+            "cubes": self.cubes,
+            "rankable": self.rankable,
+            "count": self.count,
+            "counts": self.counts.tolist(),
+            "rank_sum": self.rank_sum.tolist(),
+            "rank_sq_sum": self.rank_sq_sum.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> RankAggregator:
+        aggregator = cls(data["cubes"], data["rankable"])
+        aggregator.count = data["count"]
+        aggregator.counts[:] = data["counts"]
+        aggregator.rank_sum[:] = data["rank_sum"]
+        aggregator.rank_sq_sum[:] = data["rank_sq_sum"]
+        return aggregator
+
+    def merge(self, other: RankAggregator) -> RankAggregator:
+        """Add another aggregator over the same lineup into this one"""
+        if other.cubes != self.cubes:
+            raise ValueError(f"Cannot merge lineups {self.cubes} and {other.cubes}")
+
+        self.counts += other.counts
+        self.rank_sum += other.rank_sum
+        self.rank_sq_sum += other.rank_sq_sum
+        self.count += other.count
+        return self
+
+    def reorder(self, order: list[int]) -> RankAggregator:
+        """Copy with the cubes in another lineup order: cube j of the copy is cube `order[j]`"""
+        aggregator = RankAggregator(
+            [self.cubes[j] for j in order], [self.rankable[j] for j in order]
+        )
+        aggregator.count = self.count
+        aggregator.counts[:] = self.counts[order]
+        aggregator.rank_sum[:] = self.rank_sum[order]
+        aggregator.rank_sq_sum[:] = self.rank_sq_sum[order]
+        return aggregator
+
+    # --- Statistics --- #
+
+    def _ranked(self) -> list[int]:
+        return [j for j, rankable in enumerate(self.rankable) if rankable]
+
+    def mean(self) -> np.ndarray:
+        return self.rank_sum / max(self.count, 1)
+
+    def std(self) -> np.ndarray:
+        mean = self.mean()
+        return np.sqrt(np.maximum(self.rank_sq_sum / max(self.count, 1) - mean**2, 0))
+
+    def median(self) -> np.ndarray:
+        """Median rank per cube, matching `np.median` over the raw ranks"""
+        cumulative = np.cumsum(self.counts, axis=1)
+
+        def nth_rank(n: int) -> np.ndarray:
+            # nb: rank of the n-th (0-based) race once each cube's ranks are sorted
+            return np.argmax(cumulative > n, axis=1) + 1
+
+        return (nth_rank((self.count - 1) // 2) + nth_rank(self.count // 2)) / 2
+
+    def probabilities(self) -> np.ndarray:
+        """`P[j, k]` is the probability that cube j finishes at rank k + 1"""
+        return self.counts / max(self.count, 1)
+
+    def confidence_intervals(self, confidence: float = 0.95) -> pd.DataFrame:
+        """
+        Half-widths of the confidence intervals on each ranked cube's P(rank=1)
+        (Wilson score interval) and mean rank (normal approximation).
+        """
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        n = max(self.count, 1)
+        p = self.probabilities()[:, 0] if self.num_ranks else np.zeros(len(self.cubes))
+
+        # nb: Wilson rather than Wald, so a cube that has not won yet still gets a
+        #     non-zero interval instead of looking settled after a few races.
+        p_width = z / (1 + z**2 / n) * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2))
+        mean_width = z * self.std() / np.sqrt(n)
+
+        analysis = {
+            self.cubes[j]: {
+                "P(rank=1)": p[j],
+                "P(rank=1) ±": p_width[j],
+                "Mean Rank": self.mean()[j],
+                "Mean Rank ±": mean_width[j],
+            }
+            for j in self._ranked()
+        }
+        return pd.DataFrame(analysis).T
+
+    def converged(self, tolerance: float, confidence: float = 0.95) -> bool:
+        """Whether every P(rank=1) and mean rank interval half-width is within `tolerance`"""
+        intervals = self.confidence_intervals(confidence)
+        widths = intervals[["P(rank=1) ±", "Mean Rank ±"]].to_numpy()
+        return self.count > 0 and bool((widths <= tolerance).all())
+
+    def summary(self) -> pd.DataFrame:
+        """Mean/median/std rank and P(top1..3) per ranked cube, as in the Notebook"""
+        p = np.cumsum(self.probabilities(), axis=1)
+        mean, median, std = self.mean(), self.median(), self.std()
+
+        analysis = {
+            self.cubes[j]: {
+                "Mean Rank": mean[j],
+                "Median Rank": median[j],
+                "Std Rank": std[j],
+                **{f"P(top{k})": p[j, k - 1] for k in range(1, min(3, self.num_ranks) + 1)},
+            }
+            for j in self._ranked()
+        }
+        return pd.DataFrame(analysis).T.sort_values(by="P(top1)", ascending=False)
+
+    def rank_probabilities(self) -> pd.DataFrame:
+        """P(rank=k) for every rank k per ranked cube"""
+        p = self.probabilities()
+
+        analysis = {
+            self.cubes[j]: {f"P(rank={k + 1})": p[j, k] for k in range(self.num_ranks)}
+            for j in self._ranked()
+        }
+        return pd.DataFrame(analysis).T.sort_values(by="P(rank=1)", ascending=False)
+
+
+class RaceStats:
+    """
+    Instrumentation counters and hook timings, summed over every race run by the
+    `Race`s it is attached to (`Race(..., stats=RaceStats())` or `race.stats = ...`).
+    A race without stats only pays an `is None` check at each instrumented point.
+
+    Attributes:
+        races: Number of races run to the end by `Race.run()`.
+        turn_counts: Number of races that took each number of turns.
+        moves: Number of cube moves, and `steps` the pads they asked to move.
+        fast_forwards: Moves (and landing chains) resolved without stepping.
+        encounters: Encounter hook calls (only dispatched to subscribed cubes).
+        pad_triggers: Landings per pad class, including Thruster/Blocker chains
+            followed via `Track.landings` without calling the pads.
+        ranking_hits, ranking_misses: `compute_rankings` calls served as they were
+            and calls that repositioned the cubes moved since the last one.
+        hook_calls, hook_time: Calls and seconds per (class name, hook). Times are
+            inclusive, so a hook that moves a cube includes the hooks that move fires.
+    """
+
+    def __init__(self):
+        self.races = 0
+        self.turn_counts: Counter[int] = Counter()
+        self.moves = 0
+        self.steps = 0
+        self.fast_forwards = 0
+        self.encounters = 0
+        self.pad_triggers: Counter[str] = Counter()
+        self.ranking_hits = 0
+        self.ranking_misses = 0
+        self.hook_calls: Counter[tuple[str, str]] = Counter()
+        self.hook_time: Counter[tuple[str, str]] = Counter()
+
+    # nb: the methods below are called by the race at each instrumented point, and
+    #     can be extended to observe more (see `traces.EventRecorder`)
+
+    def start(self, race: Race):
+        """A race starts (or continues from a restored state)"""
+
+    def end_turn(self, race: Race):
+        """A turn is over (or the race is, if a cube won during it)"""
+
+    def move(self, cube: Cube, steps: int):
+        """`cube` starts moving `steps` pads"""
+        self.moves += 1
+        self.steps += abs(steps)
+
+    def land(self, pad: Pad, cube: Cube):
+        """`cube` lands on a pad with an `on_land` effect"""
+        self.pad_triggers[pad.__class__.__name__] += 1
+
+    def call(self, obj: Cube | Pad, hook: str, *args):
+        """Call `obj`'s `hook` and time it"""
+        start = time.perf_counter()
+        try:
+            return getattr(obj, hook)(*args)
+        finally:
+            key = (obj.__class__.__name__, hook)
+            self.hook_time[key] += time.perf_counter() - start
+            self.hook_calls[key] += 1
+
+    def finish(self, race: Race):
+        """Record a finished race"""
+        self.races += 1
+        self.turn_counts[race.turn] += 1
+
+    def merge(self, other: RaceStats) -> RaceStats:
+        """Add the stats of other races (e.g. from another process) into these"""
+        for attr in vars(RaceStats()):
+            value = getattr(other, attr)
+            if isinstance(value, Counter):
+                getattr(self, attr).update(value)
+            else:
+                setattr(self, attr, getattr(self, attr) + value)
+        return self
+
+    # --- Summaries --- #
+
+    def counters(self) -> pd.Series:
+        turns = sum(turns * n for turns, n in self.turn_counts.items())
+        lookups = self.ranking_hits + self.ranking_misses
+
+        counters = {
+            "races": self.races,
+            "turns": turns,
+            "turns/race": turns / max(self.races, 1),
+            "max turns": max(self.turn_counts, default=0),
+            "moves": self.moves,
+            "steps": self.steps,
+            "fast-forwarded": self.fast_forwards,
+            "encounters": self.encounters,
+            "ranking cache hits": self.ranking_hits,
+            "ranking cache misses": self.ranking_misses,
+            "ranking cache hit rate": self.ranking_hits / max(lookups, 1),
+        }
+        for name, n in sorted(self.pad_triggers.items()):
+            counters[f"{name} landings"] = n
+
+        return pd.Series(counters, dtype=object)
+
+    def hooks(self) -> pd.DataFrame:
+        """Calls and time per (class, hook), slowest first"""
+        analysis = pd.DataFrame(
+            {
+                "calls": pd.Series(self.hook_calls, dtype=np.int64),
+                "seconds": pd.Series(self.hook_time, dtype=np.float64),
+            }
+        )
+        analysis.index.names = ["class", "hook"]
+        analysis["us/call"] = 1e6 * analysis["seconds"] / analysis["calls"]
+        analysis["us/race"] = 1e6 * analysis["seconds"] / max(self.races, 1)
+        return analysis.sort_values(by="seconds", ascending=False)
+
+    def summary(self) -> pd.DataFrame:
+        """Hook time per cube or pad class, slowest first"""
+        if not self.hook_calls:
+            return pd.DataFrame(columns=["calls", "seconds", "us/race"])
+
+        analysis = self.hooks()[["calls", "seconds"]].groupby(level="class").sum()
+        analysis["us/race"] = 1e6 * analysis["seconds"] / max(self.races, 1)
+        return analysis.sort_values(by="seconds", ascending=False)
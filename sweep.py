@@ -0,0 +1,157 @@
+from __future__ import annotations
+import ast
+import functools
+import hashlib
+import json
+import os
+
+from checkpoint import describe
+from cubes import Cube
+from simulation import aggregate
+from stats import RankAggregator
+from track import Track
+
+CACHE_DIR = ".sweep_cache"
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+Config = tuple[Track, list[Cube], int]
+
+# nb: `simulate_chunks` options that change the results but are not part of the
+#     cache key (see `config_key`)
+UNCACHED_OPTIONS = ("state", "start", "rng")
+
+
+def simulator_modules(entry: str = "simulation") -> list[str]:
+    """
+    Names of `entry` and every module of this repository it imports, directly or
+    through other modules: any change to them can change simulated results.
+    """
+    modules = set()
+    pending = [entry]
+
+    while pending:
+        name = pending.pop()
+        path = os.path.join(ROOT, f"{name}.py")
+        if name in modules or not os.path.exists(path):
+            continue
+        modules.add(name)
+
+        with open(path, "rb") as fp:
+            tree = ast.parse(fp.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending += [alias.name.partition(".")[0] for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                pending.append(node.module.partition(".")[0])
+
+    return sorted(modules)
+
+
+@functools.cache
+def source_version() -> str:
+    """Hash of the simulator's source code (see `simulator_modules`)"""
+    digest = hashlib.sha256()
+    for name in simulator_modules():
+        digest.update(name.encode())
+        with open(os.path.join(ROOT, f"{name}.py"), "rb") as fp:
+            digest.update(fp.read())
+    return digest.hexdigest()
+
+
+def canonical_order(track: Track, cubes: list[Cube]) -> list[int]:
+    """
+    Lineup indices of `cubes` in a canonical order. Races shuffle the lineup, so
+    lineups of the same cubes listed in different orders are the same config.
+    """
+    entries = describe(track, cubes)["cubes"]
+    return sorted(range(len(cubes)), key=lambda j: json.dumps(entries[j], sort_keys=True))
+
+
+def config_key(
+    track: Track,
+    cubes: list[Cube],
+    laps: int,
+    num_simulation: int,
+    seed: int,
+    engine: str = "object",
+    chunk_size: int = 1000,
+) -> str:
+    """
+    Content hash of a config, its simulation settings and the simulator source. The
+    cubes are hashed in `canonical_order`, so every order of a lineup shares a key.
+    """
+    settings = {"races": num_simulation, "seed": seed, "engine": engine}
+
+    # nb: only the numpy engine's draws depend on how races are chunked
+    if engine == "numpy":
+        settings["chunk_size"] = chunk_size
+
+    key = {
+        "config": describe(track, [cubes[j] for j in canonical_order(track, cubes)], laps),
+        "settings": settings,
+        "source": source_version(),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _load(path: str) -> RankAggregator | None:
+    if not os.path.exists(path):
+        return None
+    with open(path) as fp:
+        return RankAggregator.from_dict(json.load(fp)["result"])
+
+
+def _save(path: str, config: dict, aggregator: RankAggregator):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fp:
+        json.dump({"config": config, "result": aggregator.to_dict()}, fp)
+    os.replace(tmp, path)
+
+
+def sweep(
+    configs: list[Config],
+    num_simulation: int,
+    seed: int = 0,
+    cache_dir: str = CACHE_DIR,
+    **kwargs,
+) -> list[RankAggregator]:
+    """
+    Aggregate `num_simulation` races for each `(track, cubes, laps)` config, in order.
+
+    Results are cached in `cache_dir` under a hash of the config, the simulation
+    settings and the simulator source (see `config_key`). Only configs missing from
+    the cache are simulated, and duplicate configs (including the same lineup in
+    another order) are simulated once. Each result follows its config's lineup
+    order. Takes the same options as `simulate_chunks`, except `UNCACHED_OPTIONS`;
+    `seed` must be fixed, since the cache is keyed by it.
+    """
+    # nb: `seed=None` would simulate a random seed and cache it under the key "None"
+    if seed is None:
+        raise ValueError("sweep caches results by seed, so it needs a fixed seed")
+    if uncached := sorted(set(kwargs) & set(UNCACHED_OPTIONS)):
+        raise ValueError(f"sweep cannot cache results of options {uncached}")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    engine = kwargs.get("engine", "object")
+    chunk_size = kwargs.get("chunk_size", 1000)
+
+    # nb: results are simulated and cached in canonical order, then put back into
+    #     each config's own order
+    results: dict[str, RankAggregator] = {}
+    out = []
+
+    for track, cubes, laps in configs:
+        order = canonical_order(track, cubes)
+        key = config_key(track, cubes, laps, num_simulation, seed, engine, chunk_size)
+
+        if key not in results:
+            path = os.path.join(cache_dir, f"{key}.json")
+            if (aggregator := _load(path)) is None:
+                canonical = [cubes[j] for j in order]
+                aggregator = aggregate(track, canonical, num_simulation, laps, seed=seed, **kwargs)
+                _save(path, describe(track, canonical, laps), aggregator)
+            results[key] = aggregator
+
+        out.append(results[key].reorder(sorted(range(len(order)), key=order.__getitem__)))
+
+    return out
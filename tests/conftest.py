@@ -0,0 +1,6 @@
+from __future__ import annotations
+import os
+import sys
+
+# nb: the modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from cubes import Cube
+from race import Race
+from rng import RaceRNG
+from track import Pad, Track
+
+LENGTH = 30
+
+
+def make_race(
+    cubes: list[Cube],
+    pads: list[Pad] | None = None,
+    laps: int = 1,
+    fast_forward: bool = True,
+) -> Race:
+    """A seeded race on a plain track, checking its location and ranking indexes"""
+    track = Track.create(length=LENGTH, custom_pads=pads)
+    race = Race(track, cubes, laps, debug=True, rng=RaceRNG(0))
+    race.fast_forward = fast_forward
+    return race
+
+
+def fixed(cube: Cube, steps: int) -> Cube:
+    """Make `cube` roll `steps` every time"""
+
+    def roll(race: Race):
+        cube.base_roll = steps
+        cube.steps = steps
+
+    cube.roll = roll
+    return cube
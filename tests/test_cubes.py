@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+from benchmark import implemented_cubes
+from helpers import LENGTH, fixed, make_race
+from cubes import (
+    Abbowser,
+    Aemeath,
+    Augusta,
+    Calcharo,
+    Carlotta,
+    Cartethyia,
+    Changli,
+    Chisa,
+    Cube,
+    Denia,
+    Hiyuki,
+    Iuno,
+    Jinhsi,
+    Luuk,
+    Lynae,
+    Mornye,
+    Phoebe,
+    Phrolova,
+    Roccia,
+    Shorekeeper,
+    Sigrika,
+)
+from race import Race
+from track import BlockerPad, ThrusterPad
+
+
+def stack(race: Race, p: int) -> list[Cube]:
+    return race.track.pads[p].cubes
+
+
+# --- Rules every cube follows --- #
+
+
+def test_cube_carries_the_cubes_above_it():
+    bottom, top, other = fixed(Cube(2), 2), fixed(Cube(2), 0), fixed(Cube(0), 1)
+    race = make_race([bottom, top, other])
+    race.cubes_order_next_turn = [bottom, top, other]
+
+    race.start_turn()
+    assert stack(race, 4) == [bottom, top]
+    assert stack(race, 1) == [other]
+
+
+def test_top_of_the_stack_wins_a_tie():
+    bottom, top = fixed(Cube(LENGTH - 1), 1), fixed(Cube(LENGTH - 1), 0)
+    race = make_race([bottom, top])
+    race.cubes_order_next_turn = [bottom, top]
+
+    assert race.start_turn() is top
+    assert race.compute_rankings() == [top, bottom]
+
+
+def test_every_implemented_cube_has_a_rule_test():
+    missing = [name for name in implemented_cubes() if f"test_{name.lower()}" not in globals()]
+    assert not missing
+
+
+# --- Skills --- #
+
+
+def test_abbowser():
+    abbowser = fixed(Abbowser(LENGTH), -6)
+    phoebe = fixed(Phoebe(28), 1)
+    phoebe.p = 0.0
+    shorekeeper = fixed(Shorekeeper(27), 1)
+
+    race = make_race([phoebe, shorekeeper, abbowser])
+    race.start_turn()
+    assert abbowser.progress == LENGTH
+
+    race.reset()
+    race.turn = 3
+    race.cubes_order_next_turn = [abbowser, phoebe, shorekeeper]
+
+    race.start_turn()
+    assert stack(race, 0) == [abbowser]
+    assert stack(race, 25) == [phoebe, shorekeeper]
+
+
+def test_aemeath():
+    aemeath = fixed(Aemeath(14), 2)
+    abbowser = fixed(Abbowser(18), -1)
+    phoebe = fixed(Phoebe(20), 1)
+    phoebe.p = 0.0
+
+    race = make_race([abbowser, aemeath, phoebe])
+    race.cubes_order_next_turn = [aemeath, phoebe, abbowser]
+
+    race.start_turn()
+    assert aemeath.skill_triggered
+    assert aemeath.progress == phoebe.progress == 21
+
+
+def test_augusta():
+    shorekeeper = fixed(Shorekeeper(), 2)
+    augusta = fixed(Augusta(), 1)
+    race = make_race([shorekeeper, augusta])
+    race.cubes_order_next_turn = [augusta, shorekeeper]
+
+    race.start_turn()
+    assert augusta.steps == 0
+    assert race.cubes_order_next_turn[-1] == augusta
+
+
+def test_calcharo():
+    calcharo = Calcharo(1)
+    shorekeeper = Shorekeeper(0)
+    race = make_race([calcharo, shorekeeper])
+    race.cubes_order_next_turn = [shorekeeper, calcharo]
+
+    race.start_turn()
+    assert calcharo.steps == calcharo.base_roll + 3
+
+
+def test_carlotta():
+    carlotta = fixed(Carlotta(), 3)
+    carlotta.p = 1.0
+    race = make_race([carlotta])
+
+    race.start_turn()
+    assert carlotta.steps == 6
+
+
+def test_cartethyia():
+    cartethyia = fixed(Cartethyia(), 1)
+    cartethyia.p = 1.0
+    phoebe = fixed(Phoebe(5), 1)
+    race = make_race([cartethyia, phoebe])
+
+    race.start_turn()
+    assert cartethyia.steps == 1
+    assert cartethyia.skill_triggered
+
+    race.start_turn()
+    assert cartethyia.steps == 3
+
+
+def test_changli():
+    shorekeeper, changli, denia = fixed(Shorekeeper(), 0), fixed(Changli(), 0), fixed(Denia(), 0)
+    changli.p = 1.0
+    race = make_race([shorekeeper, changli, denia])
+
+    race.start_turn()
+    assert race.cubes_order_next_turn[-1] == changli
+
+
+def test_chisa():
+    chisa = fixed(Chisa(), 1)
+    phoebe = fixed(Phoebe(), 2)
+    race = make_race([chisa, phoebe])
+
+    race.start_turn()
+    assert chisa.steps == 3
+
+
+def test_denia():
+    denia = fixed(Denia(), 1)
+    race = make_race([denia])
+
+    race.start_turn()
+    assert denia.steps == 1
+
+    race.start_turn()
+    assert denia.steps == 3
+
+
+def test_hiyuki():
+    hiyuki = fixed(Hiyuki(27), 1)
+    abbowser = fixed(Abbowser(LENGTH), -6)
+    race = make_race([hiyuki, abbowser])
+    race.turn = 3
+    race.cubes_order_next_turn = [hiyuki, abbowser]
+
+    race.start_turn()
+    assert hiyuki.extra_step == 1
+
+    race.start_turn()
+    assert hiyuki.steps == 2
+
+
+def test_iuno():
+    carlotta = fixed(Carlotta(8), 0)
+    carlotta.p = 0.0
+    phoebe = fixed(Phoebe(11), 1)
+    phoebe.p = 0.0
+    iuno = fixed(Iuno(11), 3)
+    shorekeeper = fixed(Shorekeeper(12), 2)
+    abbowser = fixed(Abbowser(17), -1)
+    lynae = fixed(Lynae(18), 1)
+    lynae.p_double = lynae.p_stop = 0.0
+
+    order = [carlotta, shorekeeper, iuno, phoebe, lynae, abbowser]
+    race = make_race(order.copy())
+    race.turn = 3
+    race.cubes_order_next_turn = order
+
+    race.start_turn()
+    assert iuno.skill_triggered
+    assert carlotta.progress == shorekeeper.progress == iuno.progress == 14
+    assert phoebe.progress == 15
+    assert lynae.progress == abbowser.progress == 16
+
+
+def test_jinhsi():
+    jinhsi = fixed(Jinhsi(3), 0)
+    jinhsi.p = 1.0
+    shorekeeper = fixed(Shorekeeper(0), 3)
+    race = make_race([jinhsi, shorekeeper])
+
+    race.start_turn()
+    assert stack(race, 3) == [shorekeeper, jinhsi]
+
+    jinhsi.p = 0.0
+    race.reset()
+
+    race.start_turn()
+    assert stack(race, 3) == [jinhsi, shorekeeper]
+
+
+def test_luuk():
+    luuk = fixed(Luuk(), 1)
+    race = make_race([luuk], pads=[ThrusterPad(1), BlockerPad(10)])
+
+    race.start_turn()
+    assert luuk.progress == 5
+
+    luuk.offset = 9
+    race.reset()
+
+    race.start_turn()
+    assert luuk.progress == 8
+
+
+def test_lynae():
+    lynae = fixed(Lynae(), 2)
+    race = make_race([lynae])
+
+    lynae.p_double, lynae.p_stop = 1.0, 0.0
+    race.start_turn()
+    assert lynae.steps == 4
+
+    lynae.p_double, lynae.p_stop = 0.0, 1.0
+    race.reset()
+    race.start_turn()
+    assert lynae.steps == 0
+
+
+def test_mornye():
+    mornye = Mornye()
+    race = make_race([mornye])
+
+    # nb: the move-order rolls use up every other face
+    for steps in (3, 2, 1, 3):
+        race.start_turn()
+        assert mornye.steps == steps
+
+
+def test_phoebe():
+    phoebe = fixed(Phoebe(), 1)
+    phoebe.p = 1.0
+    race = make_race([phoebe])
+
+    race.start_turn()
+    assert phoebe.steps == 2
+
+
+def test_phrolova():
+    phrolova = fixed(Phrolova(), 2)
+    shorekeeper = Shorekeeper()
+    race = make_race([phrolova, shorekeeper])
+
+    race.start_turn()
+    assert phrolova.steps == 5
+
+
+def test_roccia():
+    roccia = fixed(Roccia(1), 1)
+    phoebe = fixed(Phoebe(1), 3)
+    race = make_race([roccia, phoebe])
+
+    race.start_turn()
+    assert race.cubes_order_this_turn[-1] == roccia
+    assert roccia.steps == 3
+
+
+def test_shorekeeper():
+    shorekeeper = Shorekeeper()
+    race = make_race([shorekeeper])
+
+    rolls = set()
+    for _ in range(100):
+        shorekeeper.roll(race)
+        rolls.add(shorekeeper.steps)
+    assert rolls == {2, 3}
+
+
+def test_sigrika():
+    sigrika = fixed(Sigrika(0), 1)
+    phoebe = fixed(Phoebe(5), 1)
+    phoebe.p = 0.0
+    shorekeeper = fixed(Shorekeeper(6), 3)
+    cube = fixed(Cube(7), 3)
+    race = make_race([sigrika, phoebe, shorekeeper, cube])
+
+    race.start_turn()
+    assert phoebe.steps == 1
+    assert shorekeeper.steps == 2
+    assert cube.steps == 3
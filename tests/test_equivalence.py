@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from benchmark import scenarios
+from cubes import Calcharo, Cube
+from equivalence import (
+    ALPHA,
+    ALTERNATIVES,
+    SYMMETRIC,
+    Distributions,
+    chi_square,
+    compare,
+    reference,
+    threshold,
+    uniformity,
+)
+from stats import RankAggregator
+
+# nb: enough races to catch a broken rule, few enough to keep the suite quick; the
+#     seeds are fixed, so the outcome is deterministic
+RACES = 1000
+
+# nb: identical cubes are held to equal shares of every rank, which takes this many
+#     races to notice one cube's P(rank=1) moving by half a point (a chi-square
+#     noncentrality of about 40 against a threshold of 28)
+SYMMETRIC_RACES = 150_000
+
+SCENARIOS = {scenario.name: scenario for scenario in scenarios()}
+BASELINES: dict[str, Distributions] = {}
+
+
+def baseline(name: str) -> Distributions:
+    if name not in BASELINES:
+        scenario = SCENARIOS[name]
+        BASELINES[name] = Distributions.of(scenario, reference(scenario, RACES, 0, workers=1))
+    return BASELINES[name]
+
+
+def test_chi_square():
+    a = np.array([500, 300, 200])
+    assert chi_square(a, a) == (0.0, 2)
+    assert chi_square(a, a[::-1])[0] > 100
+
+    # nb: sparse cells are pooled into their neighbours
+    assert chi_square(np.array([50, 1, 1, 50]), np.array([50, 1, 1, 50]))[1] == 1
+
+
+@pytest.mark.parametrize("engine", list(ALTERNATIVES))
+def test_engines_match_the_reference(engine):
+    comparison = compare(
+        SCENARIOS["main"], engine, RACES, workers=1, baseline=baseline("main")
+    )
+    assert comparison.equivalent, comparison.table()
+
+
+@pytest.mark.parametrize("name", [name for name in SCENARIOS if name.startswith("cube:")])
+def test_numpy_engine_matches_every_cube(name):
+    comparison = compare(SCENARIOS[name], "numpy", RACES, workers=1, baseline=baseline(name))
+    assert comparison.equivalent, comparison.table()
+
+
+def test_uniformity():
+    ranks = RankAggregator.from_cubes([Cube() for _ in range(4)])
+    ranks.update_ranks(np.array([[1, 2, 3, 4], [2, 3, 4, 1], [3, 4, 1, 2], [4, 1, 2, 3]] * 50))
+    assert uniformity(ranks) == (0.0, 9)
+
+    ranks.update_ranks(np.array([[1, 2, 3, 4]] * 50))
+    assert uniformity(ranks)[0] > 100
+
+
+def test_cube_streams_treat_identical_cubes_alike():
+    chunks = ALTERNATIVES["cube-streams"](SYMMETRIC, SYMMETRIC_RACES, 0, None)
+    statistic, dof = uniformity(Distributions.of(SYMMETRIC, chunks).ranks)
+    assert statistic <= threshold(ALPHA, dof)
+
+
+def test_detects_a_changed_rule(monkeypatch):
+    name = "cube:Calcharo"
+    expected = baseline(name)
+
+    def on_before_move(self, race):
+        if race.compute_rankings()[-1] == self:
+            self.steps += 1
+
+    monkeypatch.setattr(Calcharo, "on_before_move", on_before_move)
+    comparison = compare(SCENARIOS[name], "object", RACES, workers=1, baseline=expected)
+    assert not comparison.equivalent
+    assert comparison.table().loc["Calcharo", "Differs"]
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from cubes import Carlotta, Denia
+from exact import ExactEvaluator, RankDistribution, StateLimitExceeded, evaluate
+from simulation import simulate_chunks
+from track import ThrusterPad, Track
+
+RACES = 40000
+
+
+def lineup() -> tuple[Track, list]:
+    return Track.create(length=8, custom_pads=[ThrusterPad(3)]), [Carlotta(), Denia()]
+
+
+def test_exact_ranks_agree_with_simulation():
+    track, cubes = lineup()
+    exact = evaluate(track, cubes, fallback_races=0)
+    assert exact.exact
+
+    chunks = simulate_chunks(track, cubes, RACES, workers=1, seed=0, progress=False)
+    simulated = RankDistribution.from_chunks(cubes, chunks)
+
+    # nb: every P(rank=k) within 4 standard errors of the simulated estimate
+    p = exact.probabilities()
+    error = np.sqrt(p * (1 - p) / RACES)
+    assert np.all(np.abs(simulated.probabilities() - p) <= 4 * error)
+
+
+def test_exact_gives_up_on_its_budgets():
+    track, cubes = lineup()
+
+    with pytest.raises(StateLimitExceeded):
+        ExactEvaluator(track, cubes, max_states=10).evaluate()
+    with pytest.raises(StateLimitExceeded):
+        ExactEvaluator(track, cubes, time_limit=0).evaluate()
+
+    # nb: the fallback simulates instead
+    assert not evaluate(track, cubes, time_limit=0, fallback_races=100, workers=1).exact
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from helpers import LENGTH, fixed, make_race
+from cubes import Cube
+from track import BlockerPad, SpatialRiftPad, ThrusterPad, Track
+
+
+def test_thruster_pad():
+    for fast_forward in (True, False):
+        cube = fixed(Cube(), 2)
+        race = make_race([cube], [ThrusterPad(2)], fast_forward=fast_forward)
+
+        race.start_turn()
+        assert cube.progress == 3
+
+
+def test_blocker_pad():
+    for fast_forward in (True, False):
+        cube = fixed(Cube(), 2)
+        race = make_race([cube], [BlockerPad(2)], fast_forward=fast_forward)
+
+        race.start_turn()
+        assert cube.progress == 1
+
+
+def test_pads_chain():
+    pads = [ThrusterPad(2), ThrusterPad(3), BlockerPad(5)]
+    assert Track.create(length=LENGTH, custom_pads=pads).landings[2] == (1, 1)
+
+    for fast_forward in (True, False):
+        cube = fixed(Cube(), 2)
+        race = make_race([cube], pads, fast_forward=fast_forward)
+
+        race.start_turn()
+        assert cube.progress == 4
+
+
+def test_replaced_pads_recompile_the_landings():
+    for fast_forward in (True, False):
+        cube = fixed(Cube(), 3)
+        race = make_race([cube], [ThrusterPad(3)], fast_forward=fast_forward)
+        race.track.pads[3] = BlockerPad(3)
+        race.reset()
+
+        race.start_turn()
+        assert cube.progress == 2
+
+
+def test_pads_carry_the_cubes_above():
+    bottom, top = fixed(Cube(), 2), fixed(Cube(), 0)
+    race = make_race([bottom, top], [ThrusterPad(2)])
+    race.cubes_order_next_turn = [bottom, top]
+
+    race.start_turn()
+    assert race.track.pads[3].cubes == [bottom, top]
+
+
+def test_looping_pads_have_no_landing():
+    track = Track.create(length=LENGTH, custom_pads=[ThrusterPad(2), BlockerPad(3)])
+    assert track.landings[2] is None
+    assert track.landings[3] is None
+
+
+def test_spatial_rift_pad():
+    orders = set()
+    for seed in range(20):
+        cubes = [fixed(Cube(2), 0), fixed(Cube(2), 0), fixed(Cube(), 2)]
+        race = make_race(cubes, [SpatialRiftPad(2)])
+        race.rng.seed(seed)
+        race.cubes_order_next_turn = cubes.copy()
+
+        race.start_turn()
+        stack = race.track.pads[2].cubes
+        assert sorted(map(id, stack)) == sorted(map(id, cubes))
+        orders.add(tuple(cubes.index(cube) for cube in stack))
+
+    # nb: landing reshuffles the whole stack, the landed cube included
+    assert len(orders) == 6
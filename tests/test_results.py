@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from checkpoint import Checkpoint
+from cubes import Abbowser, Cube, Jinhsi
+from results import ResultStore
+from simulation import aggregate, simulate_chunks, simulate_to_store
+from track import ThrusterPad, Track
+
+RACES = 30
+OPTIONS = {"seed": 3, "workers": 1, "chunk_size": 7, "progress": False}
+
+
+def lineup() -> tuple[Track, list]:
+    return Track.create(length=12, custom_pads=[ThrusterPad(3)]), [Abbowser(12), Jinhsi(), Cube()]
+
+
+def test_store_round_trips_the_simulated_chunks(tmp_path):
+    track, cubes = lineup()
+    store = ResultStore(simulate_to_store(str(tmp_path), track, cubes, RACES, **OPTIONS))
+
+    chunks = list(simulate_chunks(track, cubes, RACES, **OPTIONS))
+    expected = {column: np.concatenate([chunk[column] for chunk in chunks]) for column in chunks[0]}
+
+    assert len(store) == RACES
+    assert store.race_id.tolist() == list(range(RACES))
+    assert store.turns.tolist() == expected["turns"].tolist()
+    for j, name in enumerate(store.cubes):
+        assert store.rank(j).tolist() == expected["rank"][:, j].tolist()
+        assert store.progress(name).tolist() == expected["progress"][:, j].tolist()
+
+    # nb: Abbowser is not ranked
+    assert store.rank_history()["Abbowser"].size == 0
+    assert store.rank_history()["Jinhsi"].tolist() == expected["rank"][:, 1].tolist()
+
+
+def test_resumed_store_equals_an_uninterrupted_run(tmp_path):
+    track, cubes = lineup()
+    whole = ResultStore(simulate_to_store(str(tmp_path / "whole"), track, cubes, RACES, **OPTIONS))
+
+    path = str(tmp_path / "resumed")
+    simulate_to_store(path, track, cubes, 10, **OPTIONS)
+    # nb: the seed comes from the store
+    options = {key: value for key, value in OPTIONS.items() if key != "seed"}
+    resumed = ResultStore(simulate_to_store(path, track, cubes, RACES, resume=True, **options))
+
+    assert resumed.job == whole.job
+    assert resumed.race_id.tolist() == whole.race_id.tolist()
+    for j in range(len(cubes)):
+        assert resumed.rank(j).tolist() == whole.rank(j).tolist()
+
+    with pytest.raises(ValueError, match="different job"):
+        simulate_to_store(path, track, cubes, RACES, resume=True, **{**OPTIONS, "seed": 4})
+
+
+def test_resumed_checkpoint_equals_an_uninterrupted_run(tmp_path):
+    track, cubes = lineup()
+    whole = aggregate(track, cubes, RACES, **OPTIONS)
+
+    path = str(tmp_path / "checkpoint.json")
+    partial = aggregate(track, cubes, 10, checkpoint=path, **OPTIONS)
+    assert Checkpoint.read(path)["progress"]["aggregator"] == partial.to_dict()
+
+    options = {key: value for key, value in OPTIONS.items() if key != "seed"}
+    resumed = aggregate(track, cubes, RACES, checkpoint=path, **options)
+    assert resumed.to_dict() == whole.to_dict()
+
+    with pytest.raises(ValueError, match="different job"):
+        aggregate(track, cubes, RACES, checkpoint=path, **{**OPTIONS, "seed": 4})
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import pytest
+
+from cubes import Cube, Jinhsi
+from shards import Partial, merge, run_shard, shard_range, verify
+from simulation import aggregate
+from track import ThrusterPad, Track
+
+RACES = 40
+OPTIONS = {"seed": 5, "workers": 1, "chunk_size": 6, "progress": False}
+
+
+def lineup() -> tuple[Track, list]:
+    return Track.create(length=12, custom_pads=[ThrusterPad(3)]), [Jinhsi(), Cube(), Cube()]
+
+
+def test_shard_ranges_cover_the_job_on_chunk_boundaries():
+    ranges = [shard_range(RACES, shard, 3, chunk_size=6) for shard in range(3)]
+    assert ranges == [(0, 12), (12, 24), (24, 40)]
+
+    with pytest.raises(ValueError):
+        shard_range(RACES, 3, 3)
+
+
+def test_merged_shards_equal_the_whole_job(tmp_path):
+    track, cubes = lineup()
+    partials = []
+    for shard in range(3):
+        path = str(tmp_path / f"shard-{shard}.json")
+        run_shard(track, cubes, RACES, shard, 3, **OPTIONS).save(path)
+        partials.append(Partial.load(path))
+
+    # nb: in any order
+    merged = merge(partials[::-1])
+    assert merged.complete
+    assert sum(merged.turns.values()) == RACES
+    assert merged.aggregator.to_dict() == aggregate(track, cubes, RACES, **OPTIONS).to_dict()
+    assert verify(merged, workers=1, progress=False)
+
+    # nb: a contiguous subset merges into the races it covers
+    assert not merge(partials[:2]).complete
+    with pytest.raises(ValueError, match="leave a gap"):
+        merge([partials[0], partials[2]])
+    with pytest.raises(ValueError, match="overlap"):
+        merge([partials[0], partials[0]])
+    with pytest.raises(ValueError, match="different jobs"):
+        merge([partials[0], run_shard(track, cubes, RACES, 1, 3, **{**OPTIONS, "seed": 6})])
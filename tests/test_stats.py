@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from cubes import Cube
+from stats import RankAggregator
+
+
+def test_update_keeps_cubes_of_one_class_apart():
+    lineup = [Cube(), Cube(), Cube()]
+    aggregator = RankAggregator.from_cubes(lineup)
+
+    aggregator.update([lineup[2], lineup[0], lineup[1]], lineup)
+    aggregator.update([lineup[2], lineup[1], lineup[0]], lineup)
+
+    assert aggregator.count == 2
+    assert aggregator.counts.tolist() == [[0, 1, 1], [0, 1, 1], [2, 0, 0]]
+    assert aggregator.rank_sum.tolist() == [5, 5, 2]
+
+    # nb: the same races in the layout of simulation chunks
+    batch = RankAggregator.from_cubes(lineup)
+    batch.update_ranks(np.array([[2, 3, 1], [3, 2, 1]]))
+    assert batch.to_dict() == aggregator.to_dict()
+
+
+def test_merge_equals_one_aggregator_over_all_races():
+    lineup = [Cube(), Cube(), Cube()]
+    ranks = np.array([[1, 2, 3], [3, 1, 2], [2, 3, 1], [1, 3, 2]])
+
+    whole = RankAggregator.from_cubes(lineup)
+    whole.update_ranks(ranks)
+
+    first, second = RankAggregator.from_cubes(lineup), RankAggregator.from_cubes(lineup)
+    first.update_ranks(ranks[:1])
+    second.update_ranks(ranks[1:])
+    assert first.merge(second).to_dict() == whole.to_dict()
+
+    with pytest.raises(ValueError):
+        whole.merge(RankAggregator.from_cubes(lineup[:2]))
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import pytest
+
+from cubes import Abbowser, Cube, Jinhsi
+from simulation import simulate_to_store
+from track import ThrusterPad, Track
+from traces import TraceReader, TraceWriter
+
+RACES = 30
+
+
+def traced(tmp_path) -> TraceReader:
+    track = Track.create(length=12, custom_pads=[ThrusterPad(3)])
+    cubes = [Abbowser(12), Jinhsi(), Cube()]
+    simulate_to_store(
+        str(tmp_path / "store"),
+        track,
+        cubes,
+        RACES,
+        trace_path=str(tmp_path / "trace"),
+        seed=3,
+        workers=1,
+        chunk_size=7,
+        progress=False,
+    )
+    return TraceReader(str(tmp_path / "trace"))
+
+
+def test_replay_matches_the_recorded_turns(tmp_path):
+    reader = traced(tmp_path)
+    assert len(reader) == RACES
+
+    for race_id in range(RACES):
+        turns = reader.turns(race_id)
+        recorded = reader.recorded(race_id)
+
+        # nb: the first board is the start of the race
+        assert len(turns) == len(recorded) + 1
+        for (board, _), (order, rolls) in zip(turns[1:], recorded):
+            assert (board.order_this, board.base_roll) == (order, rolls)
+
+    assert reader.format(RACES - 1).startswith("Turn 0")
+    with pytest.raises(KeyError):
+        reader.events(RACES)
+
+
+def test_changed_simulator_is_caught_at_the_turn_it_diverges(tmp_path, monkeypatch):
+    reader = traced(tmp_path)
+    recorded = reader.recorded(0)
+
+    def roll(self, race):
+        self.base_roll = self.steps = 1
+
+    monkeypatch.setattr(Cube, "roll", roll)
+    reader = TraceReader(str(tmp_path / "trace"))
+
+    # nb: the recorded turns do not need the replay
+    assert reader.recorded(0) == recorded
+    with pytest.raises(ValueError, match="from turn 1"):
+        reader.events(0)
+
+
+def test_resumed_trace_drops_races_past_the_store(tmp_path):
+    reader = traced(tmp_path)
+    kept = [reader.recorded(race_id) for race_id in range(10)]
+
+    with TraceWriter(reader.path, reader.job, resume=True) as writer:
+        writer.truncate(10)
+
+    reader = TraceReader(reader.path)
+    assert len(reader) == 10
+    assert reader.num_turns == sum(map(len, kept))
+    assert [reader.recorded(race_id) for race_id in range(10)] == kept
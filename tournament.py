@@ -0,0 +1,264 @@
+from __future__ import annotations
+from typing import Callable, Sequence
+import json
+import os
+
+import numpy as np
+
+from checkpoint import describe
+from race import Race
+from simulation import simulate_chunks
+from stats import RankAggregator
+from sweep import CACHE_DIR, Config, canonical_order, config_key
+
+Standings = dict[str, int]
+
+
+class Stage:
+    """
+    A race of a tournament.
+
+    Attributes:
+        setup: The race's `(track, cubes, laps)`, or a function of the standings so
+            far (points per cube class name) giving it, e.g. for the lineup of a final
+            or for staggered starts.
+        points: Points per finishing rank (index 0 for the winner). Defaults to the
+            number of ranked cubes beaten.
+        cache: Whether to sample the race from its cached distribution of finishing
+            orders instead of simulating it per tournament. By default, every setup is
+            cached except those given by a function with staggered offsets, which
+            can differ in every tournament.
+    """
+
+    def __init__(
+        self,
+        setup: Config | Callable[[Standings], Config],
+        points: Sequence[int] | None = None,
+        cache: bool | None = None,
+    ):
+        self.setup = setup
+        self.points = points
+        self.cache = cache
+
+    def config(self, standings: Standings) -> Config:
+        """
+        The setup of the race given the standings, with the cubes in a canonical
+        order: races shuffle the lineup anyway, so two lineups of the same cubes share
+        a cached distribution whichever order they are listed in.
+        """
+        track, cubes, laps = self.setup(standings) if callable(self.setup) else self.setup
+        return track, [cubes[j] for j in canonical_order(track, cubes)], laps
+
+    def cached(self, config: Config) -> bool:
+        if self.cache is not None:
+            return self.cache
+        if not callable(self.setup):
+            return True
+
+        _, cubes, _ = config
+        return len({cube.offset for cube in cubes if cube.rankable}) <= 1
+
+    def score(self, num_ranked: int) -> np.ndarray:
+        points = self.points if self.points is not None else range(num_ranked - 1, -1, -1)
+        return np.asarray(list(points)[:num_ranked], dtype=np.int64)
+
+
+class OrderDistribution:
+    """
+    Observed finishing orders of a setup (lineup indices of the ranked cubes, winner
+    first) with the number of races that ended in each, to sample races from.
+    """
+
+    def __init__(self, cubes: list[str], orders: np.ndarray, counts: np.ndarray):
+        self.cubes = cubes
+        self.orders = orders
+        self.counts = counts
+        self._p = counts / counts.sum()
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """(size, ranked cubes) finishing orders drawn from the distribution"""
+        return self.orders[rng.choice(len(self.orders), size=size, p=self._p)]
+
+    def to_dict(self) -> dict:
+        return {"cubes": self.cubes, "orders": self.orders.tolist(), "counts": self.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> OrderDistribution:
+        return cls(
+            data["cubes"],
+            np.asarray(data["orders"], dtype=np.int64).reshape(len(data["counts"]), -1),
+            np.asarray(data["counts"], dtype=np.int64),
+        )
+
+
+def order_distribution(
+    config: Config,
+    num_simulation: int,
+    seed: int = 0,
+    cache_dir: str | None = CACHE_DIR,
+    **kwargs,
+) -> OrderDistribution:
+    """
+    Distribution of finishing orders of `num_simulation` races of a config, cached in
+    `cache_dir` under the config's `sweep.config_key` like sweep results. Takes the
+    same options as `simulate_chunks`.
+    """
+    track, cubes, laps = config
+    engine = kwargs.get("engine", "object")
+    chunk_size = kwargs.get("chunk_size", 1000)
+
+    path = None
+    if cache_dir is not None:
+        key = config_key(track, cubes, laps, num_simulation, seed, engine, chunk_size)
+        path = os.path.join(cache_dir, f"{key}.orders.json")
+        if os.path.exists(path):
+            with open(path) as fp:
+                return OrderDistribution.from_dict(json.load(fp)["result"])
+
+    kwargs.setdefault("progress", False)
+    counts: dict[tuple[int, ...], int] = {}
+
+    for chunk in simulate_chunks(track, cubes, num_simulation, laps, seed=seed, **kwargs):
+        rank = chunk["rank"].astype(np.int64)
+
+        # nb: unrankable cubes (rank 0) sort last and are cut off
+        rank[rank == 0] = len(cubes) + 1
+        orders = np.argsort(rank, axis=1, kind="stable")[:, : sum(c.rankable for c in cubes)]
+
+        for order, n in zip(*np.unique(orders, axis=0, return_counts=True)):
+            key = tuple(order.tolist())
+            counts[key] = counts.get(key, 0) + int(n)
+
+    orders = sorted(counts)
+    distribution = OrderDistribution(
+        [cube.__class__.__name__ for cube in cubes],
+        np.asarray(orders, dtype=np.int64),
+        np.asarray([counts[order] for order in orders], dtype=np.int64),
+    )
+
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump({"config": describe(track, cubes, laps), "result": distribution.to_dict()}, fp)
+        os.replace(tmp, path)
+    return distribution
+
+
+class Tournament:
+    """
+    Monte Carlo estimate of a multi-race tournament whose standings (points summed
+    over stages) carry over from race to race.
+
+    Each tournament draws its races from the cached finishing-order distribution of
+    the stage's setup (simulated once per distinct setup, see `order_distribution`),
+    so a thousand tournaments cost a few array draws rather than a thousand races
+    per stage. Stages that are not cached (see `Stage.cached`) run one `Race` per
+    tournament instead.
+    """
+
+    def __init__(
+        self,
+        stages: list[Stage],
+        num_simulation: int = 100000,
+        seed: int = 0,
+        cache_dir: str | None = CACHE_DIR,
+        **kwargs,
+    ):
+        self.stages = stages
+        self.num_simulation = num_simulation
+        self.seed = seed
+        self.cache_dir = cache_dir
+        self.kwargs = kwargs
+        self._distributions: dict[str, OrderDistribution] = {}
+
+    def _distribution(self, config: Config, key: str) -> OrderDistribution:
+        if key not in self._distributions:
+            self._distributions[key] = order_distribution(
+                config, self.num_simulation, self.seed, self.cache_dir, **self.kwargs
+            )
+        return self._distributions[key]
+
+    def run(self, num_tournaments: int, seed: int | None = None) -> RankAggregator:
+        """
+        Simulate `num_tournaments` tournaments and aggregate the cubes' final
+        standings: rank 1 is the champion. Ties on points go to the cube that scored
+        more in the last stage, then the one before, and so on.
+        """
+        rng = np.random.default_rng(seed)
+        race_seed = int(rng.integers(2**32))
+
+        names: list[str] = []
+        scores = []  # per stage, (tournaments, cubes) points
+
+        for s, stage in enumerate(self.stages):
+            stage_points = np.zeros((num_tournaments, len(names)), dtype=np.int64)
+            totals = sum(scores) if scores else stage_points
+
+            # nb: tournaments with the same setup are drawn together
+            groups: dict[str, tuple[Config, list[int]]] = {}
+            for t in range(num_tournaments if callable(stage.setup) else 1):
+                standings = {name: int(totals[t, j]) for j, name in enumerate(names)}
+                config = stage.config(standings)
+                key = json.dumps(describe(*config), sort_keys=True)
+                groups.setdefault(key, (config, []))[1].append(t)
+
+            if not callable(stage.setup):
+                (config, _), = groups.values()
+                groups = {key: (config, list(range(num_tournaments)))}
+
+            for key, (config, tournaments) in groups.items():
+                _, cubes, _ = config
+                for cube in cubes:
+                    if cube.rankable and cube.__class__.__name__ not in names:
+                        names.append(cube.__class__.__name__)
+                        scores = [np.pad(a, ((0, 0), (0, 1))) for a in scores]
+                        stage_points = np.pad(stage_points, ((0, 0), (0, 1)))
+
+                # nb: unrankable cubes never appear in a finishing order
+                columns = np.asarray(
+                    [names.index(c.__class__.__name__) if c.rankable else -1 for c in cubes],
+                    dtype=np.int64,
+                )
+                rows = np.asarray(tournaments, dtype=np.int64)
+
+                if stage.cached(config):
+                    orders = self._distribution(config, key).sample(rng, len(rows))
+                else:
+                    orders = self._race(config, s, rows, race_seed)
+
+                points = stage.score(orders.shape[1])
+                stage_points[rows[:, None], columns[orders]] = points
+
+            scores.append(stage_points)
+
+        return self._standings(names, scores)
+
+    def _race(self, config: Config, stage: int, tournaments: np.ndarray, seed: int) -> np.ndarray:
+        """Finishing orders of one directly simulated race per tournament"""
+        track, cubes, laps = config
+        race = Race(track, cubes, laps)
+        index = {cube: j for j, cube in enumerate(race.lineup)}
+
+        orders = []
+        for t in tournaments.tolist():
+            race.rng.seed(seed, stage, t)
+            race.cubes[:] = race.lineup
+            race.rng.shuffle(race.cubes)
+            race.start()
+            orders.append([index[cube] for cube in race.compute_rankings()])
+        return np.asarray(orders, dtype=np.int64)
+
+    @staticmethod
+    def _standings(names: list[str], scores: list[np.ndarray]) -> RankAggregator:
+        total = sum(scores)
+
+        # nb: lexsort sorts on its last key first, so the tie-breaks go before it,
+        #     earliest stage first
+        ranked = np.lexsort([-stage for stage in scores] + [-total], axis=-1)
+        ranking = np.empty_like(total)
+        np.put_along_axis(ranking, ranked, np.arange(1, len(names) + 1)[None, :], axis=1)
+
+        aggregator = RankAggregator(list(names))
+        aggregator.update_ranks(ranking)
+        return aggregator
@@ -0,0 +1,376 @@
+from __future__ import annotations
+import itertools
+import json
+import os
+
+import numpy as np
+
+from checkpoint import build
+from cubes import Cube
+from race import Race, RaceState
+from rng import RaceRNG
+from stats import RaceStats
+from track import Pad
+
+# nb: A trace keeps each race's id, the turns it took, the number of random draws
+#     it made, and the move order and rolls of every turn it played. Every race is
+#     seeded from the job's seed and its index, so the reader rebuilds the rest of
+#     a race (its events and boards) by running that one race again, which only
+#     works while the simulator is unchanged; the recorded turns check the replay
+#     and stay readable when it no longer matches.
+COLUMNS = {
+    "race_id": np.dtype("<i8"),
+    "turns": np.dtype("<u4"),
+    "draws": np.dtype("<u4"),
+    "first_turn": np.dtype("<u8"),
+}
+# nb: one row per turn played, races in order, of one value per cube of the lineup
+TURN_COLUMNS = {
+    "order": np.dtype("u1"),
+    "roll": np.dtype("i1"),
+}
+KINDS = ("turn", "move", "land", "hook")
+
+META_FILE = "meta.json"
+
+
+class TraceEvent:
+    """
+    One event of a replayed race.
+
+    Attributes:
+        kind: One of `KINDS`.
+        cube: Lineup index of the cube involved, or None for a pad's own hook.
+        hook: Name of the hook (hook events only).
+        position: Pad index for landings and pad hooks, the cube's progress before a
+            move or after a cube hook.
+        value: Steps of a move, or the cube's steps after a cube hook.
+        state: Board at the end of the turn (turn events only).
+    """
+
+    __slots__ = ("kind", "cube", "hook", "position", "value", "state")
+
+    def __init__(
+        self,
+        kind: str,
+        cube: int | None,
+        hook: str | None,
+        position: int,
+        value: int,
+        state: RaceState | None = None,
+    ):
+        self.kind = kind
+        self.cube = cube
+        self.hook = hook
+        self.position = position
+        self.value = value
+        self.state = state
+
+    def __repr__(self):
+        return (
+            f"TraceEvent({self.kind!r}, cube={self.cube}, hook={self.hook!r}, "
+            f"position={self.position}, value={self.value})"
+        )
+
+
+# --- Replaying --- #
+
+
+class EventRecorder(RaceStats):
+    """
+    `RaceStats` that records the events of the races it sees: the board after every
+    turn (rolls, move orders and skill state included), every move, every landing
+    on a pad with an effect and every skill and pad hook call. `TraceReader` attaches
+    one to replay a race; unlike `RaceStats`, it does not time hooks.
+
+    Attributes:
+        events: Events of the last race started, in order.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.events: list[TraceEvent] = []
+        self._index: dict[Cube, int] = {}
+
+    def start(self, race: Race):
+        self._index = {cube: j for j, cube in enumerate(race.lineup)}
+        self.events = []
+        self.end_turn(race)
+
+    def end_turn(self, race: Race):
+        self.events.append(TraceEvent("turn", None, None, 0, 0, race.snapshot()))
+
+    def move(self, cube: Cube, steps: int):
+        super().move(cube, steps)
+        self.events.append(TraceEvent("move", self._index[cube], None, cube.progress, steps))
+
+    def land(self, pad: Pad, cube: Cube):
+        super().land(pad, cube)
+        self.events.append(TraceEvent("land", self._index[cube], None, pad.id, 0))
+
+    def call(self, obj: Cube | Pad, hook: str, *args):
+        # nb: the event goes in before the call so the moves a skill makes follow it,
+        #     and is filled in after, with the hook's effect
+        event = TraceEvent("hook", self._index.get(obj), hook, 0, 0)
+        self.events.append(event)
+        result = getattr(obj, hook)(*args)
+
+        if isinstance(obj, Cube):
+            event.position, event.value = obj.progress, obj.steps
+        else:
+            event.position = obj.id
+        return result
+
+
+# --- Trace Files --- #
+
+
+class TraceWriter:
+    """
+    Write the races of a job to a trace directory, one simulation chunk at a time
+    (see `simulate_chunks(trace=True)`): the `COLUMNS` per race, the `TURN_COLUMNS`
+    per turn, and the job (`checkpoint.job_spec`) in `meta.json`.
+
+    With `resume=True`, an existing trace of the same job is appended to (see
+    `truncate` to line it up with a result store).
+    """
+
+    def __init__(self, path: str, job: dict, resume: bool = False):
+        self.path = path
+        self.job = job
+        self.num_races = 0
+        self.num_turns = 0
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE)
+
+        if resume and os.path.exists(meta_path):
+            with open(meta_path) as fp:
+                meta = json.load(fp)
+            if meta["job"] != job:
+                raise ValueError(f"Trace {path} is for a different job")
+            self.num_races = meta["num_races"]
+            self.num_turns = meta["num_turns"]
+
+        mode = "ab" if resume else "wb"
+        self._columns = {
+            column: open(os.path.join(path, f"{column}.bin"), mode)
+            for column in {**COLUMNS, **TURN_COLUMNS}
+        }
+        self.truncate(self.num_races)
+
+    def __enter__(self) -> TraceWriter:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, chunk: dict[str, np.ndarray]):
+        """Append the races of a chunk"""
+        # nb: the chunk numbers its turn rows from 0
+        chunk = {**chunk, "first_turn": chunk["first_turn"] + self.num_turns}
+
+        for column, dtype in {**COLUMNS, **TURN_COLUMNS}.items():
+            fp = self._columns[column]
+            fp.write(chunk[column].astype(dtype).tobytes())
+            fp.flush()
+
+        # nb: as in ResultWriter, meta goes last so readers only see complete races
+        self.num_races += len(chunk["race_id"])
+        self.num_turns += len(chunk["order"])
+        self._write_meta()
+
+    def truncate(self, num_races: int):
+        """Drop every race after the first `num_races` (and anything half-written)"""
+        if num_races > self.num_races:
+            raise ValueError(f"Trace {self.path} only has {self.num_races} races")
+
+        if num_races < self.num_races:
+            dtype = COLUMNS["first_turn"]
+            path = os.path.join(self.path, "first_turn.bin")
+            first = np.fromfile(path, dtype=dtype, count=1, offset=num_races * dtype.itemsize)
+            self.num_turns = int(first[0])
+
+        self.num_races = num_races
+        for column, dtype in COLUMNS.items():
+            self._columns[column].truncate(num_races * dtype.itemsize)
+
+        row = len(self.job["config"]["cubes"])
+        for column, dtype in TURN_COLUMNS.items():
+            self._columns[column].truncate(self.num_turns * row * dtype.itemsize)
+        self._write_meta()
+
+    def close(self):
+        for fp in self._columns.values():
+            fp.close()
+
+    def _write_meta(self):
+        meta = {"num_races": self.num_races, "num_turns": self.num_turns, "job": self.job}
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w") as fp:
+            json.dump(meta, fp, indent=2)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+
+class TraceReader:
+    """
+    Random access to the races of a trace directory written by `TraceWriter`. The
+    move order and rolls of every turn are read from the trace (`recorded`). A
+    race's events and boards are rebuilt by replaying that race alone, from the
+    job's seed and the race's index, on the object engine, which needs the
+    simulator the trace was written with: a replay that differs from the recorded
+    turns raises ValueError.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(os.path.join(path, META_FILE)) as fp:
+            meta = json.load(fp)
+
+        self.num_races: int = meta["num_races"]
+        self.num_turns: int = meta["num_turns"]
+        self.job: dict = meta["job"]
+
+        track, cubes, laps = build(self.job["config"])
+        self.length: int = track.length
+        self.cubes: list[str] = [cube.__class__.__name__ for cube in cubes]
+
+        state = self.job.get("state")
+        self._state = RaceState.from_key(state) if state is not None else None
+        self._recorder = EventRecorder()
+        self._race = Race(track, cubes, laps, rng=RaceRNG(), stats=self._recorder)
+        self._replayed: tuple[int, list[TraceEvent]] | None = None
+
+    def __len__(self) -> int:
+        return self.num_races
+
+    def _memmap(self, column: str) -> np.ndarray:
+        if column in COLUMNS:
+            dtype, shape = COLUMNS[column], (self.num_races,)
+        else:
+            dtype, shape = TURN_COLUMNS[column], (self.num_turns, len(self.cubes))
+
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(
+            os.path.join(self.path, f"{column}.bin"), dtype=dtype, mode="r", shape=shape
+        )
+
+    @property
+    def race_id(self) -> np.ndarray:
+        return self._memmap("race_id")
+
+    def _find(self, race_id: int) -> int:
+        # nb: chunks are written in race order, so the index is sorted by race id
+        i = int(np.searchsorted(self.race_id, race_id))
+        if i == self.num_races or self.race_id[i] != race_id:
+            raise KeyError(f"Race {race_id} is not in the trace")
+        return i
+
+    def recorded(self, race_id: int) -> list[tuple[tuple[int, ...], tuple[int, ...]]]:
+        """
+        The move order (lineup indices) and every cube's roll (in lineup order) of
+        each turn a race played, as recorded; unlike the rest of a race, these are
+        read without replaying it
+        """
+        i = self._find(race_id)
+        first = self._memmap("first_turn")
+        start = int(first[i])
+        stop = int(first[i + 1]) if i + 1 < self.num_races else self.num_turns
+
+        orders = self._memmap("order")[start:stop].tolist()
+        rolls = self._memmap("roll")[start:stop].tolist()
+        return [(tuple(order), tuple(roll)) for order, roll in zip(orders, rolls)]
+
+    def events(self, race_id: int) -> list[TraceEvent]:
+        """Every event of a race in order"""
+        if self._replayed is not None and self._replayed[0] == race_id:
+            return self._replayed[1]
+
+        i = self._find(race_id)
+        race = self._race
+        race.run_seeded(self.job["seed"], race_id, self._state)
+
+        # nb: the first board is the race's start, not a turn it played
+        boards = [event.state for event in self._recorder.events if event.kind == "turn"]
+        for board, turn in itertools.zip_longest(boards[1:], self.recorded(race_id)):
+            replayed = (board.order_this, board.base_roll) if board is not None else None
+            if replayed != turn:
+                at = board.turn if board is not None else race.turn + 1
+                raise ValueError(
+                    f"Race {race_id} replays differently than it was simulated from turn "
+                    f"{at} (move order and rolls {replayed}, traced {turn}); the "
+                    f"simulator has changed since the trace was written"
+                )
+
+        expected = (int(self._memmap("turns")[i]), int(self._memmap("draws")[i]))
+        if (race.turn, race.rng.drawn) != expected:
+            raise ValueError(
+                f"Race {race_id} replays differently than it was simulated (turns and "
+                f"draws {(race.turn, race.rng.drawn)}, traced {expected}); the "
+                f"simulator has changed since the trace was written"
+            )
+
+        self._replayed = (race_id, self._recorder.events)
+        return self._recorder.events
+
+    def turns(self, race_id: int) -> list[tuple[RaceState, list[TraceEvent]]]:
+        """
+        The board at the end of every turn of a race (turn 0 being its start), each
+        with the events of that turn
+        """
+        turns = []
+        pending: list[TraceEvent] = []
+
+        # nb: a turn's board is recorded once it is over, after the turn's events
+        for event in self.events(race_id):
+            if event.kind == "turn":
+                turns.append((event.state, pending))
+                pending = []
+            else:
+                pending.append(event)
+
+        return turns
+
+    def board(self, race_id: int, turn: int) -> RaceState:
+        """The board of a race at the end of `turn`"""
+        for event in self.events(race_id):
+            if event.kind == "turn" and event.state.turn == turn:
+                return event.state
+        raise KeyError(f"Race {race_id} has no turn {turn}")
+
+    def restore(self, race: Race, race_id: int, turn: int):
+        """Put `race` (over the traced lineup) into the board of a race at the end of `turn`"""
+        race.restore(self.board(race_id, turn))
+
+    def format(self, race_id: int) -> str:
+        """Human-readable log of a race"""
+        names = self.cubes
+        lines = []
+
+        for state, events in self.turns(race_id):
+            order = ", ".join(names[j] for j in state.order_this)
+            rolls = ", ".join(f"{names[j]} {state.base_roll[j]}" for j in state.order_this)
+            lines.append(f"Turn {state.turn}  order: {order}  rolls: {rolls}")
+
+            for event in events:
+                lines.append("    " + self._describe(event))
+
+            board = " | ".join(
+                f"{p}: " + " ".join(names[j] for j in stack) for p, stack in state.stacks
+            )
+            lines.append(f"    board: {board}")
+
+        return "\n".join(lines)
+
+    def _describe(self, event: TraceEvent) -> str:
+        cube = self.cubes[event.cube] if event.cube is not None else None
+
+        if event.kind == "move":
+            return f"{cube} moves {event.value} from {event.position}"
+        if event.kind == "land":
+            return f"{cube} lands on pad {event.position}"
+        if cube is None:
+            return f"pad {event.position} {event.hook}"
+        return f"{cube} {event.hook} at {event.position} (steps {event.value})"
@@ -1,6 +1,5 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
-import random
 
 if TYPE_CHECKING:
     from cubes import Cube
@@ -62,15 +61,49 @@ class SpatialRiftPad(Pad):
     """
 
     def on_land(self, cube: Cube, race: Race):
-        random.shuffle(self.cubes)
+        race.rng.shuffle(self.cubes)
+        race.reindex_pad(self.id)
 
 
 # --- Track --- #
 
 
+# nb: pads whose on_land just moves the cube one pad on, which the landing table
+#     can follow without calling them
+CHAIN_MOVES = {ThrusterPad.on_land: 1, BlockerPad.on_land: -1}
+
+
 class Track:
     def __init__(self, pads: list[Pad]):
         self.pads: list[Pad] = pads
+        self.compile()
+
+    def compile(self):
+        """
+        Precompute `landings`: for each pad, the one-pad moves a cube landing there
+        makes through chained Thruster/Blocker pads before it settles, or None if
+        the chain loops. Call again after replacing pads.
+        """
+        self.landings: list[tuple[int, ...] | None] = [
+            self._landing(p) for p in range(self.length)
+        ]
+
+    def _landing(self, p: int) -> tuple[int, ...] | None:
+        moves = []
+        visited = {p}
+
+        while "on_land" not in vars(self.pads[p]):
+            move = CHAIN_MOVES.get(type(self.pads[p]).on_land)
+            if move is None:
+                break
+
+            moves.append(move)
+            p = (p + move) % self.length
+            if p in visited:
+                return None
+            visited.add(p)
+
+        return tuple(moves)
 
     @classmethod
     def create(cls, length: int, custom_pads: list[Pad] | None = None) -> Track: